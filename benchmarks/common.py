@@ -0,0 +1,72 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import json
+import os
+import pathlib
+import platform
+import sqlite3
+import subprocess
+import sys
+
+REPO_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+
+def use_home(home):
+    """
+    Point ziton at a throwaway home directory. Has to run before ziton is
+    imported, the configuration path is resolved from $HOME on import.
+    """
+    os.environ["HOME"] = str(home)
+    if str(REPO_DIR) not in sys.path:
+        sys.path.insert(0, str(REPO_DIR))
+
+
+def write_config(home, directories, **options):
+    "Write a configuration file for the benchmark, returns the database path."
+    import toml
+
+    ziton_dir = pathlib.Path(home).joinpath(".ziton")
+    ziton_dir.mkdir(parents=True, exist_ok=True)
+    config = {
+        "included_directories": [str(d) for d in directories],
+        "index_on_startup": False,
+        "live_updates": False,
+        "hidden_files": True,
+        "database_path": str(ziton_dir.joinpath("database.db")),
+        "excluded": [],
+        **options,
+    }
+    with open(ziton_dir.joinpath("config.toml"), "w") as outfile:
+        toml.dump(config, outfile)
+    return config["database_path"]
+
+
+def environment():
+    "Describe the code and machine the results were measured on."
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(results, output=None):
+    "Print the results as JSON and optionally save them to a file."
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as outfile:
+            outfile.write(text)
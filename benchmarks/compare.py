@@ -0,0 +1,70 @@
+"""
+Compare two benchmark result files.
+
+Prints the relative change of every numeric result between a baseline and a
+new run. Timings (`seconds`, `_ms`), sizes (`bytes`, `_kb`) and rates
+(`per_s`) are compared in the direction that counts as a regression for them.
+
+usage: python benchmarks/compare.py BASELINE NEW [--threshold PERCENT]
+"""
+import argparse
+import json
+import sys
+
+# lower is better for these keys, higher is better for rates
+LOWER_IS_BETTER = ("seconds", "_ms", "bytes", "_kb")
+HIGHER_IS_BETTER = ("per_s",)
+
+
+def flatten(results, prefix=""):
+    "Flatten nested results into {'a.b.c': value} for numeric leaves."
+    values = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def regression(name, change):
+    "Check if a relative change makes the metric worse."
+    if name.endswith(HIGHER_IS_BETTER):
+        return -change
+    if name.endswith(LOWER_IS_BETTER) or "seconds" in name:
+        return change
+    return 0.0
+
+
+def main():
+    "comparison entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="fail if a metric got worse by more than this many percent",
+    )
+    args = parser.parse_args()
+    with open(args.baseline) as infile:
+        baseline = flatten(json.load(infile)["results"])
+    with open(args.new) as infile:
+        new = flatten(json.load(infile)["results"])
+
+    regressions = 0
+    for name in sorted(baseline.keys() & new.keys()):
+        old_value, new_value = baseline[name], new[name]
+        change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+        marker = ""
+        if regression(name, change) > args.threshold:
+            marker = "  <-- regression"
+            regressions += 1
+        print(f"{name:60} {old_value:14.3f} {new_value:14.3f} {change:+8.1f}%{marker}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Import-time benchmark.
+
+Runs `python -X importtime` on the given modules in a fresh interpreter and
+reports the total import time together with the most expensive imports as
+JSON. With --budget the script fails when the total exceeds the budget, so it
+can guard against startup regressions.
+
+usage: python benchmarks/importtime.py [--module NAME ...] [--top N]
+                                       [--budget MS] [--output FILE]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+from common import REPO_DIR, environment, write_results
+
+DEFAULT_MODULES = ("ziton.app", "ziton.cli")
+
+
+def import_times(module):
+    """
+    Import the module in a new interpreter and parse the importtime report
+    into a list of (name, self_us, cumulative_us) tuples.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def report(module, top, repeat):
+    "Summarize the import cost of a module over several runs."
+    runs = [import_times(module) for _ in range(repeat)]
+    totals = [next(e[2] for e in run if e[0] == module) for run in runs]
+    # the fastest run has the least noise from the rest of the system
+    best = runs[totals.index(min(totals))]
+    slowest = sorted(best, key=lambda e: e[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": min(totals) / 1000,
+        "median_ms": statistics.median(totals) / 1000,
+        "modules_imported": len(best),
+        "slowest": [
+            {"name": name, "self_ms": self_us / 1000, "cumulative_ms": cum_us / 1000}
+            for name, self_us, cum_us in slowest
+        ],
+    }
+
+
+def main():
+    "benchmark entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", action="append", dest="modules")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, help="fail above this many ms")
+    parser.add_argument("--output", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "importtime",
+        "environment": environment(),
+        "results": [
+            report(module, args.top, args.repeat)
+            for module in args.modules or DEFAULT_MODULES
+        ],
+    }
+    write_results(results, args.output)
+    if args.budget is not None:
+        over = [r for r in results["results"] if r["total_ms"] > args.budget]
+        for result in over:
+            print(
+                f"{result['module']}: {result['total_ms']:.1f}ms exceeds "
+                f"budget of {args.budget:.1f}ms",
+                file=sys.stderr,
+            )
+        sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Startup-time benchmark.
+
+Creates a throwaway home directory holding a synthetic shard and measures,
+in a fresh interpreter per run, how long it takes until the main window is
+painted and populated. Results are printed as JSON.
+
+usage: python benchmarks/startup.py [--entries N] [--repeat N] [--output FILE]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_DIR, environment, use_home, write_config, write_results
+
+
+def fill_database(root, entries):
+    """
+    Populate the shard of an included directory with synthetic rows without
+    touching the disk, in the state a rebuild leaves it in.
+    """
+    from ziton import database as db
+
+    db.validate_database()
+    shard = db.shard_path(root)
+    conn = sqlite3.connect(shard)
+    cursor = conn.cursor()
+    db.create_shard_schema(cursor)
+    rows = (
+        (
+            f"file{i}.txt",
+            f"{root}/dir{i // 100}/file{i}.txt",
+            i,
+            0,
+            db.normalize_name(f"file{i}.txt"),
+            "txt",
+            0,
+        )
+        for i in range(entries)
+    )
+    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    # clears the changelog of the inserts, like a rebuild
+    db.write_snapshot(conn, shard)
+    conn.close()
+
+
+def measure():
+    "Runs inside the child interpreter, prints the phase timings as JSON."
+    timings = {}
+    start = time.perf_counter()
+    from PySide2.QtCore import QCoreApplication
+    from PySide2.QtWidgets import QApplication
+
+    from ziton import config as cfg
+    from ziton import database as db
+    from ziton.app import Mainwindow
+
+    timings["import"] = time.perf_counter() - start
+    cfg.validate_config_file()
+    rebuild = db.validate_database()
+    timings["validate"] = time.perf_counter() - start
+    app = QApplication(sys.argv)
+    widget = Mainwindow(rebuild)
+    widget.show()
+    QCoreApplication.processEvents()
+    timings["first_frame"] = time.perf_counter() - start
+    widget.populate()
+    QCoreApplication.processEvents()
+    timings["populated"] = time.perf_counter() - start
+    count_start = time.perf_counter()
+    db.number_of_rows()
+    timings["entry_count"] = time.perf_counter() - count_start
+    app.quit()
+    print(json.dumps(timings))
+
+
+def main():
+    "benchmark entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measure()
+        return
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, PYTHONPATH=str(REPO_DIR))
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+        use_home(home)
+        root = "/synthetic"
+        write_config(home, [root])
+        fill_database(root, args.entries)
+
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            runs.append(json.loads(proc.stdout.splitlines()[-1]))
+
+    results = {
+        "benchmark": "startup",
+        "environment": environment(),
+        "entries": args.entries,
+        "repeat": args.repeat,
+        "median_seconds": {
+            phase: statistics.median(run[phase] for run in runs) for phase in runs[0]
+        },
+    }
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
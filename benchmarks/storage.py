@@ -0,0 +1,276 @@
+"""
+Storage profile benchmark.
+
+Generates a synthetic tree and measures the SQLite settings of
+ziton/storage.py against the alternatives they were chosen over:
+
+    rebuild     full rebuilds under variants of the bulk-load profile, and
+                the same without the crawl by replaying its listings into
+                the shard writer
+    compaction  size of a shard rebuilt in place, with and without
+                incremental vacuum
+    search      size-ordered and SQL name-ordered search latency under
+                variants of the read profile, with and without planner
+                statistics of the `files` table
+
+Results are written as JSON.
+
+usage: python benchmarks/storage.py [--entries N] [--depth N] [--fanout N]
+                                    [--queries N] [--repeat N] [--output FILE]
+"""
+import argparse
+import os
+import pathlib
+import statistics
+import tempfile
+import time
+from functools import partial
+
+from common import environment, use_home, write_config, write_results
+from suite import FIRST_PAGE, build_queries, percentiles
+from synthetic import generate_tree
+
+BULK_VARIANTS = {
+    "sqlite_defaults": {},
+    "bulk_load": None,
+    "synchronous_normal": {"synchronous": "NORMAL"},
+    "large_cache": {"cache_size": -64 * 1024},
+    "temp_store_memory": {"temp_store": "MEMORY"},
+    "wal_autocheckpoint": {"wal_autocheckpoint": 10000},
+}
+READ_VARIANTS = {
+    "sqlite_defaults": {},
+    "read": None,
+    "no_mmap": {"mmap_size": 0},
+    "default_cache": {"cache_size": -2000},
+}
+
+
+def fresh_rebuild(roots):
+    "Seconds a rebuild takes when no shard exists yet."
+    from ziton import database as db
+
+    for root in roots:
+        db.remove_shard(root)
+    db.validate_database()
+    start = time.perf_counter()
+    db.build_database()
+    return time.perf_counter() - start
+
+
+def crawled_listings(root):
+    "Batches of the shard writer for every listing of a tree."
+    from ziton import database as db
+    from ziton import exclude
+
+    return [
+        (directory, rows, [], rollup)
+        for directory, rows, rollup in db.walk_directory(
+            root, True, exclude.matcher_for()
+        )
+    ]
+
+
+def replayed_rebuild(root, listings):
+    "Seconds the shard writer needs to store the listings of a fresh shard."
+    from ziton import database as db
+
+    db.remove_shard(root)
+    db.validate_database()
+    writer = db.ShardWriter(root, db.crawl_fingerprint())
+    writer.complete = True
+    start = time.perf_counter()
+    writer.start()
+    for batch in listings:
+        writer.batches.put(batch)
+    writer.batches.put(None)
+    writer.join()
+    return time.perf_counter() - start
+
+
+def bench_rebuilds(roots, repeat):
+    """
+    Median time of full and of replayed rebuilds under every variant of the
+    bulk-load profile.
+    """
+    from ziton import storage
+
+    listings = crawled_listings(roots[0])
+
+    profile = dict(storage.BULK_LOAD)
+    results = {}
+    try:
+        for name, variant in BULK_VARIANTS.items():
+            if variant is None:
+                storage.BULK_LOAD = profile
+            elif variant:
+                storage.BULK_LOAD = {**profile, **variant}
+            else:
+                storage.BULK_LOAD = {}
+            samples = [fresh_rebuild(roots) for _ in range(repeat)]
+            writes = [replayed_rebuild(roots[0], listings) for _ in range(repeat)]
+            results[name] = {
+                "seconds": statistics.median(samples),
+                "write_seconds": statistics.median(writes),
+                "pragmas": storage.BULK_LOAD,
+            }
+    finally:
+        storage.BULK_LOAD = profile
+    return results
+
+
+def name_search(shard, pattern, limit=None):
+    "Name-ordered search through SQL, bypassing the snapshot."
+    from ziton import database as db
+    from ziton import storage
+
+    conn = storage.connect(shard)
+    where, params = db.build_filter(pattern)
+    fetch = partial(db.fetch_page, conn.cursor())
+    count = sum(1 for _ in db.shard_pages(fetch, where, params, limit))
+    conn.close()
+    return count
+
+
+def size_search(pattern, limit=None):
+    "Size-ordered search through the rollups and the size index."
+    from ziton import database as db
+
+    return sum(1 for _ in db.search_by_size(pattern, limit))
+
+
+def bench_reads(shard, queries):
+    "First-page and complete latency of both SQL orders per query type."
+    results = {}
+    for name, run in (
+        ("name_order", partial(name_search, shard)),
+        ("size_order", size_search),
+    ):
+        results[name] = {}
+        for kind, patterns in queries.items():
+            first_page, complete = [], []
+            for pattern in patterns:
+                start = time.perf_counter()
+                run(pattern, FIRST_PAGE)
+                first_page.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                run(pattern)
+                complete.append(time.perf_counter() - start)
+            results[name][kind] = {
+                "first_page": percentiles(first_page),
+                "all_results": percentiles(complete),
+            }
+    return results
+
+
+def set_statistics(shard, analyzed):
+    "Compute the planner statistics of a shard, without those of `files`."
+    import sqlite3
+
+    conn = sqlite3.connect(shard)
+    conn.execute("ANALYZE")
+    if not analyzed:
+        conn.execute("DELETE FROM sqlite_stat1 WHERE tbl = 'files'")
+    conn.commit()
+    conn.close()
+
+
+def bench_read_variants(shard, queries):
+    "Search latency per read profile variant, with and without statistics."
+    from ziton import storage
+
+    profile = dict(storage.READ)
+    results = {}
+    try:
+        for analyzed in (False, True):
+            set_statistics(shard, analyzed)
+            for name, variant in READ_VARIANTS.items():
+                if variant is None:
+                    storage.READ = profile
+                else:
+                    storage.READ = {**profile, **variant} if variant else {}
+                key = f"{name}_analyzed" if analyzed else name
+                results[key] = bench_reads(shard, queries)
+    finally:
+        storage.READ = profile
+    return results
+
+
+def shard_bytes(shard):
+    "Size of a shard including its write-ahead log."
+    return sum(
+        os.path.getsize(shard + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(shard + suffix)
+    )
+
+
+def bench_compaction(roots, shard):
+    """
+    Size of a shard rebuilt over an existing one, which frees the pages of
+    the old table, with and without incremental vacuum.
+    """
+    from ziton import database as db
+    from ziton import storage
+
+    threshold = storage.VACUUM_THRESHOLD
+    results = {}
+    try:
+        storage.VACUUM_THRESHOLD = 1.0
+        fresh_rebuild(roots)
+        db.build_database()
+        results["rebuilt_bytes_without_vacuum"] = shard_bytes(shard)
+        storage.VACUUM_THRESHOLD = threshold
+        start = time.perf_counter()
+        storage.maintain(shard)
+        results["maintenance_seconds"] = time.perf_counter() - start
+        results["rebuilt_bytes_with_vacuum"] = shard_bytes(shard)
+    finally:
+        storage.VACUUM_THRESHOLD = threshold
+    return results
+
+
+def main():
+    "benchmark entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=20, help="per query type")
+    parser.add_argument("--repeat", type=int, default=3, help="rebuilds per variant")
+    parser.add_argument("--output", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        use_home(home)
+        root = pathlib.Path(home).joinpath("tree")
+        write_config(home, [root])
+        from ziton import database as db
+
+        tree = generate_tree(root, args.entries, args.depth, args.fanout, args.seed)
+        roots = [str(root)]
+        shard = db.shard_path(str(root))
+        queries = build_queries(tree.pop("sample_names"), args.queries, args.seed)
+        results = {
+            "rebuild": bench_rebuilds(roots, args.repeat),
+            "compaction": bench_compaction(roots, shard),
+            "search": bench_read_variants(shard, queries),
+        }
+
+    write_results(
+        {
+            "benchmark": "storage",
+            "environment": environment(),
+            "parameters": {
+                **{k: v for k, v in vars(args).items() if k != "output"},
+                **tree,
+            },
+            "results": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Indexing and search benchmark suite.
+
+Generates a synthetic tree in a temporary directory and measures full
+rebuild, incremental reindex, search latency per query type, live event
+ingestion, database size and peak memory. Results are written as JSON, use
+benchmarks/compare.py to compare two runs.
+
+usage: python benchmarks/suite.py [--entries N] [--depth N] [--fanout N]
+                                  [--queries N] [--events N] [--output FILE]
+"""
+import argparse
+import os
+import pathlib
+import random
+import resource
+import statistics
+import tempfile
+import time
+
+from common import environment, use_home, write_config, write_results
+from synthetic import EXTENSIONS, NameGenerator, generate_tree
+
+# rows the GUI fetches before the first frame of results is shown
+FIRST_PAGE = 256
+
+
+def percentiles(samples):
+    "Summarize latencies given in seconds as milliseconds."
+    samples = sorted(samples)
+
+    def rank(fraction):
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)] * 1000
+
+    return {
+        "p50_ms": rank(0.5),
+        "p90_ms": rank(0.9),
+        "p99_ms": rank(0.99),
+        "max_ms": samples[-1] * 1000,
+        "mean_ms": statistics.mean(samples) * 1000,
+    }
+
+
+def database_size(db_path):
+    "Size of the database and its shards including their write-ahead logs."
+    shards = os.path.join(os.path.dirname(db_path), "shards")
+    paths = [db_path] + [os.path.join(shards, name) for name in os.listdir(shards)]
+    return sum(
+        os.path.getsize(path + suffix)
+        for path in paths
+        for suffix in ("", "-wal", "-shm")
+        if os.path.exists(path + suffix)
+    )
+
+
+def build_queries(sample_names, count, seed):
+    "Queries per query type, drawn from names that exist in the tree."
+    from ziton.database import normalize_name
+
+    rng = random.Random(seed)
+    keys = [normalize_name(n) for n in sample_names]
+    words = [w for k in keys for w in k.replace("-", " ").replace("_", " ").split()]
+    extensions = [e for e, _ in EXTENSIONS if e]
+
+    def fragment():
+        key = rng.choice(keys)
+        start = rng.randrange(max(len(key) - 3, 1))
+        return key[start : start + 3]
+
+    return {
+        "substring": [fragment() for _ in range(count)],
+        "word": [rng.choice(words) for _ in range(count)],
+        "extension": [f"ext:{rng.choice(extensions)}" for _ in range(count)],
+        "combined": [
+            f"{rng.choice(words)} ext:{rng.choice(extensions)}" for _ in range(count)
+        ],
+        "miss": ["".join(rng.choices("qxz", k=6)) for _ in range(count)],
+    }
+
+
+def bench_search(queries):
+    "Latency until the first page and until all results were read."
+    from ziton import database as db
+
+    results = {}
+    for kind, patterns in queries.items():
+        first_page, complete, matches = [], [], []
+        for pattern in patterns:
+            start = time.perf_counter()
+            for _ in db.search(pattern, FIRST_PAGE):
+                pass
+            first_page.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            matches.append(sum(1 for _ in db.search(pattern)))
+            complete.append(time.perf_counter() - start)
+        results[kind] = {
+            "first_page": percentiles(first_page),
+            "all_results": percentiles(complete),
+            "mean_matches": statistics.mean(matches),
+        }
+    return results
+
+
+def bench_reindex(root, seed):
+    "Change a subtree and measure how long reindexing just that subtree takes."
+    from ziton import database as db
+
+    subtree = sorted(p for p in pathlib.Path(root).iterdir() if p.is_dir())[0]
+    generator = NameGenerator(seed + 1)
+    files = [p for p in subtree.rglob("*") if p.is_file()]
+    for path in files[: len(files) // 20]:
+        path.unlink()
+    for i in range(max(len(files) // 20, 1)):
+        subtree.joinpath(f"{generator.filename()}_{i}").touch()
+    start = time.perf_counter()
+    entries = db.reindex_directory(str(subtree))
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "entries": entries, "entries_per_s": entries / elapsed}
+
+
+def bench_events(root, count, seed):
+    "Throughput of the live update path for file creation and deletion."
+    from ziton import database as db
+
+    directory = pathlib.Path(root).joinpath("live-events")
+    directory.mkdir()
+    generator = NameGenerator(seed + 2)
+    paths = [
+        str(directory.joinpath(f"{i}_{generator.filename()}")) for i in range(count)
+    ]
+    for path in paths:
+        open(path, "wb").close()
+    start = time.perf_counter()
+    for path in paths:
+        db.insert_record(path)
+    created = time.perf_counter() - start
+    start = time.perf_counter()
+    for path in paths:
+        os.remove(path)
+        db.delete_record(path)
+    deleted = time.perf_counter() - start
+    return {
+        "events": count,
+        "create_events_per_s": count / created,
+        "delete_events_per_s": count / deleted,
+    }
+
+
+def main():
+    "benchmark entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=50, help="per query type")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--output", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        use_home(home)
+        root = pathlib.Path(home).joinpath("tree")
+        db_path = write_config(home, [root])
+        from ziton import database as db
+
+        start = time.perf_counter()
+        tree = generate_tree(root, args.entries, args.depth, args.fanout, args.seed)
+        generation = time.perf_counter() - start
+
+        db.validate_database()
+        start = time.perf_counter()
+        db.build_database()
+        rebuild = time.perf_counter() - start
+        entries = db.number_of_rows()
+
+        results = {
+            "full_rebuild": {
+                "seconds": rebuild,
+                "entries": entries,
+                "entries_per_s": entries / rebuild,
+            },
+            "database_bytes": database_size(db_path),
+            "search": bench_search(
+                build_queries(tree.pop("sample_names"), args.queries, args.seed)
+            ),
+            "incremental_reindex": bench_reindex(root, args.seed),
+            "live_events": bench_events(root, args.events, args.seed),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    write_results(
+        {
+            "benchmark": "suite",
+            "environment": environment(),
+            "parameters": {
+                **{k: v for k, v in vars(args).items() if k != "output"},
+                "generation_seconds": generation,
+                **tree,
+            },
+            "results": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
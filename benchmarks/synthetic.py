@@ -0,0 +1,147 @@
+"""
+Reproducible synthetic filesystem trees for the benchmarks.
+
+Creates a directory tree of a given depth and fan-out and spreads empty
+(sparse) files over it. Names are drawn from a seeded random generator, so
+the same arguments always produce the same tree.
+
+usage: python benchmarks/synthetic.py DIR [--entries N] [--depth N]
+                                          [--fanout N] [--seed N]
+"""
+import argparse
+import json
+import os
+import random
+
+SYLLABLES = (
+    "ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "zen", "dor", "fel", "gra",
+    "hum", "jin", "pol", "qua", "ster", "tor", "wex", "yul",
+)  # fmt: skip
+ACCENTED = ("é", "ü", "ñ", "ø", "å", "ç", "ß")
+# extension and relative frequency, "" produces files without extension
+EXTENSIONS = (
+    ("txt", 20), ("py", 12), ("jpg", 12), ("pdf", 8), ("json", 8), ("c", 6),
+    ("html", 6), ("png", 6), ("mp3", 4), ("tar.gz", 3), ("", 15),
+)  # fmt: skip
+
+
+class NameGenerator:
+    """Draws file and directory names from a seeded distribution."""
+
+    def __init__(self, seed=0, unicode_ratio=0.05, hidden_ratio=0.02):
+        self.random = random.Random(seed)
+        self.unicode_ratio = unicode_ratio
+        self.hidden_ratio = hidden_ratio
+        self.extensions = [e for e, _ in EXTENSIONS]
+        self.weights = [w for _, w in EXTENSIONS]
+
+    def word(self):
+        "A pronounceable word of one to four syllables."
+        word = "".join(self.random.choices(SYLLABLES, k=self.random.randint(1, 4)))
+        if self.random.random() < self.unicode_ratio:
+            pos = self.random.randrange(len(word))
+            word = word[:pos] + self.random.choice(ACCENTED) + word[pos + 1 :]
+        return word
+
+    def stem(self):
+        "A name without extension, like `kalo_mi-2`."
+        parts = [self.word() for _ in range(self.random.randint(1, 3))]
+        name = self.random.choice(("_", "-", " ", "")).join(parts)
+        if self.random.random() < 0.3:
+            name += str(self.random.randint(0, 999))
+        if self.random.random() < self.hidden_ratio:
+            name = "." + name
+        return name
+
+    def filename(self):
+        "A file name with a randomly chosen extension."
+        extension = self.random.choices(self.extensions, self.weights)[0]
+        stem = self.stem()
+        return f"{stem}.{extension}" if extension else stem
+
+    def size(self):
+        "A file size following a rough power law."
+        return int(self.random.paretovariate(1.2) * 512)
+
+
+def directory_layout(depth, fanout):
+    "Relative paths of all directories of a tree with the given shape."
+    level = [""]
+    layout = []
+    for _ in range(depth):
+        level = [os.path.join(p, f"d{i}") for p in level for i in range(fanout)]
+        layout.extend(level)
+    return layout
+
+
+def generate_tree(root, entries=100_000, depth=4, fanout=8, seed=0, **names):
+    """
+    Create a tree with roughly `entries` files and directories below root.
+    Returns a summary including a sample of the generated names, which the
+    benchmarks use to build realistic queries.
+    """
+    generator = NameGenerator(seed, **names)
+    os.makedirs(root, exist_ok=True)
+    paths = {"": str(root)}
+    directories = []
+    # levels are created top-down, parents always exist before their children
+    for relative in directory_layout(depth, fanout):
+        parent = paths[os.path.dirname(relative)]
+        path = os.path.join(parent, f"{generator.stem()}_{len(directories)}")
+        os.mkdir(path)
+        paths[relative] = path
+        directories.append(path)
+    directories = directories or [str(root)]
+
+    files = max(entries - len(directories), 0)
+    sample = set()
+    for i in range(files):
+        directory = directories[i % len(directories)]
+        while True:
+            name = generator.filename()
+            try:
+                outfile = open(os.path.join(directory, name), "xb")
+                break
+            except FileExistsError:
+                continue
+        with outfile:
+            outfile.truncate(generator.size())
+        if len(sample) < 1000:
+            sample.add(name)
+    return {
+        "root": str(root),
+        "directories": len(directories),
+        "files": files,
+        "depth": depth,
+        "fanout": fanout,
+        "seed": seed,
+        "sample_names": sorted(sample),
+    }
+
+
+def main():
+    "generator entrypoint."
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("root")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unicode-ratio", type=float, default=0.05)
+    parser.add_argument("--hidden-ratio", type=float, default=0.02)
+    args = parser.parse_args()
+    summary = generate_tree(
+        args.root,
+        args.entries,
+        args.depth,
+        args.fanout,
+        args.seed,
+        unicode_ratio=args.unicode_ratio,
+        hidden_ratio=args.hidden_ratio,
+    )
+    del summary["sample_names"]
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
+import multiprocessing
+
 from ziton.gui import start
 
-start()
+if __name__ == "__main__":
+    # the content index and the duplicate finder spawn worker processes,
+    # which re-import this module and must not start another GUI
+    multiprocessing.freeze_support()
+    start()
@@ -0,0 +1,30 @@
+import pytest
+import toml
+
+from ziton import config
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    "An included directory with a configuration of its own, returns its path."
+    root = tmp_path / "tree"
+    root.mkdir()
+    home = tmp_path / "home"
+    home.mkdir()
+    settings = {
+        "included_directories": [str(root)],
+        "index_on_startup": False,
+        "live_updates": False,
+        "hidden_files": True,
+        "database_path": str(home / "database.db"),
+        "excluded": [],
+    }
+    (home / "config.toml").write_text(toml.dumps(settings))
+    monkeypatch.setattr(config, "CONFIG_PATH", home / "config.toml")
+    return root
+
+
+def write(path, size):
+    "Create a file of the given size, with its parents."
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
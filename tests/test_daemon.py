@@ -0,0 +1,76 @@
+import json
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+
+from ziton import database as db
+from ziton.daemon import MAX_QUERIES, Index, Server
+
+from .conftest import write
+
+
+def rollup(conn, path):
+    "Subtree bytes and files of a directory."
+    cursor = conn.execute("SELECT bytes, files FROM rollups WHERE filepath = ?", [path])
+    return cursor.fetchone()
+
+
+def paths(conn):
+    return {row[0] for row in conn.execute("SELECT filepath FROM files")}
+
+
+def test_directory_events_update_subtree_and_rollups(tree, tmp_path):
+    write(tree / "a.bin", 10)
+    db.build_database()
+    index = Index()
+    # moved in from outside, its contents are never reported on their own
+    write(tmp_path / "new" / "b.bin", 100)
+    write(tmp_path / "new" / "sub" / "c.bin", 1000)
+    shutil.move(str(tmp_path / "new"), str(tree / "new"))
+    index.apply_event("MOVED_TO,ISDIR", str(tree / "new"))
+
+    disk = sqlite3.connect(db.shard_path(str(tree)))
+    memory = index.shards[str(tree)]
+    added = {str(tree / "new"), str(tree / "new/b.bin"), str(tree / "new/sub")}
+    added.add(str(tree / "new/sub/c.bin"))
+    for conn in (disk, memory):
+        assert added <= paths(conn)
+        assert rollup(conn, str(tree / "new")) == (1100, 2)
+        assert rollup(conn, str(tree)) == (1110, 3)
+
+    shutil.rmtree(tree / "new")
+    index.apply_event("DELETE,ISDIR", str(tree / "new"))
+    for conn in (disk, memory):
+        assert not added & paths(conn)
+        assert rollup(conn, str(tree)) == (10, 1)
+    disk.close()
+
+
+def test_searches_waiting_for_a_slot_can_be_cancelled(tree, tmp_path):
+    for number in range(3000):
+        write(tree / f"file{number:04}.bin", 1)
+    db.build_database()
+    path = str(tmp_path / "daemon.sock")
+    server = Server(path, Index())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ids = range(1, MAX_QUERIES + 3)
+    requests = [{"id": i, "op": "search", "query": ""} for i in ids]
+    requests += [{"id": i, "op": "cancel"} for i in ids]
+    requests.append({"id": 0, "op": "ping"})
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+        for request in requests:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+        # the results fill the socket buffers until the searches are cancelled
+        time.sleep(0.5)
+        rows = 0
+        for line in sock.makefile("rb"):
+            answer = json.loads(line)
+            if answer["id"] == 0:
+                break
+            rows += len(answer.get("rows", ()))
+    server.shutdown()
+    server.server_close()
+    assert rows < 3000
@@ -0,0 +1,33 @@
+from ziton import config
+from ziton import database as db
+
+from .conftest import write
+
+
+def set_roots(roots):
+    settings = config.load_configuration()
+    settings["included_directories"] = [str(root) for root in roots]
+    config.save_configuration(settings)
+
+
+def matches(pattern):
+    return [row[1] for row in db.search(pattern)]
+
+
+def test_nested_directory_added_and_removed(tree):
+    write(tree / "inner" / "x.bin", 10)
+    db.build_database()
+    inner = str(tree / "inner")
+
+    set_roots([tree, inner])
+    roots = db.changed_shards([inner], [])
+    assert roots == [inner, str(tree)]
+    db.build_database(roots)
+    assert matches("x.bin") == [str(tree / "inner" / "x.bin")]
+
+    set_roots([tree])
+    db.remove_shard(inner)
+    roots = db.changed_shards([], [inner])
+    assert roots == [str(tree)]
+    db.build_database(roots)
+    assert matches("x.bin") == [str(tree / "inner" / "x.bin")]
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+
+from ziton import database as db
+from ziton.config import database_path
+from ziton.duplicates import find_duplicates
+
+from .conftest import write
+
+
+def test_links_are_not_duplicates(tree):
+    write(tree / "a" / "big.bin", 200000)
+    write(tree / "c" / "big.bin", 200000)
+    write(tree / "c" / "single.bin", 300000)
+    os.symlink(tree / "c" / "single.bin", tree / "a" / "link.bin")
+    os.link(tree / "c" / "single.bin", tree / "a" / "hard.bin")
+    db.build_database()
+    groups = find_duplicates()
+    assert [sorted(entry[0] for entry in group) for group in groups] == [
+        [str(tree / "a" / "big.bin"), str(tree / "c" / "big.bin")]
+    ]
+
+
+def test_hashes_of_deleted_files_are_dropped(tree):
+    write(tree / "a.bin", 1000)
+    write(tree / "b.bin", 1000)
+    write(tree / "c.bin", 1000)
+    db.build_database()
+    assert len(find_duplicates()[0]) == 3
+    os.remove(tree / "c.bin")
+    db.delete_record(str(tree / "c.bin"))
+    assert len(find_duplicates()[0]) == 2
+    conn = sqlite3.connect(database_path())
+    cached = [row[0] for row in conn.execute("SELECT filepath FROM hashes")]
+    conn.close()
+    assert sorted(cached) == [str(tree / "a.bin"), str(tree / "b.bin")]
@@ -0,0 +1,25 @@
+import os
+import sqlite3
+
+from ziton import database as db
+
+from .conftest import write
+
+
+def test_links_count_with_their_own_size(tree):
+    write(tree / "a" / "small.bin", 12)
+    write(tree / "c" / "big.bin", 200000)
+    os.symlink(tree / "c" / "big.bin", tree / "a" / "link.bin")
+    db.build_database()
+    link_size = os.lstat(tree / "a" / "link.bin").st_size
+    conn = sqlite3.connect(db.shard_path(str(tree)))
+    cursor = conn.execute(
+        "SELECT size FROM files WHERE filepath = ?", [str(tree / "a" / "link.bin")]
+    )
+    assert cursor.fetchone() == (link_size,)
+    cursor = conn.execute(
+        "SELECT bytes FROM rollups WHERE filepath = ?", [str(tree / "a")]
+    )
+    assert cursor.fetchone() == (12 + link_size,)
+    conn.close()
+    assert db.dbrecord_from_path(str(tree / "a" / "link.bin")).size == link_size
@@ -0,0 +1,37 @@
+from ziton import watch
+from ziton.exclude import ExclusionMatcher
+
+from .conftest import write
+
+
+def test_events_below_ignore_files_are_skipped(tree, monkeypatch):
+    (tree / "sub").mkdir()
+    (tree / "sub" / ".gitignore").write_text("*.log\nbuild/\n")
+    write(tree / "sub" / "build", 1)
+    folder = f"{tree}/sub/"
+    events = [
+        f"{folder} CREATE x.log",
+        f"{folder} CREATE x.txt",
+        f"{folder} CREATE build",
+        f"{folder} DELETE,ISDIR cache",
+        f"{folder} MOVED_FROM,ISDIR build",
+        f"{folder}build/ CREATE a.txt",
+    ]
+
+    def process(cmd):
+        yield from events
+        (tree / "sub" / ".gitignore").write_text("*.txt\n")
+        yield f"{folder} CLOSE_WRITE,CLOSE .gitignore"
+        yield f"{folder} CREATE y.txt"
+        yield f"{folder} CREATE y.log"
+
+    monkeypatch.setattr(watch, "inotify_process", process)
+    matcher = ExclusionMatcher.from_config([], [str(tree)], ignore_files=True)
+    reported = list(watch.inotify_events([str(tree)], matcher))
+    assert reported == [
+        ("CREATE", f"{tree}/sub/x.txt"),
+        ("CREATE", f"{tree}/sub/build"),
+        ("DELETE,ISDIR", f"{tree}/sub/cache"),
+        ("CLOSE_WRITE,CLOSE", f"{tree}/sub/.gitignore"),
+        ("CREATE", f"{tree}/sub/y.log"),
+    ]
@@ -0,0 +1,37 @@
+"""
+Command line entry point: `python -m ziton [command]`.
+"""
+import argparse
+import sys
+
+from . import cli
+
+
+def main():
+    "dispatch to the requested command, the GUI is started by default."
+    parser = argparse.ArgumentParser(prog="ziton")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("gui", help="start the graphical interface (default)")
+    commands.add_parser("daemon", help="run the headless search daemon")
+    cli.add_arguments(commands.add_parser("search", help="search the index"))
+    cli.add_metrics_arguments(
+        commands.add_parser("metrics", help="dump the daemon's metrics as JSON")
+    )
+    args = parser.parse_args()
+
+    if args.command == "search":
+        sys.exit(cli.search(args))
+    elif args.command == "metrics":
+        sys.exit(cli.dump_metrics(args))
+    elif args.command == "daemon":
+        from .daemon import main as daemon_main
+
+        daemon_main()
+    else:
+        from .gui import start
+
+        start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,149 @@
-"""
-Central entry point for the application.
-"""
-
-import sys
-
-from PySide2.QtCore import QCoreApplication, Qt, Signal, Slot
-from PySide2.QtGui import QIcon
-from PySide2.QtSql import QSqlDatabase
-from PySide2.QtWidgets import QApplication, QLineEdit, QVBoxLayout, QWidget
-
-from . import LOGO_PATH, STYLESHEET_PATH
-from . import monitor as monitor
-from .config import database_path, included_directories, is_indexing_enabled
-from .widgets.entries_trayicon import TrayEntryInfo
-from .widgets.menubar import Menubar
-from .widgets.tableview import Tableview
-
-# TODO: Iron out bugs in live file monitoring, implement file deletion signal
-
-
-class Mainwindow(QWidget):
-    """Central widget and entrypoint for the program."""
-
-    selChanged = Signal(str)
-
-    def __init__(self):
-        QWidget.__init__(self)
-        # connect to existing DB
-        self.database = QSqlDatabase.addDatabase("QSQLITE")
-        self.database.setDatabaseName(database_path())
-        self.database.open()
-        # start monitoring the filesystem for changes
-        if is_indexing_enabled():
-            self.watch = monitor.Worker(self)
-            self.watch.fileCreated.connect(self.file_created)
-            self.watch.start()
-        # widgets
-        self.searchbar = QLineEdit()
-        self.menubar = Menubar()
-        self.trayinfo = TrayEntryInfo()
-        self.view = Tableview()
-
-        # set layout
-        self.central_layout = QVBoxLayout()
-        self.central_layout.addWidget(self.menubar)
-        self.central_layout.addWidget(self.searchbar)
-        self.central_layout.addWidget(self.view)
-        self.central_layout.addWidget(self.trayinfo)
-        self.setLayout(self.central_layout)
-
-        # signals
-        self.searchbar.textChanged.connect(self.view.update_filter)
-        self.view.selectionModel().selectionChanged.connect(self.update_tray)
-        self.view.tabPressed.connect(self.focus_searchbar)
-        self.selChanged.connect(self.trayinfo.update_selected_text)
-        self.menubar.dbUpdated.connect(self.trayinfo.update_selected_text)
-        self.menubar.dbUpdated.connect(self.trayinfo.update_filecount)
-        self.menubar.dbUpdated.connect(self.reload_db_model_and_view)
-
-    def update_tray(self, item):
-        """Update the tray information when selection has changed."""
-        indexes = item.indexes()
-        # get first column that contains the file's name and update the tray
-        name = self.view.model().data(indexes[0])
-        self.selChanged.emit(name)
-
-    @Slot()
-    def focus_searchbar(self):
-        "puts searchbar into focus."
-        self.searchbar.setFocus()
-
-    @Slot()
-    def reload_db_model_and_view(self):
-        "reloads entire database model and updates view."
-        self.database.close()
-        self.database.open()
-        self.view.update_model()
-
-    def file_created(self, filepath):
-        "Consume inotify file creation event."
-        self.view.insert_record(filepath)
-
-
-def main():
-    "program entrypoint."
-    included_directories()
-    with open(STYLESHEET_PATH, "r") as infile:
-        stylesheet = infile.read()
-
-    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
-    app = QApplication(sys.argv)
-    app.setStyleSheet(stylesheet)
-    app.setWindowIcon(QIcon(str(LOGO_PATH)))
-    app.setApplicationDisplayName("Ziton")
-
-    widget = Mainwindow()
-    widget.resize(1200, 800)
-    widget.show()
-
-    sys.exit(app.exec_())
+"""
+Central entry point for the application.
+"""
+
+import os
+import sys
+import threading
+
+from PySide2.QtCore import QCoreApplication, Qt, QTimer, Signal, Slot
+from PySide2.QtGui import QIcon
+from PySide2.QtWidgets import QApplication, QLineEdit, QVBoxLayout, QWidget
+
+from . import LOGO_PATH, STYLESHEET_PATH, client
+from . import database as db
+from .config import (content_index_enabled, included_directories,
+                     is_indexing_enabled, reindex_interval,
+                     start_updated_enabled)
+from .widgets.entries_trayicon import TrayEntryInfo
+from .widgets.menubar import Menubar
+from .widgets.tableview import Tableview
+
+# TODO: Iron out bugs in live file monitoring
+
+
+class Mainwindow(QWidget):
+    """Central widget and entrypoint for the program."""
+
+    selChanged = Signal(str)
+    indexChanged = Signal(str)
+
+    def __init__(self, rebuild=()):
+        QWidget.__init__(self)
+        # included directories whose shards are missing or outdated
+        self.rebuild_on_startup = rebuild
+        self.update_on_startup = start_updated_enabled()
+        # start monitoring the filesystem for changes, unless the search
+        # daemon is running and already does so
+        if is_indexing_enabled() and not client.daemon_running():
+            from . import monitor
+
+            self.watch = monitor.Worker(self)
+            self.watch.fileCreated.connect(self.file_created)
+            self.watch.fileDeleted.connect(self.file_deleted)
+            self.watch.fileModified.connect(self.file_modified)
+            self.watch.start()
+        # incremental background reindexing, also done by the daemon
+        if reindex_interval() and not client.daemon_running():
+            from . import scheduler
+
+            self.scheduler = scheduler.Scheduler(on_change=self.indexChanged.emit)
+            self.scheduler.start()
+        # catch up on files changed while the content index wasn't running
+        self.index_content = content_index_enabled() and not client.daemon_running()
+        if self.index_content:
+            from . import content
+
+            threading.Thread(target=content.update_index, daemon=True).start()
+        # widgets
+        self.searchbar = QLineEdit()
+        self.menubar = Menubar()
+        self.trayinfo = TrayEntryInfo()
+        self.view = Tableview()
+
+        # set layout
+        self.central_layout = QVBoxLayout()
+        self.central_layout.addWidget(self.menubar)
+        self.central_layout.addWidget(self.searchbar)
+        self.central_layout.addWidget(self.view)
+        self.central_layout.addWidget(self.trayinfo)
+        self.setLayout(self.central_layout)
+
+        # signals
+        self.searchbar.textChanged.connect(self.view.update_filter)
+        self.view.fileSelected.connect(self.selChanged)
+        self.view.tabPressed.connect(self.focus_searchbar)
+        self.selChanged.connect(self.trayinfo.update_selected_text)
+        self.menubar.dbUpdated.connect(self.trayinfo.update_selected_text)
+        # progress reports only change the status text
+        self.menubar.rebuildFinished.connect(self.trayinfo.update_filecount)
+        self.menubar.rebuildFinished.connect(self.reload_db_model_and_view)
+        self.indexChanged.connect(self.trayinfo.update_filecount)
+        self.view.operationFinished.connect(self.trayinfo.update_selected_text)
+        self.view.operationFinished.connect(self.trayinfo.update_filecount)
+
+    @Slot()
+    def populate(self):
+        "fills the view and starts pending reindexing once the window is up."
+        self.view.update_model()
+        if self.update_on_startup:
+            self.menubar.rebuild_btn_clicked()
+        elif self.rebuild_on_startup:
+            self.menubar.rebuild_shards(self.rebuild_on_startup)
+
+    @Slot()
+    def focus_searchbar(self):
+        "puts searchbar into focus."
+        self.searchbar.setFocus()
+
+    @Slot()
+    def reload_db_model_and_view(self):
+        "reloads entire database model and updates view."
+        self.view.update_model()
+
+    def file_created(self, filepath):
+        "Consume inotify file creation event."
+        self.view.insert_record(filepath)
+        if self.index_content:
+            from . import content
+
+            content.update_file(filepath)
+
+    def file_deleted(self, filepath):
+        "Consume inotify file deletion event."
+        self.view.remove_record(filepath)
+        if self.index_content:
+            from . import content
+
+            content.update_file(filepath)
+
+    def file_modified(self, filepath):
+        "Consume inotify event of a file written in place."
+        if not os.path.exists(filepath):
+            return
+        db.update_record(filepath)
+        if self.index_content:
+            from . import content
+
+            content.update_file(filepath)
+
+
+def main(rebuild=()):
+    "program entrypoint."
+    included_directories()
+    with open(STYLESHEET_PATH, "r") as infile:
+        stylesheet = infile.read()
+
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv)
+    app.setStyleSheet(stylesheet)
+    app.setWindowIcon(QIcon(str(LOGO_PATH)))
+    app.setApplicationDisplayName("Ziton")
+
+    widget = Mainwindow(rebuild)
+    widget.resize(1200, 800)
+    widget.show()
+    # load data only after the first frame has been painted
+    QTimer.singleShot(0, widget.populate)
+
+    sys.exit(app.exec_())
@@ -0,0 +1,144 @@
+"""
+Command line client: `python -m ziton search <pattern>` and
+`python -m ziton metrics`.
+
+Matches are written as soon as they are found, one path per line or NUL
+separated for `xargs -0`. Queries go to the search daemon when it is running
+and to the database otherwise, which is only read: shards that are missing
+or outdated are skipped, rebuilding them is left to the GUI and the daemon.
+Must not import PySide2 to keep startup fast.
+"""
+import json
+import os
+import sqlite3
+import sys
+
+from . import client
+from . import config as cfg
+from . import database as db
+
+
+def add_arguments(parser):
+    "Register the options of the search command."
+    parser.add_argument("pattern", nargs="*", help="terms that must all match")
+    parser.add_argument(
+        "-e",
+        "--ext",
+        action="append",
+        default=[],
+        help="only show files with this extension, can be repeated",
+    )
+    parser.add_argument("-n", "--limit", type=int, help="stop after N matches")
+    parser.add_argument(
+        "-0", "--null", action="store_true", help="separate results by NUL"
+    )
+    parser.add_argument(
+        "-l", "--long", action="store_true", help="show size and modification time"
+    )
+    parser.add_argument(
+        "-c", "--count", action="store_true", help="only print the number of matches"
+    )
+    parser.add_argument(
+        "--no-daemon", action="store_true", help="always read the database directly"
+    )
+
+
+def add_metrics_arguments(parser):
+    "Register the options of the metrics command."
+    parser.add_argument("-o", "--output", help="write the JSON to this file")
+
+
+def build_pattern(args):
+    "Combine positional terms and options into a searchbar pattern."
+    terms = list(args.pattern)
+    if args.ext:
+        terms.append("ext:" + ",".join(args.ext))
+    return " ".join(terms)
+
+
+def readable_shards():
+    "Shards that can be searched as they are, warns about the others."
+    shards = []
+    for root in cfg.included_directories():
+        shard = db.shard_path(root)
+        try:
+            version = db.schema_version(shard) if os.path.exists(shard) else None
+        except sqlite3.DatabaseError:
+            version = 0
+        if version is None:
+            warn(f"'{root}' is not indexed yet, skipped")
+        elif version < db.SCHEMA_VERSION:
+            warn(f"the index of '{root}' is outdated, skipped")
+        else:
+            shards.append(shard)
+    return shards
+
+
+def warn(message):
+    "Print a warning without mixing it into the results."
+    print(f"ziton: {message}", file=sys.stderr)
+
+
+def results(pattern, limit=None, use_daemon=True):
+    """
+    Generator over the matching entries, from the daemon if possible. None
+    if there is nothing to search.
+    """
+    if use_daemon and client.daemon_running():
+        return client.search(pattern, limit)
+    shards = readable_shards()
+    if not shards:
+        return None
+    return db.search(pattern, limit, shards)
+
+
+def format_row(row, long_format):
+    "Render a single result."
+    filename, filepath, size, modified = row
+    if not long_format:
+        return filepath
+    return f"{size:>12} {modified:>10} {filepath}"
+
+
+def search(args):
+    "Run the search command, returns the process exit status."
+    cfg.validate_config_file()
+    matches = results(build_pattern(args), args.limit, not args.no_daemon)
+    if matches is None:
+        warn("the index is empty, build it from the GUI first")
+        return 1
+    out = sys.stdout.buffer
+    separator = b"\0" if args.null else b"\n"
+    count = 0
+    try:
+        for row in matches:
+            count += 1
+            if not args.count:
+                out.write(format_row(row, args.long).encode("utf-8", "surrogateescape"))
+                out.write(separator)
+        if args.count:
+            out.write(f"{count}\n".encode())
+        out.flush()
+    except BrokenPipeError:
+        # the reader (e.g. `head`) went away, that's not an error
+        sys.stderr.close()
+    finally:
+        matches.close()
+    return 0 if count else 1
+
+
+def dump_metrics(args):
+    "Write the search daemon's metrics as JSON, returns the exit status."
+    cfg.validate_config_file()
+    try:
+        snapshot = client.request("metrics")["metrics"]
+    except ConnectionError:
+        print("ziton: the search daemon is not running", file=sys.stderr)
+        return 1
+    text = json.dumps(snapshot, indent=2)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            outfile.write(text)
+    else:
+        print(text)
+    return 0
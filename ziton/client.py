@@ -0,0 +1,111 @@
+"""
+Client for the search daemon's unix socket API, see `ziton.daemon`.
+"""
+import itertools
+import json
+import socket
+import time
+
+from .config import socket_path
+
+_request_ids = itertools.count(1)
+# time and answer of the last check for a running daemon
+_last_probe = (float("-inf"), False)
+
+
+class DaemonError(Exception):
+    """Raised when the daemon answers a request with an error."""
+
+
+def connect():
+    "Open a connection to the daemon, returns None if it isn't running."
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def daemon_running(max_age=0):
+    """
+    Check if a daemon is listening on the configured socket. The answer of
+    an earlier check is reused if it is at most `max_age` seconds old.
+    """
+    global _last_probe
+    now = time.monotonic()
+    if now - _last_probe[0] <= max_age:
+        return _last_probe[1]
+    sock = connect()
+    if sock is not None:
+        sock.close()
+    _last_probe = (now, sock is not None)
+    return sock is not None
+
+
+def send(sock, message):
+    "Write a single request to the daemon."
+    sock.sendall(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+
+def request(op, **kwargs):
+    "Send a single request and return the daemon's answer."
+    sock = connect()
+    if sock is None:
+        raise ConnectionError("search daemon is not running")
+    with sock, sock.makefile("rb") as reader:
+        send(sock, {"id": next(_request_ids), "op": op, **kwargs})
+        answer = json.loads(reader.readline())
+    if "error" in answer:
+        raise DaemonError(answer["error"])
+    return answer
+
+
+def reload(roots=None):
+    """
+    Ask a running daemon to reload the shards of the given included
+    directories, all by default, after they were changed by this process.
+    Does nothing if no daemon is running.
+    """
+    try:
+        request("reload", roots=roots)
+    except OSError:
+        # not running, or it went away
+        pass
+
+
+def search(pattern="", limit=None, sock=None):
+    """
+    Generator over the entries matching the search pattern as
+    (filename, filepath, size, modified) tuples, streamed from the daemon.
+    Closing the generator early cancels the search on the daemon's side.
+    """
+    own_socket = sock is None
+    if own_socket:
+        sock = connect()
+        if sock is None:
+            raise ConnectionError("search daemon is not running")
+    request_id = next(_request_ids)
+    reader = sock.makefile("rb")
+    done = False
+    try:
+        send(sock, {"id": request_id, "op": "search", "query": pattern, "limit": limit})
+        for line in reader:
+            answer = json.loads(line)
+            if answer.get("id") != request_id:
+                continue
+            if "error" in answer:
+                raise DaemonError(answer["error"])
+            for row in answer.get("rows", ()):
+                yield tuple(row)
+            if answer.get("done"):
+                done = True
+                return
+    finally:
+        if not done and not own_socket:
+            send(sock, {"id": request_id, "op": "cancel"})
+        reader.close()
+        if own_socket:
+            # closing the connection cancels all of its searches
+            sock.close()
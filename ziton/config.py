@@ -8,8 +8,12 @@ import toml
 
 HOME_DIR = pathlib.Path.home()
 CONFIG_PATH = pathlib.Path(HOME_DIR).joinpath(".ziton/config.toml")
-logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
+# text-like files whose content is indexed unless configured otherwise
+DEFAULT_CONTENT_EXTENSIONS = (
+    "txt md rst org tex csv tsv log json yaml yml toml ini cfg conf xml html htm "
+    "css py c h cpp hpp rs go java js ts sh rb pl lua sql"
+).split()
 
 
 class InvalidConfigurationError(Exception):
@@ -89,6 +93,12 @@ def database_path():
         return config["database_path"]
 
 
+def load_configuration():
+    """Read all configuration settings."""
+    with open(CONFIG_PATH, "r") as infile:
+        return toml.load(infile)
+
+
 def save_configuration(config_dict):
     """persist current configuration settings to disk."""
     with open(CONFIG_PATH, "w") as outfile:
@@ -107,3 +117,91 @@ def excluded_files():
     with open(CONFIG_PATH, "r") as infile:
         config = toml.load(infile)
         return config["excluded"]
+
+
+def socket_path():
+    "Path of the unix socket the search daemon listens on."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        default = pathlib.Path(HOME_DIR).joinpath(".ziton/ziton.sock")
+        return config.get("socket_path", str(default))
+
+
+def metrics_enabled():
+    "Check if performance metrics should be collected."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("metrics", False)
+
+
+def profile_mode():
+    "Profiler wrapped around rebuilds: '', 'cprofile' or 'sample'."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("profile", "")
+
+
+def ignore_files_enabled():
+    "Check if rules from .gitignore and .ignore files are honored."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("respect_ignore_files", False)
+
+
+def one_filesystem_enabled():
+    "Check if the crawler should stay on the filesystem of each included directory."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("one_filesystem", False)
+
+
+def mount_options():
+    """
+    Per mount point crawler settings, e.g.
+    `[mounts."/mnt/nas"]` with `workers = 1` and `timeout = 5.0`.
+    """
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("mounts", {})
+
+
+def reindex_interval():
+    "Minutes between two background reindex passes, 0 disables them."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("reindex_interval", 30)
+
+
+def reindex_rate():
+    "Filesystem calls per second a background reindex pass may make."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("reindex_rate", 500)
+
+
+def pause_on_battery():
+    "Check if background reindexing waits while the machine runs on battery."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("pause_on_battery", True)
+
+
+def content_index_enabled():
+    "Check if the contents of text files are indexed for `content:` searches."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("content_index", False)
+
+
+def content_max_size():
+    "Largest file in bytes whose content is indexed."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("content_max_size", 1_000_000)
+
+
+def content_extensions():
+    "Extensions of the files whose content is indexed."
+    with open(CONFIG_PATH, "r") as infile:
+        config = toml.load(infile)
+        return config.get("content_extensions", DEFAULT_CONTENT_EXTENSIONS)
@@ -0,0 +1,307 @@
+"""
+Optional full-text index of the contents of text-like files.
+
+Every shard gets a content database next to it with an FTS5 table of the
+extracted text and, per file, the size and modification time it had when
+it was extracted. `update_index` compares that state with the shard, which
+the crawler, the scheduler and the monitor keep current, and only
+re-extracts files whose size or modification time changed. Extraction runs
+in a process pool.
+
+Searches starting with `content:` are answered from it, ranked by bm25 and
+streamed page by page like filename searches. Scores come from the
+statistics of each shard, so ranking across shards is approximate.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import sqlite3
+from functools import partial
+from itertools import repeat
+
+from . import database as db
+from . import metrics, storage
+from .config import content_extensions, content_max_size, included_directories
+
+LOGGER = logging.getLogger(__name__)
+
+# searchbar prefix of content searches
+PREFIX = "content:"
+# bytes looked at to tell text from binary files
+SNIFF_SIZE = 8192
+# files extracted per task sent to a worker process
+CHUNK_SIZE = 32
+# processes extracting text at the same time
+MAX_WORKERS = 4
+
+
+def content_path(root):
+    "Content database belonging to the shard of an included directory."
+    shard = db.shard_path(root)
+    return shard[: -len(".db")] + ".content.db"
+
+
+def create_content_schema(cursor):
+    """Create the tables of an empty content database."""
+    # only takes effect before the first table is created
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS content_state(id INTEGER PRIMARY KEY,
+            filepath TEXT UNIQUE, size INT, modified INT)"""
+    )
+    # rows share their rowid with the state of the file
+    cursor.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS content USING
+            fts5(body, tokenize = 'unicode61 remove_diacritics 2')"""
+    )
+
+
+def extract_text(path, max_size):
+    "Text of a file, None if it is binary, too large or unreadable."
+    try:
+        with open(path, "rb") as infile:
+            data = infile.read(max_size + 1)
+    except OSError:
+        return None
+    if len(data) > max_size or b"\0" in data[:SNIFF_SIZE]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def _extract_chunk(paths, max_size):
+    "Extract the text of several files in a worker process."
+    return [extract_text(path, max_size) for path in paths]
+
+
+def eligible_filter(alias="files"):
+    "WHERE clause and parameters selecting the files whose content is indexed."
+    extensions = content_extensions()
+    clause = (
+        f"{alias}.size > 0 AND {alias}.size <= ? AND {alias}.extension IN "
+        f"({', '.join('?' * len(extensions))})"
+    )
+    return clause, [content_max_size(), *extensions]
+
+
+def stale_files(cursor):
+    """
+    Files of the attached shard whose content is missing or outdated, and
+    ids of the extracted files that are no longer indexed.
+    """
+    clause, params = eligible_filter("f")
+    cursor.execute(
+        f"""SELECT f.filepath, f.size, f.modified FROM shard.files f
+        LEFT JOIN content_state c ON c.filepath = f.filepath
+        WHERE {clause} AND (c.id IS NULL OR c.size != f.size
+            OR c.modified != f.modified)""",
+        params,
+    )
+    changed = cursor.fetchall()
+    cursor.execute(
+        f"""SELECT c.id FROM content_state c WHERE NOT EXISTS (
+            SELECT 1 FROM shard.files f WHERE f.filepath = c.filepath AND {clause})""",
+        params,
+    )
+    removed = [row_id for row_id, in cursor.fetchall()]
+    return changed, removed
+
+
+def store(cursor, filepath, size, modified, text):
+    "Replace the extracted content of a file."
+    cursor.execute("SELECT id FROM content_state WHERE filepath = ?", [filepath])
+    found = cursor.fetchone()
+    if found is None:
+        cursor.execute(
+            "INSERT INTO content_state(filepath, size, modified) VALUES (?, ?, ?)",
+            [filepath, size, modified],
+        )
+        row_id = cursor.lastrowid
+    else:
+        row_id = found[0]
+        cursor.execute(
+            "UPDATE content_state SET size = ?, modified = ? WHERE id = ?",
+            [size, modified, row_id],
+        )
+        cursor.execute("DELETE FROM content WHERE rowid = ?", [row_id])
+    # binary files keep their state so they aren't looked at again
+    if text:
+        cursor.execute("INSERT INTO content(rowid, body) VALUES (?, ?)", [row_id, text])
+
+
+def remove(cursor, row_ids):
+    "Forget the content of files that are no longer indexed."
+    params = [(row_id,) for row_id in row_ids]
+    cursor.executemany("DELETE FROM content WHERE rowid = ?", params)
+    cursor.executemany("DELETE FROM content_state WHERE id = ?", params)
+
+
+@metrics.profile("content")
+def update_index(roots=None, max_workers=MAX_WORKERS, initializer=None):
+    """
+    Bring the content databases of the given included directories, all of
+    them by default, up to date with their shards. `initializer` runs in
+    every worker process. Returns the number of files extracted.
+    """
+    extracted = 0
+    for root in included_directories() if roots is None else roots:
+        shard = db.shard_path(root)
+        if not os.path.exists(shard):
+            continue
+        conn = sqlite3.connect(content_path(root))
+        cursor = conn.cursor()
+        create_content_schema(cursor)
+        cursor.execute("ATTACH DATABASE ? AS shard", [shard])
+        with metrics.timer("content.compare"):
+            changed, removed = stale_files(cursor)
+        remove(cursor, removed)
+        conn.commit()
+        metrics.count("content.removed", len(removed))
+        if changed:
+            LOGGER.info(f"Extracting the content of {len(changed)} files in '{root}'")
+            extracted += extract_into(conn, changed, max_workers, initializer)
+        conn.close()
+    return extracted
+
+
+def extract_into(conn, files, max_workers, initializer=None):
+    "Extract `(filepath, size, modified)` files in a process pool and store them."
+    cursor = conn.cursor()
+    chunks = [files[i : i + CHUNK_SIZE] for i in range(0, len(files), CHUNK_SIZE)]
+    paths = ([path for path, _, _ in chunk] for chunk in chunks)
+    # forking a process with GUI threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    workers = max(1, min(max_workers, os.cpu_count() or 1, len(chunks)))
+    with concurrent.futures.ProcessPoolExecutor(workers, context, initializer) as pool:
+        texts = pool.map(_extract_chunk, paths, repeat(content_max_size()))
+        for chunk, chunk_texts in zip(chunks, texts):
+            with metrics.timer("content.store"):
+                for (filepath, size, modified), text in zip(chunk, chunk_texts):
+                    store(cursor, filepath, size, modified, text)
+                # committed per chunk, an interrupted run keeps its progress
+                conn.commit()
+            metrics.count("content.extracted", len(chunk))
+    return len(files)
+
+
+def update_file(filepath):
+    """
+    Apply a change of a single file reported by the monitor, extracted
+    in-process since it is just one.
+    """
+    update_files([filepath])
+
+
+def update_files(filepaths):
+    """
+    Apply changes of a few files, extracted in-process, with one transaction
+    per content database.
+    """
+    by_root = {}
+    for filepath in filepaths:
+        root = db.shard_root(filepath)
+        if root is not None and os.path.exists(db.shard_path(root)):
+            by_root.setdefault(root, []).append(filepath)
+    for root, paths in by_root.items():
+        conn = sqlite3.connect(content_path(root))
+        cursor = conn.cursor()
+        create_content_schema(cursor)
+        for filepath in paths:
+            update_state(cursor, filepath)
+        conn.commit()
+        conn.close()
+
+
+def update_state(cursor, filepath):
+    "Extract or forget the content of a file depending on its current state."
+    extension = db.file_extension(os.path.basename(filepath))
+    try:
+        info = os.stat(filepath)
+    except OSError:
+        info = None
+    cursor.execute(
+        "SELECT id, size, modified FROM content_state WHERE filepath = ?", [filepath]
+    )
+    state = cursor.fetchone()
+    if (
+        info is None
+        or not 0 < info.st_size <= content_max_size()
+        or extension not in content_extensions()
+    ):
+        if state is not None:
+            remove(cursor, [state[0]])
+    elif state is None or state[1:] != (info.st_size, int(info.st_mtime)):
+        text = extract_text(filepath, content_max_size())
+        store(cursor, filepath, info.st_size, int(info.st_mtime), text)
+        metrics.count("content.extracted")
+
+
+def is_content_query(pattern):
+    "Check if the searchbar text asks for a content search."
+    return pattern.lstrip().startswith(PREFIX)
+
+
+def fts_query(pattern):
+    """
+    FTS5 query of the searchbar text after the prefix: every word has to
+    occur, the last one may be incomplete. Words are quoted so user input
+    is never parsed as query syntax.
+    """
+    words = pattern.lstrip()[len(PREFIX) :].split()
+    quoted = ['"' + word.replace('"', '""') + '"' for word in words]
+    if quoted:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def fetch_page(cursor, query, params, after, size):
+    """
+    One page of the files matching an FTS query that are ranked after the
+    sort key `after`. Same signature as `database.fetch_page`, there are
+    no further parameters.
+    """
+    cursor.execute(
+        """SELECT c.filepath, c.size, c.modified, m.score, m.id FROM (
+            SELECT rowid AS id, bm25(content) AS score FROM content
+            WHERE content MATCH ?) m
+        JOIN content_state c ON c.id = m.id
+        WHERE (m.score, m.id) > (?, ?)
+        ORDER BY m.score, m.id LIMIT ?""",
+        [query, *params, *after, size],
+    )
+    return [
+        (os.path.basename(path), path, size, modified, score, row_id)
+        for path, size, modified, score, row_id in cursor.fetchall()
+    ]
+
+
+def search(pattern, limit=None):
+    """
+    Generator over the files whose content matches a `content:` search,
+    best matches first, in the row format of `database.search`.
+    """
+    metrics.count("search.content_queries")
+    query = fts_query(pattern)
+    if not query:
+        return
+    conns = []
+    try:
+        streams = []
+        for root in included_directories():
+            path = content_path(root)
+            if not os.path.exists(path):
+                continue
+            conn = storage.connect(path)
+            conns.append(conn)
+            fetch = partial(fetch_page, conn.cursor())
+            # bm25 scores are negative, lower is better
+            start = (float("-inf"), 0)
+            streams.append(db.shard_pages(fetch, query, (), limit, start))
+        yield from db.merge_results(streams, limit)
+    finally:
+        for conn in conns:
+            conn.close()
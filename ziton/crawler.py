@@ -0,0 +1,421 @@
+"""
+Mount aware parallel filesystem crawler.
+
+Every mount below the included directories gets its own pool of worker
+threads, so a slow network share only ever occupies its own workers while
+local disks are crawled at full speed. A worker that doesn't return from a
+filesystem call within the mount's timeout marks the whole mount as stuck:
+its remaining directories are skipped and the mount is reported as partial
+instead of hanging the rebuild.
+
+Worker threads are daemon threads, a call blocked forever in the kernel
+doesn't keep the process alive.
+"""
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+from . import metrics
+from .exclude import matcher_below
+
+LOGGER = logging.getLogger(__name__)
+
+# filesystem types that get the conservative network defaults
+NETWORK_FILESYSTEMS = frozenset(
+    (
+        "nfs",
+        "nfs4",
+        "cifs",
+        "smb3",
+        "smbfs",
+        "ncpfs",
+        "9p",
+        "afs",
+        "ceph",
+        "glusterfs",
+        "lustre",
+        "davfs",
+        "fuse.sshfs",
+        "fuse.rclone",
+        "fuse.s3fs",
+    )
+)
+# seconds between two checks for stuck workers
+POLL_INTERVAL = 0.5
+
+
+@dataclass
+class MountPolicy:
+    """Crawler limits of a single mount."""
+
+    # worker threads listing directories of the mount concurrently
+    workers: int = 4
+    # seconds a single filesystem call may take before the mount counts as stuck
+    timeout: float = 30.0
+
+
+LOCAL_POLICY = MountPolicy()
+NETWORK_POLICY = MountPolicy(workers=2, timeout=10.0)
+
+
+def _unescape(field):
+    "Decode the octal escapes of /proc/self/mounts, e.g. `\\040` for a space."
+    if "\\" not in field:
+        return field
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == "\\" and field[i + 1 : i + 4].isdigit():
+            out.append(chr(int(field[i + 1 : i + 4], 8)))
+            i += 4
+        else:
+            out.append(field[i])
+            i += 1
+    return "".join(out)
+
+
+def mount_table(path="/proc/self/mounts"):
+    "Map of mount points to filesystem types, only `/` if unknown."
+    mounts = {"/": ""}
+    try:
+        with open(path, "r") as infile:
+            for line in infile:
+                fields = line.split()
+                if len(fields) >= 3:
+                    mounts[_unescape(fields[1])] = fields[2]
+    except OSError:
+        LOGGER.info("mount table unavailable, treating everything as one mount")
+    return mounts
+
+
+def mount_point(path, mounts):
+    "Mount point of the filesystem a path lies on."
+    while path not in mounts:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return "/"
+        path = parent
+    return path
+
+
+def mount_policies(mounts, options):
+    "Policy per mount point, defaults by filesystem type overridden by config."
+    policies = {}
+    for point, fstype in mounts.items():
+        default = NETWORK_POLICY if fstype in NETWORK_FILESYSTEMS else LOCAL_POLICY
+        override = options.get(point, {})
+        policies[point] = MountPolicy(
+            workers=max(int(override.get("workers", default.workers)), 1),
+            timeout=float(override.get("timeout", default.timeout)),
+        )
+    return policies
+
+
+class _Job:
+    """A directory listing queued on a mount pool."""
+
+    __slots__ = ("func", "args", "future", "heartbeat")
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.future = concurrent.futures.Future()
+        self.heartbeat = None
+
+    def beat(self):
+        "Record progress, called after every filesystem call."
+        self.heartbeat = time.monotonic()
+
+
+class MountPool:
+    """Bounded set of daemon worker threads serving a single mount."""
+
+    def __init__(self, point, policy, initializer=None):
+        self.point = point
+        self.policy = policy
+        self.initializer = initializer
+        self.jobs = queue.Queue()
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stuck = False
+        self.threads = []
+
+    def submit(self, func, *args):
+        "Queue `func(job, *args)`, returns its future."
+        job = _Job(func, args)
+        self.jobs.put(job)
+        # workers are started lazily, most mounts are never visited
+        if len(self.threads) < self.policy.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"crawl {self.point}", daemon=True
+            )
+            self.threads.append(thread)
+            thread.start()
+        return job.future
+
+    def _work(self):
+        if self.initializer is not None:
+            self.initializer()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            job.beat()
+            with self.lock:
+                self.running.add(job)
+            try:
+                job.future.set_result(job.func(job, *job.args))
+            except BaseException as err:  # pylint: disable=broad-except
+                job.future.set_exception(err)
+            finally:
+                with self.lock:
+                    self.running.discard(job)
+
+    def stalled(self, now):
+        "Check if a running job hasn't made progress within the timeout."
+        with self.lock:
+            running = list(self.running)
+        return any(now - job.heartbeat > self.policy.timeout for job in running)
+
+    def shutdown(self):
+        "Cancel queued jobs and let idle workers exit."
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.future.cancel()
+        for _ in self.threads:
+            self.jobs.put(None)
+
+
+def storable(path):
+    """
+    Check if a path can be stored in the index. Names that aren't valid
+    UTF-8 are decoded with surrogate escapes, which SQLite can't encode.
+    """
+    try:
+        path.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _list_directory(job, directory, crawler, matcher, include_self, descend=True):
+    """
+    List a single directory. Returns its entries as
+    `(name, path, is_dir, size, modified)` tuples and the subdirectories to
+    descend into as `(path, matcher)` tuples.
+    """
+    entries = []
+    if include_self:
+        # mount points are stat'ed by their own mount's workers
+        crawler.wait(job)
+        info = os.stat(directory)
+        job.beat()
+        entries.append(
+            (os.path.basename(directory), directory, True, 0, int(info.st_mtime))
+        )
+    if not descend:
+        return entries, []
+    crawler.wait(job)
+    with metrics.timer("crawl.listing"):
+        try:
+            with os.scandir(directory) as listing:
+                children = list(listing)
+        except OSError:
+            # like os.walk, unreadable directories are skipped silently
+            return entries, []
+    job.beat()
+    names = [child.name for child in children]
+    local = matcher.child(directory, names)
+    subdirs = []
+    with metrics.timer("crawl.stat"):
+        for child in children:
+            name = child.name
+            if not crawler.check_hidden and name[0] == ".":
+                continue
+            try:
+                is_dir = child.is_dir()
+            except OSError:
+                is_dir = False
+            path = child.path
+            if not storable(path):
+                LOGGER.warning(f"skipping {path!r}, its name is not valid UTF-8")
+                continue
+            if local.excluded(path, is_dir):
+                continue
+            if is_dir and not child.is_symlink():
+                subdirs.append((path, local))
+                if path in crawler.mounts:
+                    # left to the mount's own pool, which might be stuck
+                    continue
+            crawler.wait(job)
+            try:
+                info = os.stat(path)
+                if child.is_symlink():
+                    # a link takes up its own size, not the one of its target
+                    info = os.lstat(path)
+            except OSError:
+                # dangling symlinks and files deleted in the meantime
+                continue
+            finally:
+                job.beat()
+            size = 0 if is_dir else int(info.st_size)
+            entries.append((name, path, is_dir, size, int(info.st_mtime)))
+    metrics.count("crawl.directories")
+    return entries, subdirs
+
+
+class Crawler:
+    """
+    Crawls directory trees with one worker pool per mount.
+
+    `partial` maps the mount points that stopped responding to a
+    description, filled in while `crawl` runs. `throttle(timeout)` is asked
+    for permission before every filesystem call and returns False if it
+    wasn't granted within the timeout, `initializer` runs on every new
+    worker thread.
+    """
+
+    def __init__(
+        self,
+        check_hidden,
+        matcher,
+        one_filesystem=False,
+        options=None,
+        throttle=None,
+        initializer=None,
+    ):
+        self.check_hidden = check_hidden
+        self.matcher = matcher
+        self.one_filesystem = one_filesystem
+        self.throttle = throttle
+        self.initializer = initializer
+        self.mounts = mount_table()
+        self.policies = mount_policies(self.mounts, options or {})
+        self.pools = {}
+        self.partial = {}
+        self.roots = set()
+        self.prune = None
+
+    def _pool(self, point):
+        pool = self.pools.get(point)
+        if pool is None:
+            pool = self.pools[point] = MountPool(
+                point, self.policies[point], self.initializer
+            )
+        return pool
+
+    def wait(self, job):
+        "Block until the throttle allows the next filesystem call of a job."
+        if self.throttle is not None:
+            # waiting is not a stuck mount
+            while not self.throttle(POLL_INTERVAL):
+                job.beat()
+            job.beat()
+
+    def crawl(self, directories, prune=None, resume=None):
+        """
+        Generator over `(directory, entries, subdirectories)` per listed
+        directory, in no particular order. The included directories
+        themselves are not part of the entries. Directories nested in another
+        one are only crawled once, as their own tree. Subdirectories for
+        which `prune(path)` is true are listed but not descended into.
+
+        `resume` maps included directories to the directories below them
+        that are still to be listed, as saved by an interrupted crawl. Those
+        are crawled instead of the included directory itself.
+        """
+        pending = {}
+        resume = resume or {}
+        self.prune = prune
+        self.roots = {os.path.abspath(d) for d in directories}
+        for directory in self.roots:
+            point = mount_point(directory, self.mounts)
+            if directory not in resume:
+                future = self._pool(point).submit(
+                    _list_directory, directory, self, self.matcher, False
+                )
+                pending[future] = (point, directory)
+                continue
+            cache = {}
+            for path in resume[directory]:
+                matcher = matcher_below(self.matcher, directory, path, cache)
+                child = self._descend(mount_point(path, self.mounts), path, matcher)
+                if child is not None:
+                    pending[child[0]] = child[1:]
+        try:
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending,
+                    timeout=POLL_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    point, directory = pending.pop(future)
+                    if future.cancelled():
+                        continue
+                    try:
+                        entries, subdirs = future.result()
+                    except OSError as err:
+                        LOGGER.warning(f"could not list '{directory}': {err}")
+                        continue
+                    queued = []
+                    for path, matcher in subdirs:
+                        child = self._descend(point, path, matcher)
+                        if child is not None:
+                            pending[child[0]] = child[1:]
+                            queued.append(path)
+                    yield directory, entries, queued
+                self._check_stuck(pending)
+        finally:
+            for pool in self.pools.values():
+                pool.shutdown()
+
+    def _descend(self, point, path, matcher):
+        "Queue a subdirectory on the pool of its mount."
+        if path in self.roots:
+            return None
+        pruned = self.prune is not None and self.prune(path)
+        if path not in self.mounts:
+            if pruned:
+                return None
+            future = self._pool(point).submit(
+                _list_directory, path, self, matcher, False
+            )
+            return future, point, path
+        # a mount point, its directory entry was left to the new mount
+        if self._pool(path).stuck:
+            return None
+        metrics.count("crawl.mounts")
+        descend = not (self.one_filesystem or pruned)
+        future = self._pool(path).submit(
+            _list_directory, path, self, matcher, True, descend
+        )
+        return future, path, path
+
+    def _check_stuck(self, pending):
+        "Give up on mounts whose workers stopped making progress."
+        now = time.monotonic()
+        for point, pool in self.pools.items():
+            if pool.stuck or not pool.stalled(now):
+                continue
+            pool.stuck = True
+            skipped = [f for f, (p, _) in pending.items() if p == point]
+            for future in skipped:
+                del pending[future]
+            pool.shutdown()
+            reason = (
+                f"no response within {pool.policy.timeout:g}s, "
+                f"{len(skipped)} directories skipped"
+            )
+            self.partial[point] = reason
+            metrics.count("crawl.partial_mounts")
+            LOGGER.warning(f"mount '{point}' is only partially indexed: {reason}")
@@ -0,0 +1,368 @@
+"""
+Headless search daemon.
+
+Owns the crawler, the filesystem monitor and an in-memory copy of the index
+and answers queries over a unix domain socket, so the GUI, the command line
+client and scripts can share one hot index.
+
+Protocol: every message is a single line of JSON in both directions.
+
+    -> {"id": 1, "op": "search", "query": "foo ext:py", "limit": 100}
+    <- {"id": 1, "rows": [[filename, filepath, size, modified], ...]}
+    <- {"id": 1, "done": true, "count": 42}
+    -> {"id": 1, "op": "cancel"}
+
+Further operations are `count`, `reindex`, `metrics` and `ping`, and
+`reload` with an optional list of `roots` whose shards were changed on disk
+by another process. Failed requests are answered with
+{"id": ..., "error": "..."}.
+"""
+import json
+import logging
+import os
+import signal
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from functools import partial
+from . import client
+from . import config as cfg
+from . import database as db
+from . import content, metrics, scheduler
+from .exclude import matcher_for
+from .watch import CREATED, DELETED, MODIFIED, event_name, queued_events
+
+LOGGER = logging.getLogger(__name__)
+
+# rows sent per message while streaming search results
+BATCH_SIZE = 256
+# concurrently running searches per client connection
+MAX_QUERIES = 4
+
+
+class Index:
+    """In-memory copies of the shards that are kept in sync with the disk."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shards = {root: self.load(root) for root in cfg.included_directories()}
+        self.rebuilding = threading.Lock()
+        self.index_content = cfg.content_index_enabled()
+
+    def load(self, root):
+        "Copy the shard of an included directory into a new in-memory database."
+        memory = sqlite3.connect(":memory:", check_same_thread=False)
+        path = db.shard_path(root)
+        if os.path.exists(path):
+            disk = sqlite3.connect(path)
+            disk.backup(memory)
+            disk.close()
+            # changes are applied to both copies, only the disk keeps a log
+            memory.execute("DROP TRIGGER IF EXISTS files_log_insert")
+            memory.execute("DROP TRIGGER IF EXISTS files_log_delete")
+            # the unfinished tables of an interrupted rebuild
+            memory.execute("DROP TABLE IF EXISTS files_new")
+            memory.execute("DROP TABLE IF EXISTS rollups_new")
+        else:
+            db.create_shard_schema(memory.cursor())
+        return memory
+
+    def search(self, pattern, limit=None):
+        "Generator over the matching entries, see `database.search`."
+        if content.is_content_query(pattern):
+            # the content index is only kept on disk
+            return content.search(pattern, limit)
+        with self.lock:
+            conns = list(self.shards.values())
+
+        def fetcher(conn):
+            def fetch(where, params, after, size):
+                with self.lock:
+                    return db.fetch_page(conn.cursor(), where, params, after, size)
+
+            return fetch
+
+        return db.paged_search([fetcher(conn) for conn in conns], pattern, limit)
+
+    def count(self):
+        "Number of entries in the index."
+        total = 0
+        with self.lock:
+            for conn in self.shards.values():
+                cursor = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'entry_count'"
+                )
+                total += cursor.fetchone()[0]
+        return total
+
+    def apply(self, filepath, change):
+        """
+        Apply `change(cursor, filepath, root)` to the in-memory shard holding
+        the given path, the same change that was applied on disk.
+        """
+        with self.lock:
+            root = db.shard_root(filepath, self.shards)
+            if root is not None:
+                conn = self.shards[root]
+                change(conn.cursor(), filepath, root)
+                conn.commit()
+
+    def file_created(self, filepath):
+        """
+        Add a new file to the database and the in-memory index. Directories
+        are added with their subtree, the monitor doesn't report the
+        contents of a directory that was moved in.
+        """
+        if not os.path.exists(filepath):
+            return
+        if os.path.isdir(filepath) and not os.path.islink(filepath):
+            self.apply(filepath, db.insert_subtree(filepath))
+        else:
+            entry = db.insert_record(filepath)
+            self.apply(filepath, partial(db.add_entry, entry=entry))
+        if self.index_content:
+            content.update_file(filepath)
+
+    def file_modified(self, filepath):
+        "Update a file that was written in place in both indexes."
+        if not os.path.exists(filepath):
+            return
+        entry = db.update_record(filepath)
+        self.apply(filepath, partial(db.update_entry, entry=entry))
+        if self.index_content:
+            content.update_file(filepath)
+
+    def file_deleted(self, filepath):
+        "Remove a file, or a directory with its subtree, from both indexes."
+        db.delete_record(filepath)
+        self.apply(filepath, db.remove_entry)
+        if self.index_content:
+            content.update_file(filepath)
+
+    def rebuild(self, roots=None):
+        """
+        Rebuild the shards of the given included directories, all of them by
+        default, and reload their in-memory copies.
+        """
+        if not self.rebuilding.acquire(blocking=False):
+            LOGGER.info("Rebuild already in progress.")
+            return
+        try:
+            db.build_database(roots)
+            included = cfg.included_directories()
+            reload = included if roots is None else roots
+            memory = {root: self.load(root) for root in reload}
+            with self.lock:
+                old = self.shards
+                self.shards = {
+                    root: memory[root] if root in memory else old[root]
+                    for root in included
+                    if root in memory or root in old
+                }
+            for root, conn in old.items():
+                if self.shards.get(root) is not conn:
+                    conn.close()
+            if self.index_content:
+                content.update_index(roots)
+        finally:
+            self.rebuilding.release()
+
+    def reload(self, root):
+        "Replace the in-memory copy of a shard that was changed on disk."
+        memory = self.load(root)
+        with self.lock:
+            old = self.shards.get(root)
+            self.shards[root] = memory
+        if old is not None:
+            old.close()
+
+    def rebuild_async(self, roots=None):
+        "Run `rebuild` in a background thread."
+        threading.Thread(target=self.rebuild, args=(roots,), daemon=True).start()
+
+    def watch(self):
+        "Apply inotify events to the index, blocks forever."
+        directories = cfg.included_directories()
+        events = queued_events(directories, matcher=matcher_for())
+        try:
+            for command, filepath in events:
+                self.apply_event(command, filepath)
+        except (OSError, subprocess.SubprocessError) as err:
+            LOGGER.error(f"file monitoring stopped: {err}")
+
+    def apply_event(self, command, filepath):
+        "Apply a single inotify event to the index."
+        name = event_name(command)
+        try:
+            with metrics.timer("monitor.apply"):
+                if name in CREATED:
+                    self.file_created(filepath)
+                elif name in DELETED:
+                    self.file_deleted(filepath)
+                elif name in MODIFIED:
+                    self.file_modified(filepath)
+        except (OSError, sqlite3.Error) as err:
+            LOGGER.error(f"could not apply {command} {filepath}: {err}")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Serves the requests of one client connection."""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.queries = {}
+        self.slots = threading.BoundedSemaphore(MAX_QUERIES)
+
+    def send(self, message):
+        "Write a single message, blocks while the client is not reading."
+        data = json.dumps(message, separators=(",", ":")).encode() + b"\n"
+        with self.write_lock:
+            self.wfile.write(data)
+
+    def handle(self):
+        "Read requests until the client disconnects."
+        try:
+            for line in self.rfile:
+                self.dispatch(line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # stop all searches of a client that went away
+            for cancelled in list(self.queries.values()):
+                cancelled.set()
+
+    def dispatch(self, line):
+        "Answer a single request."
+        try:
+            request = json.loads(line)
+            op = request["op"]
+            request_id = request.get("id")
+        except (ValueError, KeyError, TypeError):
+            self.send({"id": None, "error": "malformed request"})
+            return
+        index = self.server.index
+        if op == "search":
+            cancelled = threading.Event()
+            self.queries[request_id] = cancelled
+            threading.Thread(
+                target=self.run_search, args=(request, cancelled), daemon=True
+            ).start()
+        elif op == "cancel":
+            cancelled = self.queries.get(request_id)
+            if cancelled is not None:
+                cancelled.set()
+        elif op == "count":
+            self.send({"id": request_id, "count": index.count()})
+        elif op == "reindex":
+            index.rebuild_async()
+            self.send({"id": request_id, "done": True})
+        elif op == "reload":
+            included = cfg.included_directories()
+            for root in request.get("roots") or included:
+                if root in included:
+                    index.reload(root)
+            self.send({"id": request_id, "done": True})
+        elif op == "metrics":
+            self.send({"id": request_id, "metrics": metrics.snapshot()})
+        elif op == "ping":
+            self.send({"id": request_id, "done": True})
+        else:
+            self.send({"id": request_id, "error": f"unknown operation '{op}'"})
+
+    def run_search(self, request, cancelled):
+        "Stream the results of a search request in batches."
+        request_id = request.get("id")
+        count = 0
+        # waited for here, so the connection keeps reading requests, e.g. the
+        # cancellation of searches blocked on a slow client
+        self.slots.acquire()
+        start = time.perf_counter()
+        scheduler.notify_search()
+        try:
+            if cancelled.is_set():
+                return
+            batch = []
+            results = self.server.index.search(
+                request.get("query", ""), request.get("limit")
+            )
+            for row in results:
+                if cancelled.is_set():
+                    return
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    self.send({"id": request_id, "rows": batch})
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.send({"id": request_id, "rows": batch})
+                count += len(batch)
+            self.send({"id": request_id, "done": True, "count": count})
+            metrics.observe("daemon.search", time.perf_counter() - start)
+        except sqlite3.Error as err:
+            self.send({"id": request_id, "error": str(err)})
+        except (OSError, ValueError):
+            # client disconnected
+            pass
+        finally:
+            self.queries.pop(request_id, None)
+            self.slots.release()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded unix socket server, one thread per client."""
+
+    daemon_threads = True
+
+    def __init__(self, path, index):
+        self.index = index
+        super().__init__(path, RequestHandler)
+
+
+def serve():
+    "Run the daemon until it is interrupted."
+    cfg.validate_config_file()
+    metrics.enable(cfg.metrics_enabled(), cfg.profile_mode())
+    if client.daemon_running():
+        LOGGER.error("Another daemon is already running.")
+        return
+    rebuild = db.validate_database() + db.interrupted_builds()
+    index = Index()
+    if cfg.start_updated_enabled():
+        index.rebuild_async()
+    elif rebuild:
+        index.rebuild_async(rebuild)
+    if index.index_content:
+        # catch up on files changed while the daemon wasn't running
+        threading.Thread(target=content.update_index, daemon=True).start()
+    if cfg.is_indexing_enabled():
+        threading.Thread(target=index.watch, daemon=True).start()
+    if cfg.reindex_interval():
+        scheduler.Scheduler(on_change=index.reload).start()
+
+    path = cfg.socket_path()
+    if os.path.exists(path):
+        os.remove(path)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    with Server(path, index) as server:
+        os.chmod(path, 0o600)
+        LOGGER.info(f"Listening on '{path}'")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+def main():
+    "daemon entrypoint."
+    logging.basicConfig(level=logging.INFO)
+    serve()
+
+
+if __name__ == "__main__":
+    main()
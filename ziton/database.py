@@ -3,19 +3,45 @@ Sqlite Database API for the application.
 Provides functionality to rebuild and interact with the database.
 """
 
+import hashlib
+import heapq
 import logging
 import os
 import pathlib
+import queue
 import sqlite3
+import stat
+import threading
 import time
-from dataclasses import dataclass
+import unicodedata
+from dataclasses import astuple, dataclass
+from functools import partial
+from itertools import islice
+from operator import itemgetter
 
+from . import exclude, metrics, snapshot, storage
 from .config import (database_path, excluded_files, hidden_files_enabled,
-                     included_directories)
+                     ignore_files_enabled, included_directories, mount_options,
+                     one_filesystem_enabled)
+from .crawler import Crawler, storable
 
-logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
+# bumped whenever the layout of the `files` table changes, older databases
+# are rebuilt on startup
+SCHEMA_VERSION = 8
+# number of rows fetched per query while streaming search results
+PAGE_SIZE = 1000
+# crawled directories buffered per shard while it is being written
+WRITE_QUEUE_SIZE = 1000
+# changes since the snapshot that are still laid over it, larger changelogs
+# are searched in the database until the snapshot is rewritten
+MAX_OVERLAY = 50000
+# seconds between two checkpoints of a running rebuild
+CHECKPOINT_INTERVAL = 2.0
+# seconds between two progress reports of a running rebuild
+PROGRESS_INTERVAL = 1.0
+
 
 @dataclass
 class DatabaseEntry:
@@ -25,92 +51,1144 @@ class DatabaseEntry:
     filepath: str
     size: int
     modified: int
+    search_key: str
+    extension: str
+    is_dir: int
+
+
+def normalize_name(name):
+    """Case- and accent-insensitive search key for a filename."""
+    if name.isascii():
+        return name.lower()
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return unicodedata.normalize("NFC", stripped.casefold())
+
+
+def file_extension(name):
+    """Lowercase extension of a filename without the leading dot."""
+    return os.path.splitext(name)[1][1:].casefold()
+
+
+def create_indexes(cursor, table="files"):
+    """Create the lookup indexes of the `files` table."""
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_files_search_key ON {table}(search_key)"
+    )
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_files_extension ON {table}(extension)"
+    )
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_files_filepath ON {table}(filepath)"
+    )
+    # walked largest first by searches ordered by size
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_files_size ON {table}(size)")
+
+
+def create_table(cursor, table="files"):
+    """Create an empty table with the layout of the `files` table."""
+    cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {table}(filename TEXT, filepath TEXT,
+            size INT, modified INT, search_key TEXT, extension TEXT, is_dir INT);"""
+    )
+
+
+def create_rollup_table(cursor, table="rollups"):
+    """
+    Create a table of directory rollups: total bytes and number of files
+    below a directory, the newest modification time in its subtree and the
+    bytes and number of the files directly inside it.
+    """
+    cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {table}(filepath TEXT PRIMARY KEY,
+            bytes INT, files INT, newest INT, own_bytes INT, own_files INT)"""
+    )
+
+
+def create_triggers(cursor):
+    """
+    Keep the cached entry count in the `meta` table up to date and record
+    every change in the changelog that is laid over the snapshot.
+    """
+    cursor.execute(
+        """CREATE TRIGGER IF NOT EXISTS files_count_insert AFTER INSERT ON files
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'entry_count';
+        END"""
+    )
+    cursor.execute(
+        """CREATE TRIGGER IF NOT EXISTS files_count_delete AFTER DELETE ON files
+        BEGIN
+            UPDATE meta SET value = value - 1 WHERE key = 'entry_count';
+        END"""
+    )
+    cursor.execute(
+        """CREATE TRIGGER IF NOT EXISTS files_log_insert AFTER INSERT ON files
+        BEGIN
+            INSERT INTO changelog(op, filename, filepath, size, modified,
+                search_key, extension)
+            VALUES (1, new.filename, new.filepath, new.size, new.modified,
+                new.search_key, new.extension);
+        END"""
+    )
+    cursor.execute(
+        """CREATE TRIGGER IF NOT EXISTS files_log_delete AFTER DELETE ON files
+        BEGIN
+            INSERT INTO changelog(op, filepath) VALUES (0, old.filepath);
+        END"""
+    )
+
+
+def create_schema(cursor):
+    """Create all tables of an empty main database, which holds the bookmarks."""
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS bookmarks(
+        filename TEXT,
+        filepath TEXT,
+        UNIQUE(filename, filepath))"""
+    )
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def create_shard_schema(cursor):
+    """Create all tables of an empty shard, which holds the entries of one root."""
+    # only takes effect before the first table is created
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value INT)")
+    cursor.execute("INSERT OR IGNORE INTO meta VALUES ('entry_count', 0)")
+    cursor.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS changelog(seq INTEGER PRIMARY KEY, op INT,
+            filename TEXT, filepath TEXT, size INT, modified INT,
+            search_key TEXT, extension TEXT)"""
+    )
+    # directories still to be listed by an interrupted rebuild
+    cursor.execute("CREATE TABLE IF NOT EXISTS frontier(path TEXT PRIMARY KEY)")
+    create_rollup_table(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rollups_bytes ON rollups(bytes)")
+    create_table(cursor)
+    create_indexes(cursor)
+    create_triggers(cursor)
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def shard_directory():
+    "Directory of the shard files, next to the main database."
+    return os.path.join(os.path.dirname(database_path()), "shards")
+
+
+def shard_path(root):
+    "Database file holding the entries below an included directory."
+    key = os.path.abspath(root).encode("utf-8", "surrogateescape")
+    return os.path.join(shard_directory(), hashlib.sha1(key).hexdigest()[:16] + ".db")
+
+
+def shard_paths():
+    "Shard files of the included directories that have been created."
+    paths = (shard_path(root) for root in included_directories())
+    return [path for path in paths if os.path.exists(path)]
+
+
+def shard_root(filepath, roots=None):
+    """
+    Included directory whose shard holds the given path, the innermost one
+    if directories are nested. None if the path isn't indexed at all.
+    """
+    found, length = None, -1
+    for root in included_directories() if roots is None else roots:
+        absolute = os.path.abspath(root)
+        if filepath == absolute or filepath.startswith(os.path.join(absolute, "")):
+            if len(absolute) > length:
+                found, length = root, len(absolute)
+    return found
+
+
+def changed_shards(added, removed):
+    """
+    Included directories whose shards have to be rebuilt after some were
+    added or removed: the added ones and the innermost included directory
+    around any of them, whose shard gains or loses the nested tree.
+    """
+    included = included_directories()
+    roots = list(added)
+    for directory in list(added) + list(removed):
+        absolute = os.path.abspath(directory)
+        others = [root for root in included if os.path.abspath(root) != absolute]
+        enclosing = shard_root(absolute, others)
+        if enclosing is not None and enclosing not in roots:
+            roots.append(enclosing)
+    return roots
+
+
+def snapshot_path(shard):
+    "Memory-mapped snapshot belonging to a shard file."
+    return shard + ".snap"
+
+
+def remove_shard(root):
+    "Delete the shard of a directory that is no longer included."
+    directory, name = os.path.split(shard_path(root))
+    if not os.path.isdir(directory):
+        return
+    # the shard, its write-ahead log, its snapshot and its content index
+    key = name.split(".")[0]
+    for name in os.listdir(directory):
+        if name.split(".")[0] == key:
+            os.remove(os.path.join(directory, name))
+    LOGGER.info(f"Removed shard of '{root}'")
+
+
+def remove_stale_shards():
+    "Delete the shards of all directories that are no longer included."
+    directory = shard_directory()
+    if not os.path.isdir(directory):
+        return
+    keep = {
+        os.path.basename(shard_path(root)).split(".")[0]
+        for root in included_directories()
+    }
+    for name in os.listdir(directory):
+        # all files of a shard start with its key
+        if name.split(".")[0] not in keep:
+            os.remove(os.path.join(directory, name))
+
+
+def escape_like(text):
+    """Escape LIKE wildcards so text is matched literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def parse_pattern(pattern):
+    """
+    Split the searchbar text into normalized terms that must all be part of
+    the search key, and the extension filters given as `ext:pdf,txt`.
+    """
+    terms = []
+    filters = []
+    for term in pattern.split():
+        if term.startswith("ext:"):
+            extensions = [e.lstrip(".").casefold() for e in term[4:].split(",") if e]
+            if extensions:
+                filters.append(extensions)
+        else:
+            terms.append(normalize_name(term))
+    return terms, filters
+
+
+def build_filter(pattern):
+    """
+    Translate the searchbar text into a WHERE clause and its parameters.
+    Terms are matched against the normalized search key, `ext:pdf,txt`
+    restricts results to the given extensions.
+    """
+    clauses = []
+    params = []
+    terms, filters = parse_pattern(pattern)
+    for extensions in filters:
+        clauses.append("extension IN ({})".format(", ".join("?" * len(extensions))))
+        params.extend(extensions)
+    # substrings match few names, which the statistics of the planner can't
+    # tell, otherwise it walks the whole index of the sort order instead of
+    # the matches of an extension
+    for term in terms:
+        clauses.append("unlikely(search_key LIKE ? ESCAPE '\\')")
+        params.append(f"%{escape_like(term)}%")
+    return " AND ".join(clauses) or "1", params
+
+
+def fetch_page(cursor, where, params, after, size):
+    "One page of rows matching the filter that follow the sort key `after`."
+    cursor.execute(
+        f"""SELECT filename, filepath, size, modified, search_key, ROWID
+        FROM files WHERE ({where}) AND (search_key, ROWID) > (?, ?)
+        ORDER BY search_key, ROWID LIMIT ?""",
+        [*params, *after, size],
+    )
+    return cursor.fetchall()
+
+
+def shard_pages(fetch, where, params, limit=None, start=("", 0)):
+    """
+    Generator over the matching rows of a single shard, ordered by search
+    key. Pages are fetched by sort keys, starting after `start`.
+    """
+    last_key = start
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page = PAGE_SIZE if remaining is None else min(PAGE_SIZE, remaining)
+        with metrics.timer("search.page"):
+            rows = fetch(where, params, last_key, page)
+        yield from rows
+        if len(rows) < page:
+            break
+        last_key = rows[-1][4:]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def merge_results(streams, limit=None):
+    "Merge the ordered results of several shards into the search results."
+    rows = heapq.merge(*streams, key=itemgetter(4))
+    for row in islice(rows, limit):
+        yield row[:4]
+
+
+def paged_search(fetches, pattern="", limit=None):
+    """
+    Generator over all entries matching the search pattern, ordered by name.
+    Every shard is paged through its own function in `fetches`, which take
+    the arguments of `fetch_page` without the cursor, and the ordered pages
+    are merged lazily.
+    """
+    metrics.count("search.queries")
+    where, params = build_filter(pattern)
+    streams = [shard_pages(fetch, where, params, limit) for fetch in fetches]
+    return merge_results(streams, limit)
+
+
+def read_overlay(cursor):
+    """
+    Replay the changelog of a shard, maps every changed filepath to its
+    current row or None if it was deleted.
+    """
+    cursor.execute(
+        """SELECT op, filename, filepath, size, modified, search_key, extension
+        FROM changelog ORDER BY seq"""
+    )
+    changes = {}
+    for op, *row in cursor:
+        changes[row[1]] = tuple(row) if op else None
+    return changes
+
+
+def row_filter(pattern):
+    """
+    Predicate for rows of the files table that match the search pattern,
+    like `build_filter` does in SQL.
+    """
+    terms, filters = parse_pattern(pattern)
+    extensions = set(filters[0]).intersection(*filters[1:]) if filters else None
+
+    def matches(row):
+        return all(term in row[4] for term in terms) and (
+            extensions is None or row[5] in extensions
+        )
+
+    return matches
+
+
+def snapshot_search(snap, changes, pattern):
+    "Matching rows of a snapshot with the changes since it was written laid over."
+    terms, filters = parse_pattern(pattern)
+    extensions = set(filters[0]).intersection(*filters[1:]) if filters else None
+    matches = row_filter(pattern)
+    base = (row for row in snap.search(terms, extensions) if row[1] not in changes)
+    added = [row for row in changes.values() if row is not None and matches(row)]
+    return heapq.merge(base, sorted(added, key=itemgetter(4)), key=itemgetter(4))
+
+
+def shard_results(conn, shard, pattern, where, params, limit=None):
+    """
+    Matching rows of one shard, from its memory-mapped snapshot if that is
+    current and from the database otherwise.
+    """
+    snap = snapshot.load(snapshot_path(shard))
+    cursor = conn.cursor()
+    if snap is not None:
+        # the generation and the changelog have to be read consistently
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT value FROM meta WHERE key = 'generation'")
+        current = snap.generation == cursor.fetchone()[0]
+        cursor.execute("SELECT count(*) FROM changelog")
+        current = current and cursor.fetchone()[0] <= MAX_OVERLAY
+        changes = read_overlay(cursor) if current else None
+        conn.commit()
+        if current:
+            metrics.count("search.snapshot")
+            return snapshot_search(snap, changes, pattern)
+    return shard_pages(partial(fetch_page, cursor), where, params, limit)
+
+
+def search(pattern="", limit=None, shards=None):
+    """
+    Generator over all entries matching the search pattern, ordered by name,
+    in the given shard files, all existing ones by default. Results are
+    fetched page by page so no read transaction is held open while the
+    caller consumes them. `content:` searches are answered from the content
+    index.
+    """
+    from . import content
+
+    if content.is_content_query(pattern):
+        yield from content.search(pattern, limit)
+        return
+    metrics.count("search.queries")
+    where, params = build_filter(pattern)
+    conns = []
+    try:
+        streams = []
+        for shard in shard_paths() if shards is None else shards:
+            conn = storage.connect(shard)
+            conns.append(conn)
+            streams.append(shard_results(conn, shard, pattern, where, params, limit))
+        yield from merge_results(streams, limit)
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def size_page(cursor, where, params, after, size, directories=False, descending=True):
+    """
+    One page of the rows matching the filter ordered by size that follow
+    the sort key `after`. Files are ordered by their own size, rows of
+    `directories` by the size of their subtree. The sort key holds the
+    negated size and ROWID if descending, so it always ascends.
+    """
+    sign, order, compare = (-1, "DESC", "<") if descending else (1, "ASC", ">")
+    if directories:
+        query = f"""SELECT f.filename, f.filepath, r.bytes, f.modified, r.ROWID
+            FROM rollups r JOIN files f ON f.filepath = r.filepath
+            WHERE ({where}) AND (r.bytes, r.ROWID) {compare} (?, ?)
+            ORDER BY r.bytes {order}, r.ROWID {order} LIMIT ?"""
+    else:
+        query = f"""SELECT filename, filepath, size, modified, ROWID FROM files
+            WHERE ({where}) AND (size, ROWID) {compare} (?, ?) AND NOT EXISTS (
+                SELECT 1 FROM rollups r WHERE r.filepath = files.filepath)
+            ORDER BY size {order}, ROWID {order} LIMIT ?"""
+    cursor.execute(query, [*params, sign * after[0], sign * after[1], size])
+    return [
+        (name, path, total, modified, sign * total, sign * row_id)
+        for name, path, total, modified, row_id in cursor.fetchall()
+    ]
+
+
+def search_by_size(pattern="", limit=None, descending=True):
+    """
+    Generator over all entries matching the search pattern ordered by their
+    du-style size: files by their size and directories by the total size
+    of their subtree, read from the rollups instead of rescanning it.
+    """
+    metrics.count("search.size_queries")
+    where, params = build_filter(pattern)
+    start = (float("-inf"), float("-inf"))
+    conns = []
+    try:
+        streams = []
+        for shard in shard_paths():
+            conn = storage.connect(shard)
+            conns.append(conn)
+            for directories in (False, True):
+                fetch = partial(
+                    size_page,
+                    conn.cursor(),
+                    directories=directories,
+                    descending=descending,
+                )
+                streams.append(shard_pages(fetch, where, params, limit, start))
+        yield from merge_results(streams, limit)
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def directory_sizes(paths):
+    "Total size of the subtrees of the given directories, by path."
+    roots = included_directories()
+    by_shard = {}
+    for path in paths:
+        root = shard_root(path, roots)
+        if root is not None:
+            by_shard.setdefault(shard_path(root), []).append(path)
+    sizes = {}
+    for shard, group in by_shard.items():
+        if not os.path.exists(shard):
+            continue
+        conn = storage.connect(shard)
+        cursor = conn.cursor()
+        for start in range(0, len(group), PAGE_SIZE // 2):
+            batch = group[start : start + PAGE_SIZE // 2]
+            cursor.execute(
+                "SELECT filepath, bytes FROM rollups WHERE filepath IN ({})".format(
+                    ", ".join("?" * len(batch))
+                ),
+                batch,
+            )
+            sizes.update(cursor.fetchall())
+        conn.close()
+    return sizes
+
+
+def write_snapshot(conn, shard):
+    """
+    Start a new generation of a shard: clear its changelog and write the
+    snapshot of its current entries.
+    """
+    with metrics.timer("crawl.snapshot"):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        cursor.execute("DELETE FROM changelog")
+        cursor.execute("SELECT value FROM meta WHERE key = 'generation'")
+        generation = cursor.fetchone()[0]
+        cursor.execute(
+            """SELECT filename, filepath, size, modified, search_key, extension
+            FROM files ORDER BY search_key, ROWID"""
+        )
+        rows = cursor.fetchall()
+        conn.commit()
+        snapshot.write(snapshot_path(shard), generation, rows)
+
+
+def directory_rows(entries):
+    "Table rows of the entries listed by the crawler."
+    return [
+        (
+            name,
+            path,
+            size,
+            modified,
+            normalize_name(name),
+            "" if is_dir else file_extension(name),
+            int(is_dir),
+        )
+        for name, path, is_dir, size, modified in entries
+    ]
+
+
+def listing_rollup(directory, entries):
+    """
+    Bytes and number of the files directly inside a listed directory and
+    the newest modification time among its entries.
+    """
+    size = count = newest = 0
+    for _, path, is_dir, file_size, modified in entries:
+        # mount points are listed together with their own entry
+        if path == directory:
+            continue
+        if not is_dir:
+            size += file_size
+            count += 1
+        newest = max(newest, modified)
+    return size, count, newest
+
+
+def total_rollups(listings):
+    """
+    Rollups of whole subtrees from the rollups of single listings, which
+    map directories to `(bytes, files, newest)`. Every directory is added
+    to its parent, deepest first.
+    """
+    totals = {path: list(rollup) for path, rollup in listings.items()}
+    for path in sorted(totals, key=lambda p: p.count(os.sep), reverse=True):
+        parent = totals.get(os.path.dirname(path))
+        if parent is not None and parent is not totals[path]:
+            size, count, newest = totals[path]
+            parent[0] += size
+            parent[1] += count
+            parent[2] = max(parent[2], newest)
+    return totals
+
+
+def rollup_rows(listings):
+    "Rows of the rollups table for the directories of some listings."
+    totals = total_rollups(listings)
+    return [
+        (path, *totals[path], size, count)
+        for path, (size, count, _) in listings.items()
+    ]
+
+
+def propagate_rollup(cursor, directory, root, size, count, newest):
+    """
+    Add a change below a directory to its rollup and the rollups of all of
+    its ancestors up to the included directory.
+    """
+    root = os.path.abspath(root)
+    changes = []
+    path = directory
+    while path.startswith(root):
+        changes.append((size, count, newest, path))
+        if path == root:
+            break
+        path = os.path.dirname(path)
+    cursor.executemany(
+        """UPDATE rollups SET bytes = bytes + ?, files = files + ?,
+        newest = max(newest, ?) WHERE filepath = ?""",
+        changes,
+    )
+    metrics.count("rollup.updates", len(changes))
+
+
+def walk_directory(directory, check_hidden, matcher):
+    """
+    Generator over the table rows and the rollup of every directory listed
+    below the given one, as `(directory, rows, rollup)`. Excluded
+    directories are pruned before they are descended into, and so are
+    included directories nested below it, which have their own shards.
+    """
+    crawler = Crawler(check_hidden, matcher, one_filesystem_enabled(), mount_options())
+    nested = {os.path.abspath(root) for root in included_directories()}
+    for listed, entries, _ in crawler.crawl([directory], prune=nested.__contains__):
+        metrics.count("crawl.entries", len(entries))
+        yield listed, directory_rows(entries), listing_rollup(listed, entries)
 
 
-def build_database():
-    """Build database in pure python code."""
-    db_path = database_path()
+def crawl_fingerprint():
+    "Number identifying the settings a rebuild crawls with."
+    settings = (
+        SCHEMA_VERSION,
+        hidden_files_enabled(),
+        one_filesystem_enabled(),
+        ignore_files_enabled(),
+        sorted(excluded_files()),
+    )
+    return int(hashlib.sha1(repr(settings).encode()).hexdigest()[:15], 16)
+
+
+def load_checkpoint(root, fingerprint):
+    """
+    Directories still to be listed and number of entries written by an
+    interrupted rebuild of a shard. None if there is nothing to resume or
+    the rebuild crawled with other settings.
+    """
+    path = shard_path(root)
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """SELECT key, value FROM meta
+            WHERE key IN ('checkpoint', 'checkpoint_entries')"""
+        )
+        saved = dict(cursor.fetchall())
+        if saved.get("checkpoint") != fingerprint:
+            return None
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = 'files_new'")
+        if not cursor.fetchone()[0]:
+            return None
+        cursor.execute("SELECT path FROM frontier")
+        frontier = [path for path, in cursor.fetchall()]
+    except sqlite3.Error as err:
+        LOGGER.warning(f"ignoring checkpoint of '{root}': {err}")
+        return None
+    finally:
+        conn.close()
+    # nothing was listed yet
+    if os.path.abspath(root) in frontier:
+        return None
+    return frontier, saved.get("checkpoint_entries", 0)
+
+
+def interrupted_builds():
+    "Included directories whose rebuild was interrupted and can be resumed."
+    fingerprint = crawl_fingerprint()
+    return [
+        root
+        for root in included_directories()
+        if load_checkpoint(root, fingerprint) is not None
+    ]
+
+
+def entry_count(shard):
+    "Number of entries in a shard, as cached in its `meta` table."
+    conn = sqlite3.connect(shard)
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM meta WHERE key = 'entry_count'")
+    data = cursor.fetchone()
+    conn.close()
+    return data[0] if data else 0
+
+
+class ShardWriter(threading.Thread):
+    """
+    Writes the crawled entries of one root into a fresh table of its shard
+    and swaps it in once the crawl is done. Every shard has its own writer,
+    so shards are filled in parallel.
+
+    Every few seconds the written rows are committed together with the
+    frontier, the directories that were queued but not listed yet, so a
+    rebuild that is interrupted can be resumed from that `checkpoint`.
+    The new table is only swapped in if the crawl was `complete`.
+    """
+
+    def __init__(self, root, fingerprint, checkpoint=None):
+        super().__init__(name=f"shard {root}", daemon=True)
+        self.root = root
+        self.fingerprint = fingerprint
+        self.checkpoint = checkpoint
+        self.batches = queue.Queue(WRITE_QUEUE_SIZE)
+        self.entries = 0
+        self.complete = False
+        self.finished = False
+        self.error = None
+
+    def run(self):
+        try:
+            self.write()
+        except Exception as err:  # pylint: disable=broad-except
+            # raised again by the rebuild once the crawl is over
+            self.error = err
+            LOGGER.error(f"writing the shard of '{self.root}' failed: {err}")
+            # keep the crawl from blocking on a full queue
+            if not self.finished:
+                for _ in iter(self.batches.get, None):
+                    pass
+
+    def write(self):
+        "Fill the shard from the queued batches of rows."
+        path = shard_path(self.root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path)
+        storage.apply_profile(conn, storage.BULK_LOAD)
+        cursor = conn.cursor()
+        create_shard_schema(cursor)
+        if self.checkpoint is None:
+            # the old table keeps serving searches until the new one is swapped in
+            cursor.execute("DROP TABLE IF EXISTS files_new")
+            create_table(cursor, "files_new")
+            # rollups of the single listings, totalled when swapping
+            cursor.execute("DROP TABLE IF EXISTS rollups_new")
+            create_rollup_table(cursor, "rollups_new")
+            cursor.execute("DELETE FROM frontier")
+            cursor.execute("INSERT INTO frontier VALUES (?)", [self.root])
+            cursor.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('checkpoint', ?)",
+                [self.fingerprint],
+            )
+            self.save_checkpoint(cursor)
+            conn.commit()
+        else:
+            self.entries = self.checkpoint[1]
+        saved = time.monotonic()
+        # indexes are cheaper to build afterwards
+        for directory, rows, queued, rollup in iter(self.batches.get, None):
+            with metrics.timer("crawl.insert"):
+                cursor.executemany(
+                    "INSERT INTO files_new VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                cursor.execute(
+                    "INSERT OR REPLACE INTO rollups_new VALUES (?, ?, ?, ?, 0, 0)",
+                    [directory, *rollup],
+                )
+            # committed in the same transaction as the rows of the listing
+            cursor.execute("DELETE FROM frontier WHERE path = ?", [directory])
+            cursor.executemany(
+                "INSERT OR IGNORE INTO frontier VALUES (?)", [(p,) for p in queued]
+            )
+            self.entries += len(rows)
+            if time.monotonic() - saved > CHECKPOINT_INTERVAL:
+                with metrics.timer("crawl.checkpoint"):
+                    self.save_checkpoint(cursor)
+                    conn.commit()
+                saved = time.monotonic()
+        self.finished = True
+        self.save_checkpoint(cursor)
+        conn.commit()
+        if not self.complete:
+            LOGGER.info(f"Rebuild of '{self.root}' interrupted, saved a checkpoint")
+            conn.close()
+            return
+        with metrics.timer("crawl.swap"):
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DROP TABLE files")
+            create_indexes(cursor, "files_new")
+            cursor.execute("ALTER TABLE files_new RENAME TO files")
+            create_triggers(cursor)
+            cursor.execute("SELECT filepath, bytes, files, newest FROM rollups_new")
+            listings = {path: rollup for path, *rollup in cursor.fetchall()}
+            cursor.execute("DELETE FROM rollups")
+            cursor.executemany(
+                "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?)", rollup_rows(listings)
+            )
+            cursor.execute("DROP TABLE rollups_new")
+            # directories of stuck mounts are left unlisted
+            cursor.execute("DELETE FROM frontier")
+            cursor.execute(
+                "DELETE FROM meta WHERE key IN ('checkpoint', 'checkpoint_entries')"
+            )
+            cursor.execute(
+                "UPDATE meta SET value = ? WHERE key = 'entry_count'", [self.entries]
+            )
+            # the old snapshot no longer matches
+            cursor.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'generation'"
+            )
+            cursor.execute("DELETE FROM changelog")
+            conn.commit()
+        storage.flush(conn)
+        write_snapshot(conn, path)
+        conn.close()
+        # the statistics of the old table don't describe the new one
+        storage.maintain(path)
+
+    def save_checkpoint(self, cursor):
+        "Record the number of entries written, committed by the caller."
+        cursor.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('checkpoint_entries', ?)",
+            [self.entries],
+        )
+
+
+@metrics.profile("rebuild")
+def build_database(roots=None, progress=None):
+    """
+    Build the shards of the given included directories, all of them by
+    default, in pure python code. Interrupted rebuilds are resumed from
+    their checkpoints. Returns the mount points that stopped responding and
+    were only partially indexed.
+
+    `progress(entries, expected, eta)` is called about once a second with
+    the number of entries crawled so far, the size of the previous index as
+    an estimate of the total (0 if unknown) and the estimated seconds left
+    (None if unknown).
+    """
     check_hidden = hidden_files_enabled()
-    # establish connection and create table if it doesn'T exist yet
-    LOGGER.info("Complete database rebuild...(python backend)")
+    # all included directories, nested ones are never crawled into another
+    # shard even if only some shards are rebuilt
+    included = [os.path.abspath(root) for root in included_directories()]
+    if roots is None:
+        roots = included
+        remove_stale_shards()
+    roots = [os.path.abspath(root) for root in roots]
+    LOGGER.info(f"Rebuilding {len(roots)} shard(s)...(python backend)")
     start_time = time.time()
-    ex = excluded_files()
-    print(ex)
+    matcher = exclude.matcher_for()
+    crawler = Crawler(check_hidden, matcher, one_filesystem_enabled(), mount_options())
+
+    fingerprint = crawl_fingerprint()
+    checkpoints = {root: load_checkpoint(root, fingerprint) for root in roots}
+    resume = {root: c[0] for root, c in checkpoints.items() if c is not None}
+    if resume:
+        LOGGER.info(f"Resuming the interrupted rebuild of {len(resume)} shard(s)")
+    resumed = sum(c[1] for c in checkpoints.values() if c is not None)
+    # the previous size of the shards is the best guess of the total
+    shards = [shard_path(root) for root in roots]
+    expected = sum(entry_count(shard) for shard in shards if os.path.exists(shard))
+    done = resumed
+    if progress is not None and resumed:
+        progress(done, expected, None)
+    reported = time.monotonic()
+
+    writers = {
+        root: ShardWriter(root, fingerprint, checkpoints[root]) for root in roots
+    }
+    for writer in writers.values():
+        writer.start()
+    complete = False
+    try:
+        for directory, entries, queued in crawler.crawl(
+            roots, prune=set(included).__contains__, resume=resume
+        ):
+            metrics.count("crawl.entries", len(entries))
+            # empty listings still advance the frontier
+            root = shard_root(directory, included)
+            rollup = listing_rollup(directory, entries)
+            batch = (directory, directory_rows(entries), queued, rollup)
+            writers[root].batches.put(batch)
+            done += len(entries)
+            if progress is not None and time.monotonic() - reported > PROGRESS_INTERVAL:
+                reported = time.monotonic()
+                eta = estimate_eta(done, resumed, expected, start_time)
+                progress(done, expected, eta)
+        complete = True
+    finally:
+        for writer in writers.values():
+            writer.complete = complete
+            writer.batches.put(None)
+        for writer in writers.values():
+            writer.join()
+    for writer in writers.values():
+        if writer.error is not None:
+            raise writer.error
+
+    total = sum(writer.entries for writer in writers.values())
+    t_end = time.time() - start_time
+    metrics.observe("crawl.rebuild", t_end)
+    metrics.gauge("crawl.entries_per_s", total / max(t_end, 1e-9))
+    LOGGER.info(f"Rebuild finished. Time elapsed: {t_end:.2f}s")
+    return crawler.partial
 
-    conn = sqlite3.connect(db_path)
+
+def estimate_eta(done, resumed, expected, start_time):
+    "Seconds a rebuild still needs at its current rate, None if unknown."
+    rate = (done - resumed) / max(time.time() - start_time, 1e-9)
+    if done >= expected or rate <= 0:
+        return None
+    return (expected - done) / rate
+
+
+def subtree_range(directory):
+    "Bounds of the filepaths below a directory, for an indexed range scan."
+    prefix = os.path.join(directory, "")
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+@metrics.profile("reindex")
+def reindex_directory(directory):
+    "Re-crawl a single directory tree and replace its entries in its shard."
+    LOGGER.info(f"Reindexing '{directory}'...")
+    root = shard_root(directory)
+    if root is None:
+        LOGGER.warning(f"'{directory}' is not below an included directory")
+        return 0
+    directory = os.path.abspath(directory)
+    matcher = exclude.matcher_for(directory)
+    rows = []
+    listings = {}
+    for listed, listed_rows, rollup in walk_directory(
+        directory, hidden_files_enabled(), matcher
+    ):
+        rows.extend(listed_rows)
+        listings[listed] = rollup
+    conn = sqlite3.connect(shard_path(root))
     cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS files")
-    cursor.execute(
-        """CREATE TABLE files(filename TEXT, filepath TEXT,
-            size INT, modified INT);"""
-    )
-    # iterate over disk and build file entries
-    directories = included_directories()
-    file_list = []
-    for directory in directories:
-        for root, dirs, files in os.walk(directory, topdown=True):
-            if not check_hidden:
-                files[:] = [f for f in files if not f[0] == "." and f not in ex]
-                dirs[:] = [d for d in dirs if not d[0] == "." and d not in ex]
-            # iterate over files
-            for fil in files:
-                path = os.path.join(root, fil)
-                if os.path.exists(path):
-                    f_info = os.stat(path)
-                    size = int(f_info.st_size)
-                    modified = int(f_info.st_mtime)
-                    file_list.append((fil, path, size, modified))
-            # iterate over directories
-            for drt in dirs:
-                path = os.path.join(root, drt)
-                if os.path.exists(path):
-                    f_info = os.stat(path)
-                    modified = int(f_info.st_mtime)
-                    file_list.append((drt, path, 0, modified))
-
-    # write file entries to database
-    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?)", file_list)
+    cursor.execute(
+        "DELETE FROM files WHERE filepath >= ? AND filepath < ?",
+        subtree_range(directory),
+    )
+    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    # the rollups of the subtree are replaced, its ancestors get the difference
+    cursor.execute("SELECT bytes, files FROM rollups WHERE filepath = ?", [directory])
+    old = cursor.fetchone() or (0, 0)
+    cursor.execute("DELETE FROM rollups WHERE filepath = ?", [directory])
+    cursor.execute(
+        "DELETE FROM rollups WHERE filepath >= ? AND filepath < ?",
+        subtree_range(directory),
+    )
+    new_rows = rollup_rows(listings)
+    cursor.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?)", new_rows)
+    new = next((row[1:4] for row in new_rows if row[0] == directory), (0, 0, 0))
+    if directory != os.path.abspath(root):
+        size, count = new[0] - old[0], new[1] - old[1]
+        propagate_rollup(cursor, os.path.dirname(directory), root, size, count, new[2])
     conn.commit()
+    compact_changelog(conn, shard_path(root))
     conn.close()
+    return len(rows)
 
-    t_end = time.time() - start_time
-    LOGGER.info(f"Full rebuild finished. Time elapsed: {t_end:.2f}s")
+
+def compact_changelog(conn, shard):
+    "Rewrite the snapshot of a shard once its changelog has grown large."
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM changelog")
+    if cursor.fetchone()[0] > MAX_OVERLAY // 2:
+        write_snapshot(conn, shard)
+
+
+def directory_candidates(root):
+    """
+    Directories of a shard, symlinked ones included, with their indexed
+    modification time, most recently modified first.
+    """
+    conn = sqlite3.connect(shard_path(root))
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT filepath, modified FROM files WHERE is_dir ORDER BY modified DESC"
+    )
+    data = cursor.fetchall()
+    conn.close()
+    return data
+
+
+def refresh_directory(directory, throttle=None, initializer=None):
+    """
+    Bring the entries directly inside a directory up to date without
+    re-crawling its subdirectories that are already indexed. New
+    subdirectories are crawled completely, the entries below vanished ones
+    are removed. `throttle` and `initializer` are passed to the crawler.
+    Returns the number of entries written.
+    """
+    root = shard_root(directory)
+    if root is None:
+        return 0
+    directory = os.path.abspath(directory)
+    shard = shard_path(root)
+    prefix, upper = subtree_range(directory)
+    # entries directly inside the directory
+    children = "filepath >= ? AND filepath < ? AND instr(substr(filepath, ?), '/') = 0"
+    bounds = [prefix, upper, len(prefix) + 1]
+    conn = sqlite3.connect(shard)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT filepath, modified FROM files WHERE {children} AND is_dir",
+        bounds,
+    )
+    known = dict(cursor.fetchall())
+    nested = {os.path.abspath(r) for r in included_directories()}
+
+    crawler = Crawler(
+        hidden_files_enabled(),
+        exclude.matcher_for(directory),
+        one_filesystem_enabled(),
+        mount_options(),
+        throttle,
+        initializer,
+    )
+    rows = []
+    listed = set()
+    direct = (0, 0, 0)
+    # rollups of the listings inside new subdirectories
+    listings = {}
+    for listed_dir, entries, _ in crawler.crawl(
+        [directory], prune=lambda path: path in known or path in nested
+    ):
+        if listed_dir == directory:
+            listed = {path for _, path, is_dir, _, _ in entries if is_dir}
+            # subdirectories that weren't descended into keep their old
+            # modification time, so their own changes are still noticed
+            entries = [
+                (name, path, is_dir, size, known.get(path, modified))
+                if is_dir
+                else (name, path, is_dir, size, modified)
+                for name, path, is_dir, size, modified in entries
+            ]
+            direct = listing_rollup(directory, entries)
+        else:
+            listings[listed_dir] = listing_rollup(listed_dir, entries)
+        rows.extend(directory_rows(entries))
+    new_rows = rollup_rows(listings)
+    added = [row for row in new_rows if row[0] in listed]
+
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute(
+        "SELECT own_bytes, own_files FROM rollups WHERE filepath = ?", [directory]
+    )
+    old_size, old_count = cursor.fetchone() or (0, 0)
+    cursor.execute(f"DELETE FROM files WHERE {children}", bounds)
+    # subtrees of vanished directories and stale leftovers below new ones
+    for path in listed.symmetric_difference(known):
+        cursor.execute(
+            "DELETE FROM files WHERE filepath >= ? AND filepath < ?",
+            subtree_range(path),
+        )
+        cursor.execute("SELECT bytes, files FROM rollups WHERE filepath = ?", [path])
+        size, count = cursor.fetchone() or (0, 0)
+        old_size += size
+        old_count += count
+        cursor.execute("DELETE FROM rollups WHERE filepath = ?", [path])
+        cursor.execute(
+            "DELETE FROM rollups WHERE filepath >= ? AND filepath < ?",
+            subtree_range(path),
+        )
+    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    cursor.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?)", new_rows)
+    cursor.execute(
+        "UPDATE rollups SET own_bytes = ?, own_files = ? WHERE filepath = ?",
+        [direct[0], direct[1], directory],
+    )
+    propagate_rollup(
+        cursor,
+        directory,
+        root,
+        direct[0] + sum(row[1] for row in added) - old_size,
+        direct[1] + sum(row[2] for row in added) - old_count,
+        max([direct[2]] + [row[3] for row in added]),
+    )
+    # the new modification time keeps the directory from being refreshed again,
+    # replacing the row instead of updating it records it in the changelog
+    cursor.execute("DELETE FROM files WHERE filepath = ?", [directory])
+    if cursor.rowcount and os.path.isdir(directory):
+        name = os.path.basename(directory)
+        modified = int(os.stat(directory).st_mtime)
+        cursor.execute(
+            "INSERT INTO files VALUES (?, ?, 0, ?, ?, '', 1)",
+            [name, directory, modified, normalize_name(name)],
+        )
+        if directory != os.path.abspath(root):
+            propagate_rollup(cursor, os.path.dirname(directory), root, 0, 0, modified)
+    conn.commit()
+    compact_changelog(conn, shard)
+    conn.close()
+    metrics.count("scheduler.refreshed")
+    return len(rows)
 
 
 def number_of_rows():
-    "Number of entries in the table."
+    "Number of entries in all shards, as cached in their `meta` tables."
+    return sum(entry_count(path) for path in shard_paths())
 
-    conn = sqlite3.connect(database_path())
+
+def schema_version(path=None):
+    "Layout version of the existing main database or shard."
+    conn = sqlite3.connect(path or database_path())
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM files")
+    cursor.execute("PRAGMA user_version")
     data = cursor.fetchall()
     conn.close()
     return data[0][0]
 
 
 def validate_database():
-    "Check if database exists, if not build it."
+    """
+    Check if the main database and the shards exist and are up to date.
+    Missing or outdated ones are replaced by empty ones, returns the included
+    directories whose shards need to be (re)built.
+    """
     LOGGER.info(f"Validating Database -> '{database_path()}' ")
     path = pathlib.Path(database_path())
     if not path.parent.exists():
-        pathlib.Path(database_path()).parent.mkdir()
-    if not path.exists():
-        build_database()
+        path.parent.mkdir()
+    if not path.exists() or schema_version() < SCHEMA_VERSION:
+        LOGGER.info("Database is missing or outdated, it will be rebuilt.")
+        conn = sqlite3.connect(database_path())
+        cursor = conn.cursor()
+        # entries used to live in the main database
+        cursor.execute("DROP TABLE IF EXISTS files")
+        cursor.execute("DROP TABLE IF EXISTS files_new")
+        cursor.execute("DROP TABLE IF EXISTS meta")
+        create_schema(cursor)
+        conn.commit()
+        conn.close()
+    os.makedirs(shard_directory(), exist_ok=True)
+    outdated = []
+    for root in included_directories():
+        shard = shard_path(root)
+        try:
+            if os.path.exists(shard) and schema_version(shard) >= SCHEMA_VERSION:
+                continue
+        except sqlite3.DatabaseError as err:
+            # see storage.BULK_LOAD, shards aren't synced while being rebuilt
+            LOGGER.warning(f"Shard of '{root}' is damaged: {err}")
+        LOGGER.info(f"Shard of '{root}' is missing or outdated, it will be rebuilt.")
+        remove_shard(root)
+        conn = sqlite3.connect(shard)
+        create_shard_schema(conn.cursor())
+        conn.commit()
+        conn.close()
+        outdated.append(root)
+    return outdated
 
 
 def dbrecord_from_path(filepath):
     "Builds up a dataclass that represents a db record for the `files` table."
     fileinfo = os.stat(filepath)
     filename = str(pathlib.Path(filepath).name)
-    filesize = fileinfo.st_size
-    modified = fileinfo.st_mtime
-    db_record = DatabaseEntry(filename, filepath, filesize, modified)
+    is_dir = stat.S_ISDIR(fileinfo.st_mode)
+    if os.path.islink(filepath):
+        # like the crawler, links count with their own size
+        fileinfo = os.lstat(filepath)
+    # like the crawler, directories are stored without a size
+    filesize = 0 if is_dir else fileinfo.st_size
+    modified = int(fileinfo.st_mtime)
+    extension = "" if is_dir else file_extension(filename)
+    db_record = DatabaseEntry(
+        filename,
+        filepath,
+        filesize,
+        modified,
+        normalize_name(filename),
+        extension,
+        int(is_dir),
+    )
     return db_record
 
 
 def find_row_id(filepath):
-    "Find the row id of given filepath."
-    conn = sqlite3.connect(database_path())
+    "Find the row id of given filepath in its shard."
+    conn = sqlite3.connect(shard_path(shard_root(filepath)))
     cursor = conn.cursor()
     cursor.execute("SELECT ROWID FROM files WHERE filepath=?", [filepath])
     data = cursor.fetchall()
@@ -118,27 +1196,251 @@ def find_row_id(filepath):
     return data
 
 
+def insert_record(filepath):
+    "Adds a row for the given path to the table of its shard."
+    entry = dbrecord_from_path(filepath)
+    root = shard_root(filepath)
+    if root is None:
+        return entry
+    conn = sqlite3.connect(shard_path(root))
+    add_entry(conn.cursor(), filepath, root, entry)
+    conn.commit()
+    conn.close()
+    return entry
+
+
+def add_entry(cursor, filepath, root, entry=None):
+    """
+    Add the row of a single path to its shard and to the rollups of its
+    ancestors. Paths that are indexed already are left alone, so a change
+    reported by both a file operation and the monitor is applied once.
+    """
+    if not storable(filepath):
+        LOGGER.warning(f"skipping {filepath!r}, its name is not valid UTF-8")
+        return
+    cursor.execute("SELECT 1 FROM files WHERE filepath = ?", [filepath])
+    if cursor.fetchone() is not None:
+        return
+    if entry is None:
+        entry = dbrecord_from_path(filepath)
+    cursor.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", astuple(entry))
+    is_dir = entry.is_dir
+    # symlinked directories are not descended into and have no rollup
+    if is_dir and not os.path.islink(filepath):
+        cursor.execute(
+            "INSERT OR IGNORE INTO rollups VALUES (?, 0, 0, ?, 0, 0)",
+            [filepath, entry.modified],
+        )
+    update_rollups(cursor, filepath, root, entry.size, 0 if is_dir else 1)
+
+
+def update_record(filepath):
+    "Replaces the row of a file that was modified in place."
+    entry = dbrecord_from_path(filepath)
+    root = shard_root(filepath)
+    if root is None:
+        return entry
+    conn = sqlite3.connect(shard_path(root))
+    update_entry(conn.cursor(), filepath, root, entry)
+    conn.commit()
+    conn.close()
+    return entry
+
+
+def update_entry(cursor, filepath, root, entry=None):
+    """
+    Bring the row of a modified file and the rollups of its ancestors up to
+    date with its new size and modification time. Paths that aren't
+    indexed yet are added.
+    """
+    if not storable(filepath):
+        return
+    cursor.execute("SELECT size, modified FROM files WHERE filepath = ?", [filepath])
+    found = cursor.fetchone()
+    if found is None:
+        add_entry(cursor, filepath, root, entry)
+        return
+    if entry is None:
+        entry = dbrecord_from_path(filepath)
+    if entry.is_dir or found == (entry.size, entry.modified):
+        return
+    # replaced instead of updated, so the change is recorded in the changelog
+    cursor.execute("DELETE FROM files WHERE filepath = ?", [filepath])
+    cursor.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", astuple(entry))
+    update_rollups(
+        cursor, filepath, root, entry.size - found[0], 0, newest=entry.modified
+    )
+
+
+def add_subtree(cursor, directory, root, rows, listings):
+    """
+    Add a directory that was moved into an included directory with the
+    crawled `rows` and listing rollups of its subtree, replacing whatever
+    was indexed below it.
+    """
+    if not storable(directory):
+        LOGGER.warning(f"skipping {directory!r}, its name is not valid UTF-8")
+        return
+    remove_entry(cursor, directory, root)
+    entry = dbrecord_from_path(directory)
+    cursor.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", astuple(entry))
+    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    new_rows = rollup_rows(listings)
+    cursor.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?)", new_rows)
+    size, count, newest = next(
+        (row[1:4] for row in new_rows if row[0] == directory), (0, 0, 0)
+    )
+    parent = os.path.dirname(directory)
+    propagate_rollup(cursor, parent, root, size, count, max(newest, entry.modified))
+
+
+def subtree_change(directory):
+    """
+    Crawl a directory and return the change adding it with its subtree,
+    `add_subtree` with the crawled rows and rollups, see `apply_changes`.
+    """
+    rows = []
+    listings = {}
+    for listed, listed_rows, rollup in walk_directory(
+        directory, hidden_files_enabled(), exclude.matcher_for(directory)
+    ):
+        rows.extend(listed_rows)
+        listings[listed] = rollup
+    return partial(add_subtree, rows=rows, listings=listings)
+
+
+def insert_subtree(directory):
+    """
+    Adds a directory that appeared in an included directory with its whole
+    subtree to its shard. Returns the change that was applied.
+    """
+    change = subtree_change(directory)
+    apply_changes([(directory, change)])
+    return change
+
+
+def update_rollups(cursor, filepath, root, size, count, own=True, newest=None):
+    """
+    Apply a single entry that was added, removed or modified to the rollups
+    of its ancestors. `own` entries are directly inside their parent, unlike
+    the totals of a removed subdirectory. `newest` defaults to the
+    modification time of the parent.
+    """
+    parent = os.path.dirname(filepath)
+    if own:
+        cursor.execute(
+            """UPDATE rollups SET own_bytes = own_bytes + ?,
+            own_files = own_files + ? WHERE filepath = ?""",
+            [size, count, parent],
+        )
+    try:
+        # the parent's modification time changed with the entry
+        newest = int(os.stat(parent).st_mtime) if newest is None else newest
+    except OSError:
+        newest = 0
+    propagate_rollup(cursor, parent, root, size, count, newest)
+
+
 def delete_record(filepath):
-    "Deletes a row from the table."
-    conn = sqlite3.connect(database_path())
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM files WHERE filepath=?", [filepath])
+    "Deletes a row from the table of its shard."
+    root = shard_root(filepath)
+    if root is None:
+        return
+    conn = sqlite3.connect(shard_path(root))
+    remove_entry(conn.cursor(), filepath, root)
+    conn.commit()
     conn.close()
 
 
+def remove_entry(cursor, filepath, root):
+    """
+    Remove the row of a path from its shard, for a directory the rows of its
+    subtree as well, and take it out of the rollups of its ancestors.
+    """
+    if not storable(filepath):
+        # never indexed
+        return
+    cursor.execute("SELECT size, is_dir FROM files WHERE filepath = ?", [filepath])
+    found = cursor.fetchone()
+    cursor.execute("DELETE FROM files WHERE filepath=?", [filepath])
+    cursor.execute("SELECT bytes, files FROM rollups WHERE filepath = ?", [filepath])
+    rollup = cursor.fetchone()
+    if rollup is not None:
+        # a directory, its subtree is gone as well
+        cursor.execute("DELETE FROM rollups WHERE filepath = ?", [filepath])
+        for table in ("files", "rollups"):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE filepath >= ? AND filepath < ?",
+                subtree_range(filepath),
+            )
+        update_rollups(cursor, filepath, root, -rollup[0], -rollup[1], own=False)
+    elif found is not None:
+        # symlinked directories have no rollup and don't count as files
+        size, is_dir = found
+        update_rollups(cursor, filepath, root, -size, 0 if is_dir else -1)
+
+
+def apply_changes(changes):
+    """
+    Apply `(path, change)` pairs, where `change(cursor, path, root)` edits the
+    shard of the path, in one transaction per shard. Paths that aren't
+    indexed are skipped.
+    """
+    roots = included_directories()
+    by_root = {}
+    for path, change in changes:
+        root = shard_root(path, roots)
+        if root is not None:
+            by_root.setdefault(root, []).append((path, change))
+    for root, group in by_root.items():
+        shard = shard_path(root)
+        conn = sqlite3.connect(shard)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for path, change in group:
+                change(cursor, path, root)
+            conn.commit()
+            compact_changelog(conn, shard)
+        finally:
+            # an unfinished transaction is rolled back
+            conn.close()
+    metrics.count("database.batch_changes", len(changes))
+
+
+def delete_records(filepaths):
+    "Delete the rows of many paths, in one transaction per shard."
+    apply_changes([(path, remove_entry) for path in filepaths])
+
+
+def move_records(moves):
+    """
+    Move the rows of `(source, destination)` pairs of paths that were moved
+    on disk, in one transaction per shard. Moved directories are crawled.
+    """
+    changes = []
+    for source, destination in moves:
+        changes.append((source, remove_entry))
+        if not os.path.isdir(destination) or os.path.islink(destination):
+            changes.append((destination, add_entry))
+            continue
+        changes.append((destination, subtree_change(destination)))
+    apply_changes(changes)
+
+
 def add_bookmark(filepath):
     """add bookmark to the database"""
+    add_bookmarks([filepath])
+
+
+def add_bookmarks(filepaths):
+    """add several bookmarks to the database in one transaction"""
     conn = sqlite3.connect(database_path())
     cursor = conn.cursor()
-    fname = pathlib.Path(filepath).name
-    # create table if it doesn't exist yet
-    cursor.execute(
-        """CREATE TABLE IF NOT EXISTS bookmarks(
-        filename TEXT,
-        filepath TEXT,
-        UNIQUE(filename, filepath))"""
+    cursor.executemany(
+        "INSERT OR IGNORE INTO bookmarks VALUES (?, ?)",
+        [(pathlib.Path(filepath).name, filepath) for filepath in filepaths],
     )
-    cursor.execute("INSERT OR IGNORE INTO bookmarks VALUES (?, ?)", (fname, filepath))
     conn.commit()
     conn.close()
 
@@ -0,0 +1,291 @@
+"""
+Duplicate file finder built on the index.
+
+Candidates are narrowed down in stages that get more expensive, so most
+files are never read at all:
+
+    size    files whose size no other file has are unique, this comes
+            straight from the index
+    edges   hash of the first and last block of the remaining files
+    full    hash of the whole content, only for files whose edges matched
+
+Symlinks and further hard links of a file are left out, removing them
+frees no space.
+
+Hashing runs in a process pool whose size bounds the number of files read
+at the same time. Hashes are cached in the main database by path and are
+valid as long as size and modification time are unchanged, so reruns only
+read new or modified files. Hashes of files that are no longer candidates
+are dropped.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import stat
+
+from . import database as db
+from . import metrics
+from .config import database_path
+
+LOGGER = logging.getLogger(__name__)
+
+# bytes hashed at either end of a file in the edge stage
+BLOCK_SIZE = 64 * 1024
+# bytes read at once while hashing whole files
+READ_SIZE = 1024 * 1024
+# files read at the same time, more mostly make disks seek
+MAX_IO = 4
+# files hashed per task sent to a worker process
+CHUNK_SIZE = 64
+# empty files and directories are not reported
+MIN_SIZE = 1
+
+
+def create_hash_table(cursor):
+    """Create the hash cache of the main database."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS hashes(filepath TEXT PRIMARY KEY,
+            size INT, modified INT, edges BLOB, full BLOB)"""
+    )
+
+
+def hash_edges(path, size):
+    "Hash of the first and last block of a file, all of it if it is small."
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as infile:
+        digest.update(infile.read(BLOCK_SIZE))
+        if size > BLOCK_SIZE:
+            infile.seek(max(size - BLOCK_SIZE, BLOCK_SIZE))
+            digest.update(infile.read(BLOCK_SIZE))
+    return digest.digest()
+
+
+def hash_full(path, size):
+    "Hash of the whole content of a file."
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def _hash_chunk(stage, files):
+    "Hash `(path, size)` pairs in a worker process, None for unreadable files."
+    func = hash_edges if stage == "edges" else hash_full
+    hashes = []
+    for path, size in files:
+        try:
+            hashes.append(func(path, size))
+        except OSError:
+            hashes.append(None)
+    return hashes
+
+
+def size_groups(min_size=MIN_SIZE):
+    """
+    Indexed files of at least `min_size` bytes whose size is shared by
+    another file, as lists of `(filepath, size, modified)` by size.
+    """
+    counts = collections.Counter()
+    for shard in db.shard_paths():
+        conn = sqlite3.connect(shard)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT size, count(*) FROM files WHERE size >= ? GROUP BY size",
+            [min_size],
+        )
+        for size, count in cursor:
+            counts[size] += count
+        conn.close()
+    shared = [(size,) for size, count in counts.items() if count > 1]
+
+    groups = collections.defaultdict(list)
+    for shard in db.shard_paths():
+        conn = sqlite3.connect(shard)
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE shared(size INTEGER PRIMARY KEY)")
+        cursor.executemany("INSERT INTO shared VALUES (?)", shared)
+        cursor.execute(
+            """SELECT filepath, size, modified FROM files
+            WHERE size IN (SELECT size FROM shared)"""
+        )
+        for row in cursor:
+            groups[row[1]].append(row)
+        conn.close()
+    return groups
+
+
+def distinct_files(groups):
+    """
+    Leave out symlinks and other files that aren't regular, and all but one
+    hard link of the same file, none of them takes up space of its own.
+    Groups that are left with a single file are dropped.
+    """
+    distinct = []
+    for group in groups:
+        inodes = set()
+        files = []
+        for entry in group:
+            try:
+                info = os.lstat(entry[0])
+            except OSError:
+                continue
+            inode = (info.st_dev, info.st_ino)
+            if not stat.S_ISREG(info.st_mode) or inode in inodes:
+                continue
+            inodes.add(inode)
+            files.append(entry)
+        if len(files) > 1:
+            distinct.append(files)
+    return distinct
+
+
+class HashCache:
+    """Hashes of earlier runs, valid while size and modification time match."""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(database_path())
+        cursor = self.conn.cursor()
+        create_hash_table(cursor)
+        cursor.execute("SELECT filepath, size, modified, edges, full FROM hashes")
+        self.entries = {row[0]: row for row in cursor.fetchall()}
+        self.changed = set()
+
+    def get(self, stage, entry):
+        "Cached hash of a `(filepath, size, modified)` entry, None if unknown."
+        cached = self.entries.get(entry[0])
+        if cached is None or cached[1:3] != entry[1:3]:
+            return None
+        return cached[3] if stage == "edges" else cached[4]
+
+    def put(self, stage, entry, digest):
+        "Remember the hash of an entry."
+        filepath, size, modified = entry
+        cached = self.entries.get(filepath)
+        if cached is None or cached[1:3] != (size, modified):
+            cached = (filepath, size, modified, None, None)
+        if stage == "edges":
+            cached = cached[:3] + (digest, cached[4])
+        else:
+            cached = cached[:4] + (digest,)
+        self.entries[filepath] = cached
+        self.changed.add(filepath)
+
+    def prune(self, paths):
+        "Forget the hashes of files other than the given paths, e.g. deleted ones."
+        stale = [path for path in self.entries if path not in paths]
+        self.conn.executemany(
+            "DELETE FROM hashes WHERE filepath = ?", [(path,) for path in stale]
+        )
+        for path in stale:
+            del self.entries[path]
+            self.changed.discard(path)
+
+    def save(self):
+        "Write the new hashes to the database."
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+            [self.entries[path] for path in self.changed],
+        )
+        self.conn.commit()
+        self.changed.clear()
+
+    def close(self):
+        "Close the database connection."
+        self.conn.close()
+
+
+def hash_stage(pool, stage, entries, cache, progress=None, cancelled=None):
+    """
+    Hashes of the given entries for one stage, from the cache where
+    possible. Unreadable files are left out.
+    """
+    hashes = {}
+    todo = []
+    for entry in entries:
+        digest = cache.get(stage, entry)
+        if digest is None:
+            todo.append(entry)
+        else:
+            hashes[entry] = digest
+    metrics.count(f"duplicates.{stage}.cached", len(hashes))
+    metrics.count(f"duplicates.{stage}.hashed", len(todo))
+    chunks = [todo[i : i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+    futures = {
+        pool.submit(_hash_chunk, stage, [entry[:2] for entry in chunk]): chunk
+        for chunk in chunks
+    }
+    done = len(hashes)
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            chunk = futures[future]
+            for entry, digest in zip(chunk, future.result()):
+                if digest is not None:
+                    hashes[entry] = digest
+                    cache.put(stage, entry, digest)
+            done += len(chunk)
+            if progress is not None:
+                progress(stage, done, len(entries))
+            if cancelled is not None and cancelled():
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+    return hashes
+
+
+def regroup(groups, hashes):
+    "Split groups by hash, keeping only the parts with more than one file."
+    split = []
+    for group in groups:
+        by_hash = collections.defaultdict(list)
+        for entry in group:
+            if entry in hashes:
+                by_hash[hashes[entry]].append(entry)
+        split.extend(part for part in by_hash.values() if len(part) > 1)
+    return split
+
+
+@metrics.profile("duplicates")
+def find_duplicates(min_size=MIN_SIZE, max_io=MAX_IO, progress=None, cancelled=None):
+    """
+    Groups of identical indexed files as lists of `(filepath, size,
+    modified)`, the groups wasting the most space first. At most `max_io`
+    files are read at once. `progress(stage, done, total)` is called after
+    every hashed chunk and the search stops early once `cancelled()` is true.
+    """
+    with metrics.timer("duplicates.sizes"):
+        groups = distinct_files(size_groups(min_size).values())
+    LOGGER.info(f"{sum(map(len, groups))} files share their size with another one")
+    cache = HashCache()
+    # forking a process with GUI threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    workers = max(1, min(max_io, os.cpu_count() or 1))
+    try:
+        # hashes of files that are gone or no longer share their size
+        cache.prune({entry[0] for group in groups for entry in group})
+        with concurrent.futures.ProcessPoolExecutor(workers, context) as pool:
+            entries = [entry for group in groups for entry in group]
+            with metrics.timer("duplicates.edges"):
+                hashes = hash_stage(pool, "edges", entries, cache, progress, cancelled)
+            groups = regroup(groups, hashes)
+            if cancelled is not None and cancelled():
+                return []
+            # the edges of small files already cover all of their content
+            small = [group for group in groups if group[0][1] <= 2 * BLOCK_SIZE]
+            large = [group for group in groups if group[0][1] > 2 * BLOCK_SIZE]
+            entries = [entry for group in large for entry in group]
+            with metrics.timer("duplicates.full"):
+                hashes = hash_stage(pool, "full", entries, cache, progress, cancelled)
+            groups = regroup(large, hashes) + small
+            if cancelled is not None and cancelled():
+                return []
+    finally:
+        cache.save()
+        cache.close()
+    groups.sort(key=lambda group: group[0][1] * (len(group) - 1), reverse=True)
+    return groups
@@ -0,0 +1,287 @@
+"""
+Gitignore-style exclusion rules for the crawler and the filesystem monitor.
+
+Supported syntax, matching `.gitignore`:
+
+    node_modules      any file or directory with that name, at any depth
+    *.pyc             globs, `*` and `?` never match `/`, `[a-z]` classes
+    build/            trailing slash: directories only
+    docs/*.pdf        patterns containing a slash are anchored to the
+                      directory the rule belongs to
+    **/cache, a/**/b  `**` matches any number of directories
+    !keep.pyc         negation, re-includes what an earlier rule excluded
+
+Rules from the configuration file belong to every included directory,
+except absolute paths like `/mnt/backup`, which are matched as is. The last
+matching rule wins. Directories that are excluded are pruned before descent,
+so nothing below them is ever listed.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+
+# files whose rules are honored when `respect_ignore_files` is enabled
+IGNORE_FILES = (".gitignore", ".ignore")
+# characters with a special meaning in both python and POSIX extended regexes
+_SPECIAL = set(".[]()*+?{}|^$\\")
+
+
+def escape(text):
+    "Escape text for python and POSIX extended regular expressions alike."
+    return "".join("\\" + c if c in _SPECIAL else c for c in text)
+
+
+def translate(glob):
+    "Translate a gitignore glob into a regular expression without anchors."
+    out = []
+    i, length = 0, len(glob)
+    while i < length:
+        char = glob[i]
+        if glob.startswith("**/", i):
+            out.append("(.*/)?")
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            start = i + 2 if glob[i + 1 : i + 2] in ("!", "^") else i + 1
+            # a `]` right after the opening bracket is part of the class
+            end = glob.find("]", start + 1)
+            if end == -1:
+                out.append("\\[")
+            else:
+                content = glob[i + 1 : end].replace("\\", "\\\\")
+                if content[0] in "!^":
+                    content = "^" + content[1:]
+                out.append(f"[{content}]")
+                i = end
+        elif char == "\\" and i + 1 < length:
+            out.append(escape(glob[i + 1]))
+            i += 1
+        else:
+            out.append(escape(char))
+        i += 1
+    return "".join(out)
+
+
+@dataclass
+class Rule:
+    """A single compiled exclusion pattern."""
+
+    pattern: str
+    regex: str
+    negated: bool
+    dir_only: bool
+    # directory anchored patterns are relative to, None for name patterns
+    base: str
+    compiled: re.Pattern = field(default=None, compare=False, repr=False)
+
+    def matches(self, path, name, is_dir):
+        "Check if the rule applies to the given path."
+        if self.dir_only and not is_dir:
+            return False
+        if self.base is None:
+            return self.compiled.match(name) is not None
+        prefix = self.base.rstrip("/") + "/"
+        if not path.startswith(prefix):
+            return False
+        return self.compiled.match(path[len(prefix) :]) is not None
+
+    def inotify_regex(self):
+        """
+        Equivalent extended regex matched against full paths by inotifywait,
+        None for directory rules, as it can't tell directories from files.
+        """
+        if self.dir_only:
+            return None
+        if self.base is None:
+            return f"(^|/){self.regex}(/|$)"
+        return f"^{escape(self.base.rstrip('/'))}/{self.regex}(/|$)"
+
+
+def parse_rule(line, base):
+    "Compile a line of an ignore file, returns None for blanks and comments."
+    line = line.rstrip("\n")
+    # trailing spaces are ignored unless escaped
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated or line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    regex = translate(line.lstrip("/"))
+    return Rule(
+        line,
+        regex,
+        negated,
+        dir_only,
+        base if anchored else None,
+        re.compile(f"^{regex}$"),
+    )
+
+
+class ExclusionMatcher:
+    """Ordered set of exclusion rules, the last matching rule wins."""
+
+    def __init__(self, rules=(), ignore_files=False):
+        self.rules = list(rules)
+        self.ignore_files = ignore_files
+        self.negations = any(rule.negated for rule in self.rules)
+        # without negations only the existence of a match matters, so all
+        # name patterns are folded into a single regex
+        if not self.negations:
+            names = [r.regex for r in self.rules if r.base is None and not r.dir_only]
+            dir_names = [r.regex for r in self.rules if r.base is None and r.dir_only]
+            self.name_regex = re.compile(f"^({'|'.join(names)})$") if names else None
+            self.dir_name_regex = (
+                re.compile(f"^({'|'.join(dir_names)})$") if dir_names else None
+            )
+            self.anchored = [r for r in self.rules if r.base is not None]
+
+    @classmethod
+    def from_config(cls, patterns, roots, ignore_files=False):
+        "Rules of the configuration file for the given included directories."
+        rules = []
+        for pattern in patterns:
+            if pattern.startswith("/"):
+                rules.append(parse_rule(pattern, "/"))
+            else:
+                rules.extend(parse_rule(pattern, root) for root in roots)
+        # name patterns were added once per root
+        unique = []
+        for rule in rules:
+            if rule is not None and rule not in unique:
+                unique.append(rule)
+        return cls(unique, ignore_files)
+
+    def child(self, directory, names):
+        """
+        Matcher for the contents of a directory, extended by the rules of its
+        ignore files if they are honored. `names` are the directory's files.
+        """
+        if not self.ignore_files:
+            return self
+        rules = []
+        for ignore_file in IGNORE_FILES:
+            if ignore_file not in names:
+                continue
+            try:
+                with open(os.path.join(directory, ignore_file), "r") as infile:
+                    lines = infile.readlines()
+            except (OSError, UnicodeDecodeError):
+                continue
+            rules.extend(parse_rule(line, directory) for line in lines)
+        rules = [rule for rule in rules if rule is not None]
+        if not rules:
+            return self
+        return ExclusionMatcher(self.rules + rules, self.ignore_files)
+
+    def excluded(self, path, is_dir):
+        "Check if a file or directory should be skipped."
+        if not self.rules:
+            return False
+        name = path.rsplit("/", 1)[-1]
+        if not self.negations:
+            if self.name_regex is not None and self.name_regex.match(name):
+                return True
+            if is_dir and self.dir_name_regex and self.dir_name_regex.match(name):
+                return True
+            return any(rule.matches(path, name, is_dir) for rule in self.anchored)
+        excluded = False
+        for rule in self.rules:
+            if rule.negated == excluded and rule.matches(path, name, is_dir):
+                excluded = not rule.negated
+        return excluded
+
+    def excluded_path(self, path, roots, is_dir, cache=None):
+        """
+        Check if a path reported by the monitor is excluded itself or lies
+        below an excluded directory of one of the roots, by the rules of this
+        matcher and of the ignore files of its ancestors. `is_dir` comes from
+        the event, the path may be gone already. `cache` is passed on to
+        `matcher_below`.
+        """
+        for root in roots:
+            prefix = root.rstrip("/") + "/"
+            if not path.startswith(prefix):
+                continue
+            parts = path[len(prefix) :].split("/")
+            current = prefix.rstrip("/")
+            for part in parts[:-1]:
+                current = f"{current}/{part}"
+                if matcher_below(self, root, current, cache).excluded(current, True):
+                    return True
+            return matcher_below(self, root, path, cache).excluded(path, is_dir)
+        return False
+
+    def inotify_regex(self):
+        """
+        Single extended regex for `inotifywait --exclude`, so the monitor never
+        watches excluded trees. Returns None if the rules can't be expressed
+        that way because of negations. Directory rules are left out, their
+        trees are watched and filtered through `excluded_path` instead.
+        """
+        if not self.rules or self.negations:
+            return None
+        regexes = [rule.inotify_regex() for rule in self.rules]
+        regexes = [regex for regex in regexes if regex is not None]
+        return "|".join(regexes) if regexes else None
+
+
+def ignore_files_in(directory):
+    "Names of the ignore files present in a directory."
+    return [n for n in IGNORE_FILES if os.path.exists(os.path.join(directory, n))]
+
+
+def matcher_for(directory=None):
+    """
+    Matcher of the configured exclusion rules. If a directory below one of
+    the included directories is given, the ignore files of its ancestors are
+    applied as well.
+    """
+    from .config import excluded_files, ignore_files_enabled, included_directories
+
+    roots = included_directories()
+    matcher = ExclusionMatcher.from_config(
+        excluded_files(), roots, ignore_files_enabled()
+    )
+    if directory is None:
+        return matcher
+    for root in roots:
+        relative = os.path.relpath(directory, root)
+        if relative == os.curdir or relative.startswith(os.pardir):
+            continue
+        return matcher_below(matcher, root, directory)
+    return matcher
+
+
+def matcher_below(matcher, root, directory, cache=None):
+    """
+    Extend the matcher of an included directory by the ignore files of the
+    ancestors of a directory below it. `cache` maps already visited
+    ancestors to their matchers, which saves reading them again.
+    """
+    if not matcher.ignore_files:
+        return matcher
+    parts = os.path.relpath(directory, root).split(os.sep)
+    for depth in range(len(parts)):
+        ancestor = os.path.join(root, *parts[:depth])
+        cached = None if cache is None else cache.get(ancestor)
+        if cached is None:
+            cached = matcher.child(ancestor, ignore_files_in(ancestor))
+            if cache is not None:
+                cache[ancestor] = cached
+        matcher = cached
+    return matcher
@@ -0,0 +1,118 @@
+"""
+Batch operations on files selected in the table.
+
+Every operation first changes the filesystem file by file, then applies
+all changes that succeeded to the index at once, with one transaction per
+shard, and to the content index if it is enabled. A running search daemon
+is asked to reload the changed shards. The monitor reports the same
+changes again later, applying them twice leaves the index unchanged.
+
+Operations return the paths they changed and `(path, error)` pairs of the
+ones that failed, a failure doesn't stop the rest of the batch. If the
+index can't be written, e.g. while a rebuild holds a shard, the changes on
+disk still count and the index catches up with the next refresh of the
+changed directories.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+
+from . import client, content
+from . import database as db
+from . import metrics
+from .config import content_index_enabled
+
+LOGGER = logging.getLogger(__name__)
+
+
+def is_directory(path):
+    "Check if a path is a directory that is descended into."
+    return os.path.isdir(path) and not os.path.islink(path)
+
+
+def changed_roots(paths):
+    "Included directories whose shards hold some of the paths."
+    return sorted({db.shard_root(path) for path in paths} - {None})
+
+
+def update_indexes(change, changes, paths, directories):
+    """
+    Apply `change(changes)` to the index, then bring the daemon and the
+    content index up to date with the changed paths. Below changed
+    directories, stale content is only found by comparing whole shards.
+    Failures are logged, the files have been changed on disk either way.
+    """
+    roots = changed_roots(paths)
+    try:
+        change(changes)
+        if roots:
+            client.reload(roots)
+        if not content_index_enabled():
+            return
+        if directories:
+            content.update_index(roots)
+        else:
+            content.update_files(paths)
+    except sqlite3.Error as err:
+        LOGGER.error(f"could not update the index of {len(paths)} paths: {err}")
+
+
+def delete_files(paths):
+    "Delete files and directory trees from disk and from the index."
+    deleted, failed = [], []
+    directories = False
+    for path in paths:
+        try:
+            if is_directory(path):
+                shutil.rmtree(path)
+                directories = True
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            # already gone, its row is stale
+            pass
+        except OSError as err:
+            LOGGER.warning(f"could not delete '{path}': {err}")
+            failed.append((path, err))
+            continue
+        deleted.append(path)
+    with metrics.timer("fileops.index"):
+        update_indexes(db.delete_records, deleted, deleted, directories)
+    metrics.count("fileops.deleted", len(deleted))
+    return deleted, failed
+
+
+def move_files(paths, target):
+    """
+    Move files and directory trees into a directory, without replacing
+    anything already there. Returns `(source, destination)` pairs.
+    """
+    moved, failed = [], []
+    for path in paths:
+        destination = os.path.join(target, os.path.basename(path))
+        try:
+            if os.path.lexists(destination):
+                raise FileExistsError(f"'{destination}' already exists")
+            shutil.move(path, destination)
+        except OSError as err:
+            LOGGER.warning(f"could not move '{path}': {err}")
+            failed.append((path, err))
+            continue
+        moved.append((path, destination))
+    with metrics.timer("fileops.index"):
+        update_indexes(
+            db.move_records,
+            moved,
+            [path for pair in moved for path in pair],
+            any(is_directory(destination) for _, destination in moved),
+        )
+    metrics.count("fileops.moved", len(moved))
+    return moved, failed
+
+
+def bookmark_files(paths):
+    "Bookmark several files at once."
+    db.add_bookmarks(paths)
+    metrics.count("fileops.bookmarked", len(paths))
+    return list(paths), []
@@ -1,13 +1,20 @@
+import logging
+
+
 def start():
+    logging.basicConfig(level=logging.INFO)
     from . import config as cfg
 
     cfg.validate_config_file()
+    from . import metrics
+
+    metrics.enable(cfg.metrics_enabled(), cfg.profile_mode())
     from . import database as db
 
-    db.validate_database()
-    if cfg.start_updated_enabled():
-        db.build_database()
+    # (re)building happens in the background once the window is shown,
+    # interrupted rebuilds are resumed
+    rebuild = db.validate_database() + db.interrupted_builds()
 
     from .app import main
 
-    main()
+    main(rebuild)
@@ -0,0 +1,247 @@
+"""
+Lightweight instrumentation of the hot paths: counters, gauges and latency
+histograms plus an opt-in profiler around rebuilds.
+
+Everything is disabled by default and then costs a single flag check per
+call. Enable it with `metrics = true` in the configuration file or by
+setting ZITON_METRICS=1, profiling with `profile = "cprofile"` or
+`profile = "sample"` (or ZITON_PROFILE).
+"""
+import bisect
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets in seconds, 0.1ms to ~13s
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(18))
+# seconds between two stack samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+_enabled = os.environ.get("ZITON_METRICS", "") not in ("", "0")
+_profile_mode = os.environ.get("ZITON_PROFILE", "")
+_lock = threading.Lock()
+_counters = collections.Counter()
+_gauges = {}
+_histograms = {}
+
+
+class Histogram:
+    """Latency distribution over fixed exponential buckets."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        "Record a single duration."
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def quantile(self, fraction):
+        "Upper bound of the bucket containing the given quantile."
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        "Histogram as a JSON serializable dict, durations in milliseconds."
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000,
+            "min_ms": self.minimum * 1000,
+            "max_ms": self.maximum * 1000,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p90_ms": self.quantile(0.9) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+        }
+
+
+class _Timer:
+    """Context manager recording its duration into a histogram."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable(enabled=True, profile_mode=None):
+    "Switch instrumentation on or off, environment variables take precedence."
+    global _enabled, _profile_mode
+    _enabled = enabled or os.environ.get("ZITON_METRICS", "") not in ("", "0")
+    if profile_mode is not None and not os.environ.get("ZITON_PROFILE"):
+        _profile_mode = profile_mode
+
+
+def enabled():
+    "Check if metrics are being collected."
+    return _enabled
+
+
+def count(name, amount=1):
+    "Increase a counter."
+    if _enabled:
+        with _lock:
+            _counters[name] += amount
+
+
+def gauge(name, value):
+    "Set a gauge to its current value."
+    if _enabled:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    "Add a duration to a latency histogram."
+    if _enabled:
+        with _lock:
+            histogram = _histograms.get(name)
+            if histogram is None:
+                histogram = _histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+
+def timer(name):
+    "Context manager that records how long its block took."
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def snapshot():
+    "All collected metrics as a JSON serializable dict."
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {k: v.summary() for k, v in sorted(_histograms.items())},
+        }
+
+
+def reset():
+    "Forget everything collected so far."
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def dump(path=None):
+    "Write a snapshot as JSON, by default next to the database."
+    if path is None:
+        from .config import HOME_DIR
+
+        path = os.path.join(HOME_DIR, ".ziton", f"metrics-{os.getpid()}.json")
+    with open(path, "w") as outfile:
+        json.dump(snapshot(), outfile, indent=2)
+    LOGGER.info(f"Metrics written to '{path}'")
+    return path
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of a thread and counts collapsed stacks."""
+
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        "Write the stacks in the collapsed format read by flamegraph tools."
+        with open(path, "w") as outfile:
+            for stack, samples in self.stacks.most_common():
+                outfile.write(f"{stack} {samples}\n")
+
+
+def _profile_path(name, suffix):
+    from .config import HOME_DIR
+
+    directory = os.path.join(HOME_DIR, ".ziton", "profiles")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}{suffix}")
+
+
+@contextlib.contextmanager
+def profiled(name):
+    "Profile the block if profiling was requested, otherwise do nothing."
+    if _profile_mode == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = _profile_path(name, ".prof")
+            profiler.dump_stats(path)
+            LOGGER.info(f"Profile of {name} written to '{path}'")
+    elif _profile_mode == "sample":
+        sampler = _Sampler(threading.get_ident())
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            path = _profile_path(name, ".folded")
+            sampler.write(path)
+            LOGGER.info(f"Stack samples of {name} written to '{path}'")
+    else:
+        yield
+
+
+def profile(name):
+    "Decorator form of `profiled`."
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiled(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,241 @@
+"""
+Throttled background reindexing.
+
+Every `reindex_interval` minutes the scheduler compares the modification
+time of the indexed directories with the one in the index, most recently
+modified directories first since they are the most likely to have changed
+again, and refreshes the directories that changed without re-crawling their
+subtrees.
+
+All filesystem calls of a pass draw from a token bucket of `reindex_rate`
+calls per second, the scheduler and its crawler threads run at the lowest
+CPU and idle IO priority, and a pass is paused while the user is searching
+or the machine runs on battery. Every pass ends with the maintenance of
+the databases, see `storage.maintain`.
+"""
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+from . import config as cfg
+from . import content
+from . import database as db
+from . import metrics, storage
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds a pass stays paused after the last search
+ACTIVITY_PAUSE = 5.0
+# seconds the power supply state is cached
+BATTERY_CHECK_INTERVAL = 10.0
+# seconds between two checks while paused
+PAUSE_INTERVAL = 0.5
+# ioprio_set system call numbers, IO priority is left alone elsewhere
+IOPRIO_SET = {"x86_64": 251, "i686": 289, "aarch64": 30, "armv7l": 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+_last_search = 0.0
+
+
+def notify_search():
+    "Record that the user is searching, which pauses background work."
+    global _last_search
+    _last_search = time.monotonic()
+
+
+def user_active():
+    "Check if the user searched within the last few seconds."
+    return time.monotonic() - _last_search < ACTIVITY_PAUSE
+
+
+def on_battery(path="/sys/class/power_supply"):
+    "Check if the machine runs on battery, False if that can't be told."
+    try:
+        supplies = os.listdir(path)
+    except OSError:
+        return False
+
+    def read(supply, name):
+        try:
+            with open(os.path.join(path, supply, name), "r") as infile:
+                return infile.read().strip()
+        except OSError:
+            return ""
+
+    discharging = False
+    for supply in supplies:
+        kind = read(supply, "type")
+        if kind == "Mains" and read(supply, "online") == "1":
+            return False
+        if kind == "Battery" and read(supply, "status") == "Discharging":
+            discharging = True
+    return discharging
+
+
+def lower_priority():
+    "Run the calling thread at the lowest CPU and idle IO priority if possible."
+    import ctypes
+    import platform
+
+    try:
+        # on linux the nice value is a per-thread attribute
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError) as err:
+        LOGGER.debug(f"could not lower CPU priority: {err}")
+    number = IOPRIO_SET.get(platform.machine())
+    if number is None or platform.system() != "Linux":
+        return
+    libc = ctypes.CDLL(None, use_errno=True)
+    priority = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, priority) != 0:
+        LOGGER.debug(f"could not lower IO priority: errno {ctypes.get_errno()}")
+
+
+class TokenBucket:
+    """Allows `rate` operations per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(rate, 1))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        "Take a token, returns False if none became available within the timeout."
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.stamp) * self.rate
+                )
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = (1 - self.tokens) / self.rate
+            if deadline is not None:
+                if now >= deadline:
+                    return False
+                delay = min(delay, deadline - now)
+            time.sleep(delay)
+
+
+class Scheduler(threading.Thread):
+    """
+    Background thread running the incremental reindex passes. `on_change`
+    is called with the included directory whose shard was changed.
+    """
+
+    def __init__(self, on_change=None):
+        super().__init__(name="reindex scheduler", daemon=True)
+        self.interval = cfg.reindex_interval() * 60
+        self.bucket = TokenBucket(cfg.reindex_rate())
+        self.check_battery = cfg.pause_on_battery()
+        self.index_content = cfg.content_index_enabled()
+        self.on_change = on_change
+        self.stopped = threading.Event()
+        self.battery = (0.0, False)
+        # modification times of the included directories, which have no row
+        self.root_mtimes = {}
+
+    def paused(self):
+        "Check if background work should wait."
+        if user_active():
+            return True
+        if not self.check_battery:
+            return False
+        checked, state = self.battery
+        if time.monotonic() - checked > BATTERY_CHECK_INTERVAL:
+            state = on_battery()
+            self.battery = (time.monotonic(), state)
+        return state
+
+    def __call__(self, timeout):
+        "Throttle of the crawler, see `crawler.Crawler`."
+        if self.stopped.is_set():
+            return True
+        if self.paused():
+            metrics.count("scheduler.paused")
+            time.sleep(min(timeout, PAUSE_INTERVAL))
+            return False
+        return self.bucket.acquire(timeout)
+
+    def wait(self):
+        "Block until the next filesystem call is allowed."
+        while not self(PAUSE_INTERVAL):
+            pass
+
+    def run(self):
+        lower_priority()
+        while not self.stopped.wait(self.interval):
+            try:
+                self.run_pass()
+            except (OSError, sqlite3.Error) as err:
+                LOGGER.error(f"background reindex failed: {err}")
+
+    def stop(self):
+        "End the current pass and stop scheduling new ones."
+        self.stopped.set()
+
+    def run_pass(self):
+        "Refresh the changed directories of all included directories."
+        with metrics.timer("scheduler.pass"):
+            for root in cfg.included_directories():
+                changed = 0
+                for directory in self.changed_directories(root):
+                    if self.stopped.is_set():
+                        return
+                    db.refresh_directory(directory, self, lower_priority)
+                    changed += 1
+                if changed:
+                    LOGGER.info(f"Refreshed {changed} directories below '{root}'")
+                    if self.index_content:
+                        content.update_index([root], initializer=lower_priority)
+                    if self.on_change is not None:
+                        self.on_change(root)
+                self.maintain(root)
+
+    def maintain(self, root):
+        """
+        Maintain the databases of an included directory, which the monitor
+        may have changed as well.
+        """
+        if os.path.exists(db.shard_path(root)):
+            storage.maintain(db.shard_path(root))
+        if self.index_content and os.path.exists(content.content_path(root)):
+            storage.maintain(content.content_path(root))
+
+    def changed_directories(self, root):
+        """
+        Generator over the directories of a shard whose modification time
+        differs from the indexed one, most recently modified first.
+        """
+        root = os.path.abspath(root)
+        if not os.path.exists(db.shard_path(root)):
+            return
+        self.wait()
+        try:
+            modified = int(os.stat(root).st_mtime)
+        except OSError:
+            return
+        if self.root_mtimes.get(root) != modified:
+            self.root_mtimes[root] = modified
+            yield root
+        for path, indexed in db.directory_candidates(root):
+            self.wait()
+            try:
+                # symlinked directories are not descended into
+                info = os.lstat(path)
+            except OSError:
+                # deleted, its parent changed as well
+                continue
+            metrics.count("scheduler.checked")
+            if stat.S_ISDIR(info.st_mode) and int(info.st_mtime) != indexed:
+                yield path
@@ -0,0 +1,283 @@
+"""
+Read-optimized snapshot of a shard that is memory-mapped instead of loaded.
+
+The snapshot is written at the end of a rebuild and holds every entry in
+search key order as flat arrays, so opening it only maps the file and all
+processes share the page cache:
+
+    header          magic, format version, byte order, generation, entry
+                    count and the offset and length of every section
+    names, keys     NUL terminated UTF-8 filenames and search keys with the
+                    start offset of each entry
+    dirs, dir_ids   parent directories and the directory of each entry
+    sizes, mtimes   64 bit integers per entry
+    exts, ext_ids   distinct extensions and the extension of each entry
+    trigrams        sorted byte trigrams of the search keys, each with a
+                    sorted posting list of entry ids
+
+The generation ties a snapshot to the state of its shard, changes made
+since then are read from the shard's changelog and laid over the results.
+"""
+import bisect
+import collections
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"ZITONSNP"
+# bumped whenever the layout changes, snapshots of other versions are ignored
+VERSION = 1
+SECTIONS = (
+    ("names", "B"),
+    ("name_offsets", "Q"),
+    ("keys", "B"),
+    ("key_offsets", "Q"),
+    ("dirs", "B"),
+    ("dir_offsets", "Q"),
+    ("dir_ids", "I"),
+    ("sizes", "q"),
+    ("mtimes", "q"),
+    ("exts", "B"),
+    ("ext_offsets", "Q"),
+    ("ext_ids", "I"),
+    ("trigrams", "I"),
+    ("posting_offsets", "Q"),
+    ("postings", "I"),
+)
+HEADER = struct.Struct(f"<8sIIQQ{2 * len(SECTIONS)}Q")
+BYTE_ORDER = 1 if sys.byteorder == "little" else 2
+# posting lists longer than this fraction of all entries are slower to walk
+# than a plain scan of the keys
+MAX_POSTING_FRACTION = 0.125
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is damaged or of another version."""
+
+
+def encode(text):
+    "UTF-8 bytes of a name, undecodable filenames are kept as they are."
+    return text.encode("utf-8", "surrogateescape")
+
+
+def decode(data):
+    "Inverse of `encode`."
+    return data.decode("utf-8", "surrogateescape")
+
+
+def _blob(strings):
+    "NUL terminated strings and the start offset of each, plus the end."
+    offsets = array("Q", [0])
+    total = 0
+    for data in strings:
+        total += len(data) + 1
+        offsets.append(total)
+    return b"\0".join(strings) + (b"\0" if strings else b""), offsets
+
+
+def trigrams(key):
+    "Distinct byte trigrams of a search key as integers."
+    return {a << 16 | b << 8 | c for a, b, c in zip(key, key[1:], key[2:])}
+
+
+def write(path, generation, rows):
+    """
+    Write the snapshot of a shard. `rows` are `(filename, filepath, size,
+    modified, search_key, extension)` tuples in search key order. The file
+    is replaced atomically, readers keep their old mapping.
+    """
+    columns = list(zip(*rows)) or [()] * 6
+    filenames, filepaths, sizes, mtimes, keys, extensions = columns
+    names = [encode(name) for name in filenames]
+    keys = [encode(key) for key in keys]
+    dirs, exts = {}, {}
+    # the setdefault default is evaluated before the insertion, so ids count up
+    dir_ids = [
+        dirs.setdefault(path.rpartition("/")[0] or "/", len(dirs)) for path in filepaths
+    ]
+    ext_ids = [exts.setdefault(ext, len(exts)) for ext in extensions]
+    postings = collections.defaultdict(list)
+    for entry, key in enumerate(keys):
+        for trigram in trigrams(key):
+            postings[trigram].append(entry)
+
+    sorted_trigrams = sorted(postings)
+    posting_offsets = array("Q", [0])
+    all_postings = array("I")
+    for trigram in sorted_trigrams:
+        all_postings.fromlist(postings[trigram])
+        posting_offsets.append(len(all_postings))
+    names_blob, name_offsets = _blob(names)
+    keys_blob, key_offsets = _blob(keys)
+    dirs_blob, dir_offsets = _blob([encode(d) for d in dirs])
+    exts_blob, ext_offsets = _blob([encode(e) for e in exts])
+    sections = {
+        "names": names_blob,
+        "name_offsets": name_offsets,
+        "keys": keys_blob,
+        "key_offsets": key_offsets,
+        "dirs": dirs_blob,
+        "dir_offsets": dir_offsets,
+        "dir_ids": array("I", dir_ids),
+        "sizes": array("q", sizes),
+        "mtimes": array("q", mtimes),
+        "exts": exts_blob,
+        "ext_offsets": ext_offsets,
+        "ext_ids": array("I", ext_ids),
+        "trigrams": array("I", sorted_trigrams),
+        "posting_offsets": posting_offsets,
+        "postings": all_postings,
+    }
+
+    table = []
+    offset = HEADER.size
+    for name, _ in SECTIONS:
+        # sections are 8 byte aligned for the typed views
+        offset += -offset % 8
+        length = len(memoryview(sections[name]).cast("B"))
+        table.extend((offset, length))
+        offset += length
+    header = HEADER.pack(MAGIC, VERSION, BYTE_ORDER, generation, len(names), *table)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as outfile:
+        outfile.write(header)
+        for (name, _), section_offset in zip(SECTIONS, table[::2]):
+            outfile.write(b"\0" * (section_offset - outfile.tell()))
+            outfile.write(sections[name])
+    os.replace(temporary, path)
+    LOGGER.info(f"Snapshot of {len(names)} entries written to '{path}'")
+
+
+class Snapshot:
+    """A memory-mapped snapshot, see the module documentation for the layout."""
+
+    def __init__(self, path):
+        with open(path, "rb") as infile:
+            self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise SnapshotError(f"'{path}' is truncated")
+        magic, version, byte_order, generation, count, *table = HEADER.unpack_from(
+            self.map
+        )
+        if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDER:
+            raise SnapshotError(f"'{path}' is not a snapshot of version {VERSION}")
+        self.generation = generation
+        self.count = count
+        view = memoryview(self.map)
+        self.bounds = {}
+        for (name, typecode), offset, length in zip(SECTIONS, table[::2], table[1::2]):
+            if offset + length > len(self.map):
+                raise SnapshotError(f"'{path}' is truncated")
+            self.bounds[name] = offset, offset + length
+            setattr(self, name, view[offset : offset + length].cast(typecode))
+        self.ext_names = [
+            decode(self._string("exts", self.ext_offsets, i))
+            for i in range(len(self.ext_offsets) - 1)
+        ]
+        self.dir_cache = {}
+
+    def _string(self, section, offsets, index):
+        start = self.bounds[section][0]
+        return self.map[start + offsets[index] : start + offsets[index + 1] - 1]
+
+    def key(self, entry):
+        "Search key of an entry as bytes."
+        return self._string("keys", self.key_offsets, entry)
+
+    def row(self, entry):
+        "`(filename, filepath, size, modified, search_key)` of an entry."
+        dir_id = self.dir_ids[entry]
+        directory = self.dir_cache.get(dir_id)
+        if directory is None:
+            directory = decode(self._string("dirs", self.dir_offsets, dir_id))
+            self.dir_cache[dir_id] = directory
+        filename = decode(self._string("names", self.name_offsets, entry))
+        return (
+            filename,
+            os.path.join(directory, filename),
+            self.sizes[entry],
+            self.mtimes[entry],
+            decode(self.key(entry)),
+        )
+
+    def posting(self, trigram):
+        "Sorted ids of the entries whose key contains the trigram."
+        index = bisect.bisect_left(self.trigrams, trigram)
+        if index == len(self.trigrams) or self.trigrams[index] != trigram:
+            return self.postings[0:0]
+        return self.postings[
+            self.posting_offsets[index] : self.posting_offsets[index + 1]
+        ]
+
+    def scan(self, term):
+        "Ids of the entries whose key contains the term, by searching the key blob."
+        start, end = self.bounds["keys"]
+        offsets = self.key_offsets
+        position = self.map.find(term, start, end)
+        while position != -1:
+            entry = bisect.bisect_right(offsets, position - start) - 1
+            yield entry
+            position = self.map.find(term, start + offsets[entry + 1], end)
+
+    def candidates(self, terms):
+        "Ids of the entries that might match all terms, in key order."
+        if not terms:
+            return range(self.count)
+        shortest = None
+        for term in terms:
+            for trigram in trigrams(term):
+                posting = self.posting(trigram)
+                if shortest is None or len(posting) < len(shortest):
+                    shortest = posting
+        if shortest is not None and len(shortest) <= self.count * MAX_POSTING_FRACTION:
+            return shortest
+        return self.scan(max(terms, key=len))
+
+    def search(self, terms, extensions=None):
+        """
+        Generator over the rows of the entries whose key contains all terms,
+        restricted to the given extensions unless they are None. Rows are
+        ordered by search key like the database results.
+        """
+        terms = [encode(term) for term in terms]
+        ext_ids = None
+        if extensions is not None:
+            ext_ids = {i for i, ext in enumerate(self.ext_names) if ext in extensions}
+            if not ext_ids:
+                return
+        for entry in self.candidates(terms):
+            if ext_ids is not None and self.ext_ids[entry] not in ext_ids:
+                continue
+            if terms:
+                key = self.key(entry)
+                if not all(term in key for term in terms):
+                    continue
+            yield self.row(entry)
+
+
+# mapped snapshots by path, shared by all searches of this process
+_cache = {}
+
+
+def load(path):
+    "Memory-mapped snapshot at path, None if there is no usable one."
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    identity = (info.st_ino, info.st_mtime_ns, info.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == identity:
+        return cached[1]
+    try:
+        snap = Snapshot(path)
+    except (OSError, ValueError, SnapshotError) as err:
+        LOGGER.warning(f"ignoring snapshot: {err}")
+        snap = None
+    _cache[path] = identity, snap
+    return snap
@@ -0,0 +1,103 @@
+"""
+SQLite settings of the shards for the two ways they are used, and their
+upkeep.
+
+    bulk    a rebuild writes a whole shard at once and only creates its
+            indexes once all rows are written. Nothing is synced to disk
+            until the new table is swapped in, the shard is derived data
+            and a shard damaged by a power loss during a rebuild is
+            simply rebuilt again. A larger cache or in-memory temporary
+            storage made building the indexes slower, not faster.
+    read    searches and the other readers map the shard into memory,
+            which mostly speeds up the row lookups of size-ordered
+            searches, and keep a moderate page cache.
+
+Pragmas like these only last as long as the connection, everything else
+keeps the SQLite defaults. See benchmarks/storage.py for the measurements
+behind the values.
+
+`maintain` refreshes the planner statistics and returns the pages freed by
+deletions to the filesystem. It runs after every rebuild and after the
+passes of the background reindex scheduler. ANALYZE only samples the
+indexes, so it takes milliseconds even on large shards. The `files` table
+is left without statistics: they can't describe how few names a substring
+matches and made the planner pick slower plans for most searches.
+"""
+import logging
+import sqlite3
+
+from . import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+BULK_LOAD = {
+    "synchronous": "OFF",
+}
+READ = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -8 * 1024,
+}
+# rows sampled per index by ANALYZE, enough for the planner and cheap on
+# shards of millions of entries
+ANALYSIS_LIMIT = 1000
+# tables whose plans are better without statistics
+UNANALYZED = ("files",)
+# fraction of free pages above which a database is compacted
+VACUUM_THRESHOLD = 0.1
+
+
+def apply_profile(conn, profile):
+    "Apply the pragmas of a profile to an open connection."
+    for name, value in profile.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def connect(path, profile=None):
+    "Open a database with the settings of a profile, for reading by default."
+    conn = sqlite3.connect(path)
+    apply_profile(conn, READ if profile is None else profile)
+    return conn
+
+
+def flush(conn):
+    "Make everything written through a bulk-load connection durable."
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+def free_fraction(cursor):
+    "Fraction of the pages of a database that are unused."
+    cursor.execute("PRAGMA page_count")
+    pages = cursor.fetchone()[0]
+    cursor.execute("PRAGMA freelist_count")
+    return cursor.fetchone()[0] / pages if pages else 0.0
+
+
+def maintain(path):
+    "Refresh the statistics of a database and compact it if many pages are free."
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        with metrics.timer("maintenance.analyze"):
+            cursor.execute("ANALYZE")
+            cursor.execute(
+                f"DELETE FROM sqlite_stat1 WHERE tbl IN "
+                f"({', '.join('?' * len(UNANALYZED))})",
+                UNANALYZED,
+            )
+        conn.commit()
+        cursor.execute("PRAGMA auto_vacuum")
+        # only databases created since incremental vacuum was enabled
+        if cursor.fetchone()[0] == 2 and free_fraction(cursor) > VACUUM_THRESHOLD:
+            with metrics.timer("maintenance.vacuum"):
+                # frees a page per step, execute() would only take one
+                conn.executescript("PRAGMA incremental_vacuum")
+                # the freed pages are only cut off once the log is written back
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            metrics.count("maintenance.vacuumed")
+    except sqlite3.Error as err:
+        # a busy database is maintained next time
+        LOGGER.warning(f"maintenance of '{path}' failed: {err}")
+    finally:
+        conn.close()
@@ -0,0 +1,129 @@
+"""
+Qt independent access to inotify filesystem events.
+"""
+import logging
+import os
+import pathlib
+import queue
+import subprocess
+import threading
+
+from . import metrics
+from .exclude import IGNORE_FILES
+
+LOGGER = logging.getLogger(__name__)
+
+# event names, without flags like ISDIR in `CREATE,ISDIR`
+CREATED = ("CREATE", "MOVED_TO")
+DELETED = ("DELETE", "MOVED_FROM")
+# files written in place, reported once they are closed
+MODIFIED = ("CLOSE_WRITE",)
+# events buffered between the inotify reader and the consumer
+QUEUE_SIZE = 10000
+
+
+def event_name(command):
+    "Name of an inotify event, e.g. `CREATE` for `CREATE,ISDIR`."
+    return command.split(",")[0]
+
+
+def is_directory_event(command):
+    "Check if an inotify event is about a directory."
+    return "ISDIR" in command.split(",")
+
+
+def inotify_command(directories, exclude=None):
+    """
+    Command line of the inotifywait process watching the given directories.
+    Paths matching the `exclude` regex are neither watched nor reported.
+    """
+    cmd = [
+        "inotifywait",
+        "-r",
+        "-m",
+        "-e",
+        "create",
+        "-e",
+        "delete",
+        "-e",
+        "moved_to",
+        "-e",
+        "moved_from",
+        "-e",
+        "close_write",
+    ]
+    if exclude:
+        cmd += ["--exclude", exclude]
+    return cmd + list(directories)
+
+
+def inotify_process(cmd):
+    "Start inotify process and yield filesystem changes as they come in."
+    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    for stdout_line in iter(popen.stdout.readline, ""):
+        yield stdout_line
+    popen.stdout.close()
+    return_code = popen.wait()
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, cmd)
+
+
+def inotify_events(directories, matcher=None):
+    """
+    Yield (command, path) tuples for every file created, deleted or written
+    below the given directories, skipping what the exclusion matcher rejects.
+    """
+    exclude = matcher.inotify_regex() if matcher is not None else None
+    # matchers extended by the ignore files of the directories seen so far
+    cache = {}
+    for event in inotify_process(inotify_command(directories, exclude)):
+        try:
+            folder, command, filename = event.split()
+        except ValueError as err:
+            LOGGER.error(f"error: {err}")
+            continue
+        path = str(pathlib.Path(folder).joinpath(filename))
+        if filename in IGNORE_FILES:
+            # the rules below its directory changed
+            prefix = os.path.join(os.path.dirname(path), "")
+            for directory in list(cache):
+                if os.path.join(directory, "").startswith(prefix):
+                    del cache[directory]
+        # rules with negations and directory rules can't be passed to
+        # inotifywait, and ignore files aren't known to it either
+        if matcher is not None and matcher.excluded_path(
+            path, directories, is_directory_event(command), cache
+        ):
+            continue
+        yield command, path
+
+
+def queued_events(directories, maxsize=QUEUE_SIZE, matcher=None):
+    """
+    Like `inotify_events`, but events are read on a background thread into a
+    bounded queue that absorbs bursts. While the queue is full the reader
+    waits for the consumer, events are never dropped. Errors of the reader,
+    e.g. a missing inotifywait, are raised once the queued events are
+    consumed.
+    """
+    events = queue.Queue(maxsize)
+    failure = []
+
+    def reader():
+        try:
+            for event in inotify_events(directories, matcher):
+                if events.full():
+                    metrics.count("monitor.backpressure")
+                events.put(event)
+        except Exception as err:  # pylint: disable=broad-except
+            failure.append(err)
+        finally:
+            events.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    for event in iter(events.get, None):
+        metrics.count("monitor.events")
+        metrics.gauge("monitor.queue_depth", events.qsize())
+        yield event
+    if failure:
+        raise failure[0]
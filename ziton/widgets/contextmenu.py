@@ -2,61 +2,114 @@
 Rightclick contextmenu for the tableview.
 """
 import logging
-import os
 import subprocess
 from pathlib import PurePath
 
+from PySide2.QtCore import QThread, Signal
 from PySide2.QtGui import QIcon
-from PySide2.QtSql import QSqlQuery
-from PySide2.QtWidgets import QAction, QMenu
+from PySide2.QtWidgets import QAction, QFileDialog, QMenu, QMessageBox
 
-from .. import FOLDER_ICON_PATH, TRASH_ICON
-from .. import database as db
+from .. import FOLDER_ICON_PATH, TRASH_ICON, fileops
 
-logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
+OPERATIONS = {
+    "delete": fileops.delete_files,
+    "move": fileops.move_files,
+    "bookmark": fileops.bookmark_files,
+}
+
+
+class FileOperationWorker(QThread):
+    """
+    Qt Worker Thread that runs a batch file operation, so the filesystem
+    and the database are never waited for on the GUI thread.
+    """
+
+    done = Signal(str, list, list)
+
+    def __init__(self, operation, filepaths, target=None, parent=None):
+        super().__init__(parent)
+        self.operation = operation
+        self.filepaths = filepaths
+        self.target = target
+
+    def run(self):
+        args = [self.filepaths]
+        if self.target is not None:
+            args.append(self.target)
+        try:
+            changed, failed = OPERATIONS[self.operation](*args)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.error(f"{self.operation} of the selected files failed: {err}")
+            changed, failed = [], [(path, err) for path in self.filepaths]
+        # always answered, the view waits for it
+        self.done.emit(self.operation, changed, failed)
+
 
 class RightClickMenu(QMenu):
-    """Represents the tableview's context menu."""
+    """
+    Represents the tableview's context menu for the selected files.
+    Operations are requested from the view, which runs them in a worker.
+    """
+
+    operationRequested = Signal(str, list, str)
 
-    def __init__(self, filepath, position):
+    def __init__(self, filepaths, position):
         QMenu.__init__(self)
-        self.filepath = filepath
+        self.filepaths = filepaths
         self.position = position
+        count = len(filepaths)
         # open parent folder of file
         self.open_action = QAction(QIcon(FOLDER_ICON_PATH), "Open Folder")
         self.open_action.triggered.connect(self.open_selected_folder)
-        # delete selected file
-        self.delete_action = QAction(QIcon(TRASH_ICON), "Delete File")
-        self.delete_action.triggered.connect(self.delete_file)
-        # add file to bookmark
-        self.bookmark_action = QAction(QIcon(FOLDER_ICON_PATH), "Add Bookmark")
-        self.bookmark_action.triggered.connect(self.bookmark_file)
+        self.open_action.setEnabled(count == 1)
+        # delete selected files
+        self.delete_action = QAction(
+            QIcon(TRASH_ICON), "Delete File" if count == 1 else f"Delete {count} Files"
+        )
+        self.delete_action.triggered.connect(self.delete_files)
+        # move selected files into another directory
+        self.move_action = QAction(QIcon(FOLDER_ICON_PATH), "Move To...")
+        self.move_action.triggered.connect(self.move_files)
+        # add files to bookmarks
+        self.bookmark_action = QAction(
+            QIcon(FOLDER_ICON_PATH), "Add Bookmark" if count == 1 else "Add Bookmarks"
+        )
+        self.bookmark_action.triggered.connect(self.bookmark_files)
         self.addAction(self.open_action)
         self.addAction(self.delete_action)
+        self.addAction(self.move_action)
         self.addAction(self.bookmark_action)
 
     def open_selected_folder(self):
         """Open folder of currently selected file."""
-        parent_dir = PurePath(self.filepath).parent
+        parent_dir = PurePath(self.filepaths[0]).parent
         subprocess.run(["xdg-open", parent_dir], check=False)
 
-    def remove_record(self):
-        "remove record from the table."
-        LOGGER.info("deleting row from table...")
-        query = QSqlQuery()
-        query.prepare("DELETE FROM files WHERE filepath=?")
-        query.bindValue(0, self.filepath)
-        query.exec_()
-
-    def delete_file(self):
-        """Deletes a file from disk."""
-        os.remove(self.filepath)
-        self.remove_record()
-        LOGGER.info(f"deleting {self.filepath}...")
-
-    def bookmark_file(self):
-        """Bookmark selected file."""
-        LOGGER.info(f"Adding new Bookmark ... {self.filepath}")
-        db.add_bookmark(self.filepath)
+    def delete_files(self):
+        """Deletes the files from disk, several only after confirmation."""
+        if len(self.filepaths) > 1:
+            answer = QMessageBox.question(
+                self,
+                "Delete Files",
+                f"Delete {len(self.filepaths):,} files and folders?",
+            )
+            if answer != QMessageBox.Yes:
+                return
+        LOGGER.info(f"deleting {len(self.filepaths)} files...")
+        self.operationRequested.emit("delete", self.filepaths, "")
+
+    def move_files(self):
+        """Moves the files into a directory chosen by the user."""
+        target = QFileDialog.getExistingDirectory(
+            self, "Move To", str(PurePath(self.filepaths[0]).parent)
+        )
+        if target:
+            LOGGER.info(f"moving {len(self.filepaths)} files to {target}...")
+            self.operationRequested.emit("move", self.filepaths, target)
+
+    def bookmark_files(self):
+        """Bookmark selected files."""
+        LOGGER.info(f"Adding {len(self.filepaths)} new Bookmarks...")
+        self.operationRequested.emit("bookmark", self.filepaths, "")
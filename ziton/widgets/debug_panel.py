@@ -0,0 +1,82 @@
+"""
+Debug panel that shows the collected performance metrics.
+"""
+from PySide2.QtCore import QTimer
+from PySide2.QtGui import QFontDatabase
+from PySide2.QtWidgets import (QDialog, QHBoxLayout, QLabel, QPlainTextEdit,
+                               QPushButton, QVBoxLayout)
+
+from .. import client, metrics
+
+# milliseconds between two refreshes of the panel
+REFRESH_INTERVAL = 1000
+
+
+def format_snapshot(snapshot):
+    "Render a metrics snapshot as aligned plain text."
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{name:32} {value:>14,}")
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"{name:32} {value:>14,.1f}")
+    for name, hist in snapshot["histograms"].items():
+        if not hist["count"]:
+            continue
+        lines.append(
+            f"{name:32} {hist['count']:>14,}  p50 {hist['p50_ms']:8.2f}ms"
+            f"  p99 {hist['p99_ms']:8.2f}ms  max {hist['max_ms']:8.2f}ms"
+            f"  total {hist['total_ms']:10.1f}ms"
+        )
+    return "\n".join(lines) or "nothing recorded yet"
+
+
+class DebugPanel(QDialog):
+    """Live view of the metrics of this process and the search daemon."""
+
+    def __init__(self, parent=None):
+        QDialog.__init__(self, parent)
+        self.setWindowTitle("Debug")
+        self.resize(900, 500)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.status = QLabel()
+        self.dump_btn = QPushButton("Dump to JSON")
+        self.reset_btn = QPushButton("Reset")
+        # layout
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+        buttons.addWidget(self.reset_btn)
+        buttons.addWidget(self.dump_btn)
+        layout = QVBoxLayout()
+        layout.addWidget(self.text)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        # signals
+        self.dump_btn.clicked.connect(self.dump)
+        self.reset_btn.clicked.connect(self.reset)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_INTERVAL)
+        self.refresh()
+
+    def refresh(self):
+        "Show the current metrics."
+        text = "== gui ==\n" + format_snapshot(metrics.snapshot())
+        try:
+            daemon = client.request("metrics")["metrics"]
+            text += "\n\n== daemon ==\n" + format_snapshot(daemon)
+        except (ConnectionError, client.DaemonError):
+            pass
+        self.text.setPlainText(text)
+
+    def dump(self):
+        "Write the metrics of this process to a JSON file."
+        path = metrics.dump()
+        self.status.setText(f"written to {path}")
+
+    def reset(self):
+        "Clear the metrics of this process."
+        metrics.reset()
+        self.refresh()
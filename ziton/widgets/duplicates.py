@@ -0,0 +1,184 @@
+"""
+Dialog listing the duplicate files among the indexed ones.
+"""
+import logging
+import os
+import subprocess
+from datetime import datetime
+
+from PySide2.QtCore import (QAbstractTableModel, QCoreApplication, QModelIndex,
+                            Qt, QThread, Signal)
+from PySide2.QtWidgets import (QAbstractItemView, QDialog, QHBoxLayout,
+                               QHeaderView, QLabel, QPushButton, QTableView,
+                               QVBoxLayout)
+
+from .. import duplicates
+from .icon_provider import IconProvider
+
+LOGGER = logging.getLogger(__name__)
+
+STAGE_NAMES = {
+    "edges": "Comparing first and last blocks",
+    "full": "Comparing contents",
+}
+
+
+class DuplicateWorker(QThread):
+    """Qt Worker Thread that runs the duplicate finder."""
+
+    progress = Signal(str)
+    found = Signal(list)
+    failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cancelled = False
+
+    def report(self, stage, done, total):
+        "Forward the progress of a hashing stage."
+        self.progress.emit(f"{STAGE_NAMES[stage]}... {done:,} of {total:,} files")
+
+    def run(self):
+        self.progress.emit("Grouping files by size...")
+        try:
+            groups = duplicates.find_duplicates(
+                progress=self.report, cancelled=lambda: self.cancelled
+            )
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.error(f"searching for duplicates failed: {err}")
+            self.failed.emit(str(err))
+            return
+        self.found.emit(groups)
+
+
+class DuplicateModel(QAbstractTableModel):
+    """Read-only model over groups of duplicates, one row per file."""
+
+    headers = ("Group", "Filename", "Filepath", "Filesize", "Last Modified")
+
+    def __init__(self, groups=()):
+        QAbstractTableModel.__init__(self)
+        self.icon_provider = IconProvider()
+        self.rows = [
+            (number, os.path.basename(path), path, size, modified)
+            for number, group in enumerate(groups, 1)
+            for path, size, modified in group
+        ]
+
+    def rowCount(self, parent=QModelIndex()):
+        "number of listed files."
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        "number of columns."
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        "returns the column titles."
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        "returns data for the given index."
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            value = row[column]
+            if column == 3:
+                return "{:,} KB".format(int(value / 1000))
+            if column == 4:
+                return datetime.fromtimestamp(value).strftime("%Y-%m-%d-%H:%M")
+            return value
+        if role == Qt.DecorationRole and column == 1:
+            return self.icon_provider.icon(row[2])
+        return None
+
+
+class DuplicateDialog(QDialog):
+    """Runs the duplicate finder in the background and lists its results."""
+
+    def __init__(self, parent=None):
+        QDialog.__init__(self, parent)
+        self.setWindowTitle("Duplicates")
+        self.resize(1100, 600)
+        self.view = QTableView()
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.verticalHeader().setVisible(False)
+        self.view.horizontalHeader().setStretchLastSection(True)
+        self.view.setModel(DuplicateModel())
+        self.status = QLabel()
+        self.rerun_btn = QPushButton("Search Again")
+        self.close_btn = QPushButton("Close")
+        # layout
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+        buttons.addWidget(self.rerun_btn)
+        buttons.addWidget(self.close_btn)
+        layout = QVBoxLayout()
+        layout.addWidget(self.view)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        # signals
+        self.view.doubleClicked.connect(self.open_file)
+        self.rerun_btn.clicked.connect(self.search)
+        self.close_btn.clicked.connect(self.close)
+        self.worker = None
+        QCoreApplication.instance().aboutToQuit.connect(self.finish)
+        self.search()
+
+    def search(self):
+        "Start the duplicate finder."
+        if self.worker is not None and self.worker.isRunning():
+            return
+        self.rerun_btn.setEnabled(False)
+        self.worker = DuplicateWorker(self)
+        self.worker.progress.connect(self.status.setText)
+        self.worker.found.connect(self.show_groups)
+        self.worker.failed.connect(self.show_failure)
+        self.worker.start()
+
+    def cancel(self):
+        "Stop a running search once the files being hashed are done."
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancelled = True
+
+    def finish(self):
+        "Stop a running search and wait for it, the thread must not outlive Qt."
+        self.cancel()
+        if self.worker is not None:
+            self.worker.wait()
+
+    def show_groups(self, groups):
+        "List the groups found."
+        self.view.setModel(DuplicateModel(groups))
+        self.view.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        wasted = sum(group[0][1] * (len(group) - 1) for group in groups)
+        self.status.setText(
+            f"{len(groups):,} groups of duplicates, {wasted / 1e6:,.1f} MB wasted"
+        )
+        self.rerun_btn.setEnabled(True)
+
+    def show_failure(self, error):
+        "Report a search that failed."
+        self.status.setText(f"Searching for duplicates failed: {error}")
+        self.rerun_btn.setEnabled(True)
+
+    def open_file(self, index):
+        "open the double clicked file with its default application."
+        path = self.view.model().rows[index.row()][2]
+        subprocess.run(["xdg-open", path], check=False)
+
+    def reject(self):
+        "stop a running search when the dialog is dismissed with escape."
+        self.cancel()
+        QDialog.reject(self)
+
+    def closeEvent(self, event):
+        "stop a running search before closing, without waiting for it."
+        self.cancel()
+        QDialog.closeEvent(self, event)
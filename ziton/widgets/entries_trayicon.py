@@ -5,9 +5,9 @@ Widget that represents the main view's info tray.
 from PySide2.QtCore import Slot
 from PySide2.QtGui import QPixmap
 from PySide2.QtWidgets import (QHBoxLayout, QLabel, QSizePolicy, QSpacerItem,
-                               QWidget)
+                               QToolButton, QWidget)
 
-from .. import DATABASE_ICON
+from .. import DATABASE_ICON, metrics
 from ..database import number_of_rows
 
 
@@ -33,11 +33,18 @@ class TrayEntryInfo(QWidget):
         # currently selected file
         self.selected = QLabel()
         self.selected.setText("")
+        # debug panel toggle, only shown while metrics are collected
+        self.debug_btn = QToolButton()
+        self.debug_btn.setText("Debug")
+        self.debug_btn.setVisible(metrics.enabled())
+        self.debug_btn.clicked.connect(self.show_debug_panel)
+        self.debug_panel = None
         # set layout
         self.layout.addWidget(self.selected)
         self.layout.addItem(self.spacer_item)
         self.layout.addWidget(self.db_icon_label)
         self.layout.addWidget(self.filecount)
+        self.layout.addWidget(self.debug_btn)
         self.setLayout(self.layout)
 
     @Slot(str)
@@ -50,3 +57,13 @@ class TrayEntryInfo(QWidget):
         "Updates filecount label in the main view."
         rows = number_of_rows()
         self.filecount.setText(f"{rows:,} Items")
+
+    @Slot()
+    def show_debug_panel(self):
+        "Open the metrics debug panel."
+        from .debug_panel import DebugPanel
+
+        if self.debug_panel is None:
+            self.debug_panel = DebugPanel(self)
+        self.debug_panel.show()
+        self.debug_panel.raise_()
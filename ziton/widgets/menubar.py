@@ -8,26 +8,40 @@ from PySide2.QtGui import QIcon
 from PySide2.QtWidgets import QMenu, QMenuBar
 
 from .. import TRASH_ICON
+from .. import client, content
 from .. import database as db
+from ..config import content_index_enabled
 from .icon_provider import IconProvider
-from .preferences import PreferenceDialog
 
-logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
 
-# TODO: find a better way to rebuild bookmarks widget on data change.
+def format_duration(seconds):
+    "Short human readable duration, e.g. `3m 20s`."
+    minutes, seconds = divmod(max(int(seconds), 1), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
 
 
 class Worker(QThread):
-    """Qt Worker Thread, responsible for handling one inotify thread."""
+    """Qt Worker Thread that rebuilds the given shards, all by default."""
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, roots=None):
         super().__init__(parent)
+        self.roots = roots
 
     def run(self):
-        db.build_database()
-        self.parent().update_finished()
+        partial = db.build_database(self.roots, self.parent().update_progress)
+        # a running daemon still serves the old copies of the shards
+        client.reload(self.roots)
+        if content_index_enabled():
+            self.parent().dbUpdated.emit("Indexing file contents...")
+            content.update_index(self.roots)
+        self.parent().update_finished(partial)
         LOGGER.info("db update finished!")
 
 
@@ -35,19 +49,26 @@ class Menubar(QMenuBar):
     """Menubar widget."""
 
     dbUpdated = Signal(str)
+    rebuildFinished = Signal()
 
     def __init__(self):
         """Initialises the menu bar."""
-        # data
-        self.bookmarks = db.get_bookmarks()
+        # data, bookmarks are loaded whenever the menu is opened
+        self.bookmarks = ()
         self.icon_provider = IconProvider()
+        # a running rebuild and the roots requested meanwhile, None for all
+        self.rebuilding = False
+        self.queued = []
         # widgets
         QMenuBar.__init__(self)
         self.file_menu = QMenu("File")
         self.edit_menu = QMenu("Edit")
         self.bookmark_menu = QMenu("Bookmarks")
 
-        self.file_menu.addAction("Update Database", self.rebuild_btn_clicked)
+        self.rebuild_action = self.file_menu.addAction(
+            "Update Database", self.rebuild_btn_clicked
+        )
+        self.file_menu.addAction("Find Duplicates", self.duplicates_action_clicked)
         self.file_menu.addAction("Quit", QCoreApplication.quit)
         self.edit_menu.addAction("Preferences", self.preferences_action_clicked)
 
@@ -55,7 +76,15 @@ class Menubar(QMenuBar):
         self.addMenu(self.edit_menu)
         self.addMenu(self.bookmark_menu)
 
-        self.populate_bookmark_menu()
+        self.bookmark_menu.aboutToShow.connect(self.populate_bookmark_menu)
+
+    def populate_bookmark_menu(self):
+        """Populate the bookmark dropdown menu"""
+        self.bookmark_menu.clear()
+        self.bookmarks = db.get_bookmarks()
+        for name, path in self.bookmarks:
+            icn = self.icon_provider.icon(path)
+            self.bookmark_menu.addAction(icn, f"{name}")
         self.bookmark_menu.addSeparator()
         self.bookmark_menu.addAction(
             QIcon(TRASH_ICON),
@@ -63,25 +92,78 @@ class Menubar(QMenuBar):
             self.delete_bookmarks_clicked,
         )
 
-    def populate_bookmark_menu(self):
-        """Populate the bookmark dropdown menu"""
-        for name, path in self.bookmarks:
-            icn = self.icon_provider.icon(path)
-            self.bookmark_menu.addAction(icn, f"{name}")
+    def update_progress(self, entries, expected, eta):
+        """Report the progress of a running rebuild, see `build_database`."""
+        text = f"Updating DB... {entries:,} entries"
+        if entries < expected:
+            text += f" ({entries / expected:.0%})"
+        if eta is not None:
+            text += f", about {format_duration(eta)} left"
+        self.dbUpdated.emit(text)
 
-    def update_finished(self):
+    def update_finished(self, partial=None):
         """Update finished signal."""
-        self.dbUpdated.emit("Database updated")
+        if partial:
+            self.dbUpdated.emit(f"Database updated, incomplete: {', '.join(partial)}")
+        else:
+            self.dbUpdated.emit("Database updated")
+        self.rebuildFinished.emit()
 
     def rebuild_btn_clicked(self):
         """Update the entire database."""
+        self.rebuild_shards(None)
+
+    def rebuild_shards(self, roots):
+        """
+        Rebuild the shards of the given included directories in the
+        background. Requested while a rebuild is running, they are rebuilt
+        once it is done, two rebuilds of the same shard must not overlap.
+        """
+        if self.rebuilding:
+            self.queued.append(roots)
+            return
+        self.rebuilding = True
+        self.rebuild_action.setEnabled(False)
         self.dbUpdated.emit("Updating DB...")
-        self.thread = Worker(self)
+        self.thread = Worker(self, roots)
+        self.thread.finished.connect(self.rebuild_queued)
         self.thread.start()
 
+    def rebuild_queued(self):
+        """Start the rebuilds requested while the last one was running."""
+        self.rebuilding = False
+        self.rebuild_action.setEnabled(True)
+        if not self.queued:
+            return
+        queued, self.queued = self.queued, []
+        if None in queued:
+            self.rebuild_shards(None)
+        else:
+            roots = [root for requested in queued for root in requested]
+            self.rebuild_shards(list(dict.fromkeys(roots)))
+
     def preferences_action_clicked(self):
         """Preference dialog button click event."""
+        from .preferences import PreferenceDialog
+
         self.preferences = PreferenceDialog()
+        added, removed = self.preferences.added, self.preferences.removed
+        # only the shards of added or removed directories and of the
+        # directories around them change
+        for root in removed:
+            db.remove_shard(root)
+        roots = db.changed_shards(added, removed)
+        if roots:
+            self.rebuild_shards(roots)
+        elif removed:
+            self.update_finished()
+
+    def duplicates_action_clicked(self):
+        """Open the duplicate finder."""
+        from .duplicates import DuplicateDialog
+
+        self.duplicates = DuplicateDialog(self)
+        self.duplicates.show()
 
     def delete_bookmarks_clicked(self):
         """Deletes all bookmarks from the DB and clears the menu."""
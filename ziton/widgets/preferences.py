@@ -57,6 +57,9 @@ class PreferenceDialog:
         self.update_startup_box.setChecked(cfg.start_updated_enabled())
         self.live_indexing_box.setChecked(cfg.is_indexing_enabled())
         self.hidden_indexing_box.setChecked(cfg.hidden_files_enabled())
+        # included directories changed by saving
+        self.added = []
+        self.removed = []
 
         self.window.exec_()
 
@@ -98,14 +101,20 @@ class PreferenceDialog:
         excluded_dirs = [
             self.excluded_list.item(i).text() for i in range(self.excluded_list.count())
         ]
-        current_config = {
-            "included_directories": dirs,
-            "index_on_startup": self.update_startup_box.isChecked(),
-            "live_updates": self.live_indexing_box.isChecked(),
-            "hidden_files": self.hidden_indexing_box.isChecked(),
-            "database_path": cfg.database_path(),
-            "excluded": excluded_dirs,
-        }
+        previous = cfg.included_directories()
+        self.added = [d for d in dirs if d not in previous]
+        self.removed = [d for d in previous if d not in dirs]
+        # keep the options that have no widget in the dialog
+        current_config = cfg.load_configuration()
+        current_config.update(
+            {
+                "included_directories": dirs,
+                "index_on_startup": self.update_startup_box.isChecked(),
+                "live_updates": self.live_indexing_box.isChecked(),
+                "hidden_files": self.hidden_indexing_box.isChecked(),
+                "excluded": excluded_dirs,
+            }
+        )
         cfg.save_configuration(current_config)
         # close the dialog
         self.window.accept()
@@ -2,89 +2,365 @@
 Tableview Widget, represents all of our file data.
 """
 import logging
+import os
 import pathlib
+import queue
 import subprocess
+import threading
+from dataclasses import astuple
 from datetime import datetime
+from itertools import groupby, islice
 
-from PySide2.QtCore import QItemSelectionModel, Qt, Signal, Slot
-from PySide2.QtSql import QSqlTableModel
+from PySide2.QtCore import (QAbstractTableModel, QItemSelectionModel,
+                            QModelIndex, Qt, Signal, Slot)
 from PySide2.QtWidgets import QAbstractItemView, QHeaderView, QTableView
 
-from ..database import dbrecord_from_path
-from .contextmenu import RightClickMenu
+from .. import client, content
+from .. import database as db
+from .. import metrics, scheduler
+from ..config import included_directories
 from .icon_provider import IconProvider
 
-logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
 
-class TableModel(QSqlTableModel):
-    """Standard Sql model with custom icons for the filename column."""
+class TableModel(QAbstractTableModel):
+    """
+    Read-only model over the search results with custom icons for the
+    filename column. Rows are pulled on demand from the search daemon if it
+    is running, otherwise straight from the database, on a background thread
+    that delivers them batch by batch. Sorting by filesize streams the rows
+    by their du-style size from the database, directories show the total
+    size of their subtree. Files deleted or moved from the view are changed
+    in place, without running the search again.
+    """
 
-    def __init__(self):
-        QSqlTableModel.__init__(self)
-        # initiate model
-        self.setTable("files")
-        self.select()
-        self.setEditStrategy(QSqlTableModel.OnManualSubmit)
-        self.setHeaderData(0, Qt.Horizontal, "Filename")
-        self.setHeaderData(1, Qt.Horizontal, "Filepath")
-        self.setHeaderData(2, Qt.Horizontal, "Filesize")
-        self.setHeaderData(3, Qt.Horizontal, "Last Modified")
+    headers = ("Filename", "Filepath", "Filesize", "Last Modified")
+    # `(column, order)` pairs the results can be streamed in
+    sort_orders = (
+        (0, Qt.AscendingOrder),
+        (2, Qt.AscendingOrder),
+        (2, Qt.DescendingOrder),
+    )
+    # number of rows pulled from the result generator per fetch
+    fetch_size = 256
+    # seconds a check for a running daemon is reused for new searches
+    daemon_probe_age = 5.0
+    # the requests of the fetching thread, a batch of rows with the subtree
+    # sizes of its directories and if the results are exhausted
+    fetched = Signal(object, list, object, bool)
+
+    def __init__(self, pattern=None, column=0, order=Qt.AscendingOrder):
+        QAbstractTableModel.__init__(self)
         self.icon_provider = IconProvider()
-        self.setEditStrategy(QSqlTableModel.OnFieldChange)
+        self.pattern = pattern
+        self.sorting = (column, order)
+        self.rows = []
+        # subtree sizes of the fetched directories
+        self.directory_sizes = {}
+        # paths changed in place, stale if the result generator yields them
+        self.skipped = set()
+        self.fetched.connect(self.append_rows)
+        if pattern:
+            # background reindexing yields to interactive searches
+            scheduler.notify_search()
+        self.requests = None
+        self.pending = False
+        self.start_fetching()
+
+    def query(self, sorting):
+        "result generator of the pattern in the given sort order."
+        column, order = sorting
+        # content searches keep their ranking
+        if column == 2 and not content.is_content_query(self.pattern):
+            descending = order == Qt.DescendingOrder
+            return db.search_by_size(self.pattern, descending=descending)
+        if client.daemon_running(self.daemon_probe_age):
+            return client.search(self.pattern)
+        return db.search(self.pattern)
+
+    def start_fetching(self):
+        "run the query in a new fetching thread, the pattern None has no rows."
+        self.requests = None
+        self.pending = False
+        if self.pattern is None:
+            return
+        self.requests = queue.Queue()
+        threading.Thread(
+            target=self.fetch_results, args=(self.requests, self.sorting), daemon=True
+        ).start()
+
+    def stop_fetching(self):
+        "stop the fetching thread, the rows fetched so far stay."
+        if self.requests is not None:
+            self.requests.put(False)
+            self.requests = None
+
+    def fetch_results(self, requests, sorting):
+        """
+        Pull a batch of rows from the result generator for every request,
+        on the fetching thread, which the generator's connections belong to.
+        """
+        results = None
+        try:
+            while requests.get():
+                if results is None:
+                    results = self.query(sorting)
+                with metrics.timer("model.fetch"):
+                    batch = list(islice(results, self.fetch_size))
+                # directories are indexed with size 0
+                empty = [row[1] for row in batch if row[2] == 0]
+                sizes = db.directory_sizes(empty) if empty else {}
+                exhausted = len(batch) < self.fetch_size
+                self.fetched.emit(requests, batch, sizes, exhausted)
+                if exhausted:
+                    return
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.error(f"search for '{self.pattern}' failed: {err}")
+            self.fetched.emit(requests, [], {}, True)
+        finally:
+            if results is not None:
+                results.close()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        "order by filesize, other orders fall back to the filenames."
+        if (column, order) not in self.sort_orders:
+            column, order = self.sort_orders[0]
+        if (column, order) == self.sorting:
+            return
+        self.stop_fetching()
+        self.beginResetModel()
+        self.sorting = (column, order)
+        self.rows = []
+        self.directory_sizes = {}
+        self.skipped = set()
+        self.endResetModel()
+        self.start_fetching()
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        "number of rows fetched so far."
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        "number of columns."
+        return 0 if parent.isValid() else len(self.headers)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        "check if the result generator is exhausted."
+        return not parent.isValid() and self.requests is not None
+
+    def fetchMore(self, parent=QModelIndex()):
+        "ask the fetching thread for the next batch of search results."
+        if self.requests is None or self.pending:
+            return
+        self.pending = True
+        self.requests.put(True)
+
+    @Slot(object, list, object, bool)
+    def append_rows(self, requests, batch, sizes, exhausted):
+        "append a batch of search results delivered by the fetching thread."
+        if requests is not self.requests:
+            # of a fetching thread that was stopped meanwhile
+            return
+        self.pending = False
+        if exhausted:
+            self.requests = None
+        if self.skipped:
+            batch = [row for row in batch if row[1] not in self.skipped]
+        self.directory_sizes.update(sizes)
+        if batch:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+            self.rows.extend(batch)
+            self.endInsertRows()
+
+    def remove_rows(self, rows):
+        "remove rows by their numbers, one removal per contiguous run."
+        runs = groupby(enumerate(sorted(rows)), lambda pair: pair[1] - pair[0])
+        # from the end, so the numbers of the runs before stay valid
+        for run in reversed([list(run) for _, run in runs]):
+            first, last = run[0][1], run[-1][1]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for row in self.rows[first : last + 1]:
+                self.skipped.add(row[1])
+                self.directory_sizes.pop(row[1], None)
+            del self.rows[first : last + 1]
+            self.endRemoveRows()
+
+    def remove_paths(self, paths):
+        "remove the rows of deleted paths and of everything below them."
+        prefixes = tuple(os.path.join(path, "") for path in paths)
+        paths = set(paths)
+        self.remove_rows(
+            number
+            for number, row in enumerate(self.rows)
+            if row[1] in paths or row[1].startswith(prefixes)
+        )
+        self.refresh_sizes()
+
+    def move_paths(self, moves):
+        """
+        rename the rows of moved paths and of everything below them, rows
+        moved out of the included directories are removed.
+        """
+        roots = tuple(
+            os.path.join(os.path.abspath(root), "") for root in included_directories()
+        )
+        outside = []
+        for source, destination in moves:
+            prefix = os.path.join(source, "")
+            for number, row in enumerate(self.rows):
+                if row[1] != source and not row[1].startswith(prefix):
+                    continue
+                path = destination + row[1][len(source) :]
+                if not path.startswith(roots):
+                    outside.append(number)
+                    continue
+                self.rows[number] = (row[0], path, *row[2:])
+                self.skipped.update((row[1], path))
+                if row[1] in self.directory_sizes:
+                    self.directory_sizes[path] = self.directory_sizes.pop(row[1])
+        self.remove_rows(outside)
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self.rows) - 1, 1))
+        self.refresh_sizes()
+
+    def insert_rows(self, rows):
+        """
+        insert the files table rows of new paths that match the pattern at
+        their place in the sort order, without running the search again.
+        Rows that belong after the fetched ones are left to the fetching.
+        """
+        if self.pattern is None or content.is_content_query(self.pattern):
+            return
+        matches = db.row_filter(self.pattern)
+        shown = {row[1] for row in self.rows}
+        rows = [row[:4] for row in rows if matches(row) and row[1] not in shown]
+        directories = [row[1] for row in rows if row[2] == 0]
+        if directories:
+            self.directory_sizes.update(db.directory_sizes(directories))
+        for row in sorted(rows, key=self.sort_key):
+            key = self.sort_key(row)
+            low, high = 0, len(self.rows)
+            while low < high:
+                middle = (low + high) // 2
+                if self.sort_key(self.rows[middle]) <= key:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(self.rows) and self.canFetchMore():
+                continue
+            self.beginInsertRows(QModelIndex(), low, low)
+            self.rows.insert(low, row)
+            self.endInsertRows()
+            # the fetching might still yield it
+            self.skipped.add(row[1])
+
+    def sort_key(self, row):
+        "key of a row in the current sort order."
+        column, order = self.sorting
+        if column == 2:
+            size = self.directory_sizes.get(row[1], row[2])
+            return -size if order == Qt.DescendingOrder else size
+        return db.normalize_name(row[0])
+
+    def refresh_sizes(self):
+        "look up the subtree sizes of the shown directories again."
+        if not self.directory_sizes or not self.rows:
+            return
+        self.directory_sizes.update(db.directory_sizes(list(self.directory_sizes)))
+        self.dataChanged.emit(self.index(0, 2), self.index(len(self.rows) - 1, 2))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        "returns the column titles."
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
 
     def data(self, index, role=Qt.DisplayRole):
         "returns data for the given index."
-        if index.column() == 0:
-            if role == Qt.DisplayRole:
-                return QSqlTableModel.data(self, index, role)
-            if role == Qt.DecorationRole:
-                idx = index.sibling(index.row(), 1)
-                path = super(TableModel, self).data(idx)
-                return self.icon_provider.icon(path)
-        # filesize
-        if index.column() == 2:
-            if role == Qt.DisplayRole:
-                value = QSqlTableModel.data(self, index, role)
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            value = row[column]
+            # filesize
+            if column == 2:
+                value = self.directory_sizes.get(row[1], value)
                 return "{:,} KB".format(int(value / 1000))
-        # file modification date
-        if index.column() == 3:
-            if role == Qt.DisplayRole:
-                value = QSqlTableModel.data(self, index, role)
+            # file modification date
+            if column == 3:
                 return datetime.fromtimestamp(value).strftime("%Y-%m-%d-%H:%M")
-        return QSqlTableModel.data(self, index, role)
+            return value
+        if role == Qt.DecorationRole and column == 0:
+            return self.icon_provider.icon(row[1])
+        return None
 
 
 class Tableview(QTableView):
     """Subclass of QTableView to manage keyPressEvents."""
 
     tabPressed = Signal()
+    fileSelected = Signal(str)
+    # summary of a finished file operation
+    operationFinished = Signal(str)
 
     def __init__(self):
         """initialises the Tableview class."""
         QTableView.__init__(self)
-        # model
+        # model, populated once the window is shown
+        self.pattern = ""
         self._model = TableModel()
+        # file operations still running
+        self.workers = []
         # set widget parameters
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.horizontalHeader().setStretchLastSection(True)
         self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.verticalHeader().setVisible(False)
-        self.setSortingEnabled(False)
+        self.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+        self.horizontalHeader().sortIndicatorChanged.connect(self.check_sort_indicator)
+        self.setSortingEnabled(True)
         self.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.setModel(self._model)
-        self.setColumnHidden(4, True)
         self.show()
 
     @Slot(str)
     def update_filter(self, pattern):
-        "updates regex filter when searchtext changes."
-        self.model().setFilter("filename like '%{}%'".format(pattern))
+        "updates the search filter when searchtext changes."
+        self.pattern = pattern
+        self.update_model()
+
+    @Slot(int, Qt.SortOrder)
+    def check_sort_indicator(self, column, order):
+        "keep the sort indicator on the orders the results are sorted in."
+        if (column, order) not in TableModel.sort_orders:
+            self.horizontalHeader().setSortIndicator(*TableModel.sort_orders[0])
 
     def update_model(self):
-        "updates the entire model."
-        self.setModel(TableModel())
+        "updates the entire model, its rows are fetched in the background."
+        header = self.horizontalHeader()
+        self._model.stop_fetching()
+        self._model = TableModel(
+            self.pattern, header.sortIndicatorSection(), header.sortIndicatorOrder()
+        )
+        self._model.fetchMore()
+        self.setModel(self._model)
+
+    def paintEvent(self, event):
+        "paint the visible rows."
+        with metrics.timer("view.paint"):
+            QTableView.paintEvent(self, event)
+
+    def selectionChanged(self, selected, deselected):
+        "forward the name of the newly selected file."
+        QTableView.selectionChanged(self, selected, deselected)
+        indexes = selected.indexes()
+        if indexes:
+            self.fileSelected.emit(self.model().data(indexes[0]))
 
     def selected_file_path(self):
         """Get path of currently selected file."""
@@ -93,6 +369,11 @@ class Tableview(QTableView):
         fpath = self.model().data(fp_idx)
         return fpath
 
+    def selected_file_paths(self):
+        """Get the paths of all selected files, in the order of the table."""
+        rows = sorted(self.selectionModel().selectedRows(1), key=lambda i: i.row())
+        return [self.model().data(idx) for idx in rows]
+
     def open_selected_file(self):
         """open file with default application."""
         fpath = self.selected_file_path()
@@ -122,38 +403,78 @@ class Tableview(QTableView):
     def mouseDoubleClickEvent(self, event):
         "Handle doubleclick events."
         btn = event.button()
-        pos = event.globalPos()
         if btn == Qt.MouseButton.LeftButton:
             self.open_selected_file()
         elif btn == Qt.MouseButton.RightButton:
-            menu = RightClickMenu(self.selected_file_path(), pos)
-            menu.exec_(pos)
-            self.update_model()
+            self.show_context_menu(event)
 
     def mousePressEvent(self, event):
-        "Handle single click events."
+        "Handle single click events, ctrl and shift extend the selection."
         btn = event.button()
-        pos = event.globalPos()
-        rel_pos = event.pos()
         if btn == Qt.MouseButton.LeftButton:
-            idx = self.indexAt(rel_pos)
-            self.selectRow(idx.row())
+            QTableView.mousePressEvent(self, event)
         elif btn == Qt.MouseButton.RightButton:
-            menu = RightClickMenu(self.selected_file_path(), pos)
-            menu.exec_(pos)
-            self.update_model()
+            self.show_context_menu(event)
+
+    def show_context_menu(self, event):
+        "Open the context menu for the selection or the row under the cursor."
+        from .contextmenu import RightClickMenu
+
+        idx = self.indexAt(event.pos())
+        if not idx.isValid():
+            return
+        if not self.selectionModel().isRowSelected(idx.row(), QModelIndex()):
+            self.selectRow(idx.row())
+        pos = event.globalPos()
+        menu = RightClickMenu(self.selected_file_paths(), pos)
+        menu.operationRequested.connect(self.run_operation)
+        menu.exec_(pos)
+
+    @Slot(str, list, str)
+    def run_operation(self, operation, filepaths, target):
+        "run a file operation of the context menu in a worker thread."
+        from .contextmenu import FileOperationWorker
+
+        worker = FileOperationWorker(operation, filepaths, target or None, self)
+        worker.done.connect(self.operation_done)
+        worker.finished.connect(lambda: self.workers.remove(worker))
+        self.workers.append(worker)
+        worker.start()
+
+    @Slot(str, list, list)
+    def operation_done(self, operation, changed, failed):
+        "apply a finished file operation to the rows in place."
+        files = f"{len(changed):,} file" + ("" if len(changed) == 1 else "s")
+        if operation == "delete":
+            self._model.remove_paths(changed)
+            summary = f"Deleted {files}"
+        elif operation == "move":
+            self._model.move_paths(changed)
+            summary = f"Moved {files}"
+        else:
+            summary = f"Bookmarked {files}"
+        if failed:
+            summary += f", {len(failed):,} failed: {failed[0][1]}"
+        self.operationFinished.emit(summary)
 
     @Slot(str)
     def insert_record(self, filepath):
-        """insert new record in active DB."""
-        # check if file exists
-        if pathlib.Path(filepath).exists():
-            new_db_entry = dbrecord_from_path(filepath)
-            LOGGER.info(f"inserting new table row... {filepath}")
-            new_record = self._model.record()
-            new_record.setValue("filename", new_db_entry.filename)
-            new_record.setValue("filepath", new_db_entry.filepath)
-            new_record.setValue("size", new_db_entry.size)
-            new_record.setValue("modified", new_db_entry.modified)
-            self._model.insertRecord(-1, new_record)
-            self.update_model()
+        """insert new record in active DB and its row into the view in place."""
+        path = pathlib.Path(filepath)
+        if not path.exists():
+            return
+        LOGGER.info(f"inserting new table row... {filepath}")
+        if path.is_dir() and not path.is_symlink():
+            change = db.insert_subtree(filepath)
+            entry = db.dbrecord_from_path(filepath)
+            rows = [astuple(entry), *change.keywords["rows"]]
+        else:
+            rows = [astuple(db.insert_record(filepath))]
+        self._model.insert_rows(rows)
+
+    @Slot(str)
+    def remove_record(self, filepath):
+        """remove a deleted path from active DB and its rows from the view."""
+        LOGGER.info(f"removing table rows... {filepath}")
+        db.delete_record(filepath)
+        self._model.remove_paths([filepath])